@@ -0,0 +1,29 @@
+import argparse
+
+from common.graph import bundle_path
+from read_graph import read_graph_csr
+
+# Converts the Pajek file written by Pajekconverter.py into the binary bundles
+# that read_graph memory-maps (one for the directed graph, one for the
+# undirected one). A bundle converted with --threshold has a path of its own
+# and is only read for that threshold.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("file_name", nargs="?", default="data/9606.protein.links.v10.5.paj")
+parser.add_argument("--threshold", type=float, default=None)
+parser.add_argument("--directed-only", action="store_true")
+parser.add_argument("--undirected-only", action="store_true")
+args = parser.parse_args()
+
+orientations = []
+if not args.undirected_only:
+    orientations.append(True)
+if not args.directed_only:
+    orientations.append(False)
+
+for directed in orientations:
+    output_path = bundle_path(args.file_name, directed=directed, threshold=args.threshold)
+    print("Writing {}".format(output_path))
+    G = read_graph_csr(args.file_name, directed=directed, threshold=args.threshold)
+    G.save(output_path)
+    print("\t{} nodes\n\t{} edges".format(G.number_of_nodes(), G.number_of_edges()))
@@ -1,40 +1,105 @@
-from collections import OrderedDict
-import gzip
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from common.graph import EDGE_DTYPE, bundle_path, write_bundle_from_edge_file
+
+# Converts STRING link files into the Pajek file read by read_graph, in a
+# single streaming pass. Memory is bounded by the chunk size plus the table of
+# protein IDs (and, with --undirected, 8 bytes per edge to drop the reverse
+# rows); edges go to a temporary file and are copied after the vertices.
 
 file_name = "data/9606.protein.links.v10.5.txt.gz"
 output_file = "data/9606.protein.links.v10.5.paj"
 
 
-dico_nodeID = OrderedDict()
-node_id = 0
-print("Generating Nodes list")
-with gzip.open(file_name,'rb') as f:
-	f.readline()
-	for line in f:
-		line = line.decode('utf8')
-		start_id,end_id,_ = line.strip().split()
-		if not(dico_nodeID.has_key(start_id)):
-			dico_nodeID[start_id]=node_id
-			node_id+=1
-		if not(dico_nodeID.has_key(end_id)):
-			dico_nodeID[end_id]=node_id
-			node_id+=1
-	f.close()  # with open(...) does it already
-
-fout = open(output_file,'w')
-fout.write("*Vertices {}\n".format(len(dico_nodeID)))
-
-print("Writing nodes")
-for node_name,node_id in dico_nodeID.items():
-	fout.write(str(node_id)+" "+node_name+"\n")
-
-print("Writing edges")
-fout.write("*arcs\n")
-with gzip.open(file_name,'rb') as f:
-	f.readline()
-	for line in f:
-		line=line.decode('utf8')
-		start_id,end_id,weight = line.strip().split()
-		fout.write(" ".join(map(str,[dico_nodeID[start_id],dico_nodeID[end_id],weight]))+"\n")
-	f.close()  # with open(...) does it already
-fout.close()
+def intern_ids(names, dico_nodeID):
+    '''
+    Integer IDs of the given STRING IDs, new ones being numbered in order of
+    first appearance.
+    '''
+    codes, uniques = pd.factorize(names)
+    ids = np.fromiter((dico_nodeID.setdefault(name, len(dico_nodeID)) for name in uniques),
+                      dtype=np.int32, count=len(uniques))
+    return ids[codes]
+
+
+def read_links(file_names, dico_nodeID, undirected=False, chunksize=1000000):
+    '''
+    Yield (start ids, end ids, weights as written in the file) chunk by chunk.
+    With undirected, each link is kept once, as its first row in the files:
+    the B->A row of an A->B link (STRING lists every link in both directions)
+    and repeated rows are dropped, links listed in one direction only and
+    self-loops are kept.
+    '''
+    # sorted keys (smaller id << 32 | larger id) of the undirected links already yielded
+    seen = np.zeros(0, dtype=np.int64)
+    for name in file_names:
+        chunks = pd.read_csv(name, sep=' ', header=0, names=['start', 'end', 'weight'], dtype=str,
+                             compression='infer', chunksize=chunksize)
+        for chunk in chunks:
+            start, end = chunk['start'].values, chunk['end'].values
+            ids = intern_ids(np.column_stack([start, end]).ravel(), dico_nodeID).reshape(-1, 2)
+            weights = chunk['weight'].values
+            if undirected:
+                keys = (ids.min(axis=1).astype(np.int64) << 32) | ids.max(axis=1).astype(np.int64)
+                keys, first = np.unique(keys, return_index=True)
+                found = np.minimum(np.searchsorted(seen, keys), max(len(seen) - 1, 0))
+                new = (seen[found] != keys) if len(seen) else np.ones(len(keys), dtype=bool)
+                seen = np.union1d(seen, keys[new])
+                keep = np.sort(first[new])
+                ids, weights = ids[keep], weights[keep]
+            yield ids[:, 0], ids[:, 1], weights
+
+
+def convert(file_names, output_file, undirected=False, binary=False, chunksize=1000000):
+    dico_nodeID = dict()
+    text_edges = output_file + ".edges.tmp"
+    binary_edges = output_file + ".bin.tmp"
+    n_edges = 0
+    print("Reading links and writing edges")
+    with open(text_edges, 'w') as ftext, open(binary_edges, 'wb') as fbin:
+        for start_ids, end_ids, weights in read_links(file_names, dico_nodeID, undirected, chunksize):
+            chunk = pd.DataFrame({'start': start_ids, 'end': end_ids, 'weight': weights})
+            chunk.to_csv(ftext, sep=' ', header=False, index=False, lineterminator='\n')
+            if binary:
+                records = np.empty(len(chunk), dtype=EDGE_DTYPE)
+                records['src'], records['dst'] = start_ids, end_ids
+                records['weight'] = weights.astype(np.float32)
+                records.tofile(fbin)
+            n_edges += len(chunk)
+
+    print("Writing nodes")
+    with open(output_file, 'w') as fout:
+        fout.write("*Vertices {}\n".format(len(dico_nodeID)))
+        for node_name, node_id in dico_nodeID.items():
+            fout.write(str(node_id) + " " + node_name + "\n")
+        fout.write("*edges\n" if undirected else "*arcs\n")
+        with open(text_edges, 'r') as ftext:
+            shutil.copyfileobj(ftext, fout)
+    os.remove(text_edges)
+
+    if binary:
+        path = bundle_path(output_file, directed=not undirected)
+        print("Writing {}".format(path))
+        write_bundle_from_edge_file(path, binary_edges, list(dico_nodeID), directed=not undirected,
+                                    chunksize=chunksize)
+    os.remove(binary_edges)
+    print("\t{} nodes\n\t{} edges".format(len(dico_nodeID), n_edges))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_names", nargs="*", default=[file_name])
+    parser.add_argument("--output", default=output_file)
+    parser.add_argument("--undirected", action="store_true",
+                        help="collapse A->B/B->A rows into one undirected edge (the first one)")
+    parser.add_argument("--binary", action="store_true",
+                        help="also write the binary bundle read by read_graph")
+    parser.add_argument("--chunksize", type=int, default=1000000)
+    args = parser.parse_args()
+    convert(args.file_names, args.output, undirected=args.undirected, binary=args.binary,
+            chunksize=args.chunksize)
@@ -0,0 +1,378 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CACHE_DIR = 'data/cache/'
+MANIFEST = 'manifest.json'
+# file extension of each storage format: plain .npy files are memory-mapped
+# on load, .npz archives are compressed, pickle is kept for legacy entries and
+# results that are not numeric arrays
+STORAGE_EXTENSIONS = dict(npy='.npy', npz='.npz', pickle='.pkl')
+
+
+def hash_value(value):
+    '''
+    Hashable, JSON-friendly stand-in for a generator parameter.
+    '''
+    if isinstance(value, np.ndarray):
+        return "array:" + hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, dict):
+        return {str(k): hash_value(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [hash_value(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def cache_key(description, fingerprint):
+    '''
+    Key of the result of the generator described by description (see
+    FeatureGenerator.describe) on the graph with the given fingerprint.
+    '''
+    payload = json.dumps(dict(generator=description, graph=fingerprint), sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf8')).hexdigest()
+
+
+class FeatureCache(object):
+    '''
+    Content-addressed store of feature arrays. Each entry is keyed on the graph
+    fingerprint and the generator description, and is listed with its metadata
+    (generator, parameters, graph, format, size, checksum, last access) in a
+    manifest. When max_bytes is set, the least recently used entries are
+    evicted to keep the cache under that size.
+
+    Arrays are written as .npy files and memory-mapped (mmap_mode) when read,
+    or as compressed .npz archives with storage="npz".
+    '''
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=None, storage='npy', mmap_mode='r'):
+        if storage not in STORAGE_EXTENSIONS:
+            raise ValueError("Unknown cache storage {}".format(storage))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self.mmap_mode = mmap_mode
+        self._lock_depth = 0
+
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path(), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def write_manifest(self, manifest):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        tmp = self.manifest_path() + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path())
+
+    @contextlib.contextmanager
+    def locked(self):
+        '''
+        Hold an exclusive lock on the manifest (re-entrant within a process),
+        so that processes filling the cache concurrently do not lose entries.
+        '''
+        if fcntl is None or self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(os.path.join(self.directory, MANIFEST + '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def entry_path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    def get(self, key):
+        '''
+        Cached result for key, or None. A missing or unreadable file is
+        reported and its entry dropped.
+        '''
+        manifest = self.read_manifest()
+        entry = manifest.get(key)
+        if entry is None:
+            return None
+        try:
+            result = self.read_entry(entry)
+        except Exception as e:
+            print("Cache entry {} ({}) is unreadable, dropping it: {!r}".format(key, entry['name'], e))
+            self.remove(key)
+            return None
+        with self.locked():
+            manifest = self.read_manifest()
+            if key in manifest:
+                manifest[key]['last_access'] = time.time()
+                self.write_manifest(manifest)
+        return result
+
+    def read_entry(self, entry):
+        path = self.entry_path(entry)
+        storage = entry.get('format', 'pickle')
+        if storage == 'npy':
+            return np.load(path, mmap_mode=self.mmap_mode)
+        if storage == 'npz':
+            with np.load(path) as archive:
+                return archive['result']
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def write_entry(self, result, file_stem, storage=None):
+        '''
+        Write result to the cache directory as file_stem plus the extension of
+        the storage format, falling back to pickle for anything that is not a
+        numeric array. Returns the file name and the format used.
+        '''
+        storage = self.storage if storage is None else storage
+        if not (isinstance(result, np.ndarray) and result.dtype.kind in 'biuf'):
+            storage = 'pickle'
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        file_name = file_stem + STORAGE_EXTENSIONS[storage]
+        path = os.path.join(self.directory, file_name)
+        with open(path + '.tmp', 'wb') as f:
+            if storage == 'npy':
+                np.save(f, result)
+            elif storage == 'npz':
+                np.savez_compressed(f, result=result)
+            else:
+                pickle.dump(result, f)
+        # replacing (rather than overwriting) keeps arrays mapped from the old file valid
+        os.replace(path + '.tmp', path)
+        return file_name, storage
+
+    def put(self, key, result, name, description, fingerprint, prefix=''):
+        file_name, storage = self.write_entry(result, '{}_featurecache_{}_{}'.format(prefix, name, key[:16]))
+        path = os.path.join(self.directory, file_name)
+        now = time.time()
+        with self.locked():
+            manifest = self.read_manifest()
+            previous = manifest.get(key)
+            if previous is not None and previous['file'] != file_name and os.path.exists(self.entry_path(previous)):
+                os.remove(self.entry_path(previous))
+            manifest[key] = dict(file=file_name, format=storage, name=name, generator=description,
+                                 graph=fingerprint, created=now, last_access=now, size=os.path.getsize(path),
+                                 checksum=_file_checksum(path))
+            self.write_manifest(manifest)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def remove(self, key):
+        with self.locked():
+            manifest = self.read_manifest()
+            entry = manifest.pop(key, None)
+            if entry is not None:
+                if os.path.exists(self.entry_path(entry)):
+                    os.remove(self.entry_path(entry))
+                self.write_manifest(manifest)
+
+    def entries(self):
+        '''
+        Manifest entries, least recently used first.
+        '''
+        return sorted(self.read_manifest().items(), key=lambda item: item[1]['last_access'])
+
+    def evict(self, max_bytes):
+        '''
+        Remove least recently used entries until the cache holds at most max_bytes.
+        '''
+        entries = self.entries()
+        total = sum(entry['size'] for _, entry in entries)
+        for key, entry in entries:
+            if total <= max_bytes:
+                break
+            self.remove(key)
+            total -= entry['size']
+
+    def verify(self):
+        '''
+        Keys of the entries whose file is missing or does not match its checksum.
+        '''
+        return [key for key, entry in self.entries()
+                if not os.path.exists(self.entry_path(entry))
+                or _file_checksum(self.entry_path(entry)) != entry['checksum']]
+
+    def prune(self, max_bytes=None):
+        '''
+        Drop invalid entries and files not listed in the manifest, then evict
+        down to max_bytes if given. Returns the number of files removed.
+        '''
+        removed = 0
+        for key in self.verify():
+            self.remove(key)
+            removed += 1
+        listed = set(entry['file'] for _, entry in self.entries()) | {MANIFEST, MANIFEST + '.lock'}
+        if os.path.isdir(self.directory):
+            for file_name in os.listdir(self.directory):
+                if '_featurecache_' in file_name and file_name not in listed:
+                    os.remove(os.path.join(self.directory, file_name))
+                    removed += 1
+        if max_bytes is not None:
+            before = len(self.entries())
+            self.evict(max_bytes)
+            removed += before - len(self.entries())
+        return removed
+
+    def convert(self, storage):
+        '''
+        Rewrite every entry in the given storage format, e.g. pickle entries to
+        .npy, or everything to compressed .npz for archival. Returns the number
+        of entries rewritten.
+        '''
+        converted = 0
+        for key, entry in self.entries():
+            if entry.get('format', 'pickle') == storage:
+                continue
+            result = self.read_entry(entry)
+            file_name, new_storage = self.write_entry(np.array(result) if isinstance(result, np.memmap) else result,
+                                                      os.path.splitext(entry['file'])[0], storage)
+            if new_storage == entry.get('format', 'pickle'):
+                continue
+            os.remove(self.entry_path(entry))
+            path = os.path.join(self.directory, file_name)
+            with self.locked():
+                manifest = self.read_manifest()
+                manifest[key].update(file=file_name, format=new_storage, size=os.path.getsize(path),
+                                     checksum=_file_checksum(path))
+                self.write_manifest(manifest)
+            converted += 1
+        return converted
+
+    def migrate_legacy(self, Graph, generators, directory='.', remove=False):
+        '''
+        Import the pickles of the former name-keyed cache
+        ('{prefix}_featurecache_{name}.pkl' in directory) computed on Graph by
+        the given generators. A MultiRangeConductance is assembled from the
+        pickles of the NeighbouringConductance of each of its ranges. Pickles
+        whose number of rows does not match the graph are skipped. Returns the
+        names of the imported features.
+        '''
+        from common.feature_generators import MultiRangeConductance, NeighbouringConductance
+        from common.graph import graph_fingerprint
+        fingerprint = graph_fingerprint(Graph)
+        imported = []
+        used = set()
+        for g in generators:
+            if isinstance(g, MultiRangeConductance):
+                parts = [NeighbouringConductance(range=r, prefix=g.prefix) for r in g.ranges]
+            else:
+                parts = [g]
+            paths = [os.path.join(directory, '{}_featurecache_{}.pkl'.format(p.prefix, p.get_name())) for p in parts]
+            if not all(os.path.exists(path) for path in paths):
+                continue
+            columns = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    columns.append(pickle.load(f))
+                if np.shape(columns[-1])[0] != fingerprint['n_nodes']:
+                    print("Skipping {}: {} rows for a graph of {} nodes".format(path, np.shape(columns[-1])[0],
+                                                                                  fingerprint['n_nodes']))
+                    break
+            else:
+                if len(columns) == 1:
+                    result = np.asarray(columns[0])
+                else:
+                    result = np.column_stack([np.reshape(c, (len(c), -1)) for c in columns])
+                self.put(cache_key(g.describe(), fingerprint), result, g.get_name(), g.describe(),
+                         fingerprint, prefix=g.prefix)
+                used.update(paths)
+                imported.append(g.get_name())
+        if remove:
+            for path in used:
+                os.remove(path)
+        return imported
+
+
+def legacy_generators():
+    '''
+    The generators whose results the former cache may hold, with the default
+    parameters it was used with, and the MultiRangeConductance of
+    main_script, built from the same pickles.
+    '''
+    from common import feature_generators as fg
+    return ([fg.Degree(), fg.ExpectedDegree(), fg.PageRank(), fg.HITS(), fg.BetweennessCentrality(),
+             fg.ClosenessCentrality(), fg.ClusteringCoefficient(), fg.ClusteringCoefficient(weighted=True)]
+            + [fg.NeighbouringConductance(range=r) for r in range(1, 5)]
+            + [fg.MultiRangeConductance(ranges=[2, 3, 4])])
+
+
+def _file_checksum(path):
+    checksum = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+default_cache = FeatureCache()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect and maintain the feature cache")
+    parser.add_argument("command", choices=["list", "verify", "prune", "convert", "migrate"])
+    parser.add_argument("--directory", default=CACHE_DIR)
+    parser.add_argument("--max-size", type=float, default=None, help="in MB, for prune")
+    parser.add_argument("--storage", choices=sorted(STORAGE_EXTENSIONS), default="npy", help="for convert")
+    parser.add_argument("--legacy-directory", default=".", help="for migrate: where the old pickles are")
+    parser.add_argument("--graph", default="data/9606.protein.links.v10.5.paj",
+                        help="for migrate: the graph the old pickles were computed on")
+    parser.add_argument("--directed", action="store_true", help="for migrate")
+    parser.add_argument("--threshold", type=float, default=None, help="for migrate")
+    parser.add_argument("--remove", action="store_true", help="for migrate: delete the old pickles")
+    args = parser.parse_args()
+    cache = FeatureCache(args.directory)
+
+    if args.command == "list":
+        entries = cache.entries()
+        for key, entry in entries:
+            graph = entry['graph']
+            # entries of files parsed once (e.g. embeddings) are on no graph
+            source = "no graph" if graph is None else "graph {} nodes/{} edges, threshold {}".format(
+                graph['n_nodes'], graph['n_edges'], graph['threshold'])
+            print("{}  {:>10.1f} kB  {}  {}  {}".format(
+                key[:16], entry['size'] / 1024.0, time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['last_access'])),
+                entry['name'], source))
+        print("{} entries, {:.1f} MB".format(len(entries), sum(e['size'] for _, e in entries) / 2.0 ** 20))
+    elif args.command == "verify":
+        invalid = cache.verify()
+        for key in invalid:
+            print("invalid: {}".format(key))
+        print("{} invalid entries".format(len(invalid)))
+    elif args.command == "prune":
+        max_bytes = None if args.max_size is None else args.max_size * 2 ** 20
+        print("{} files removed".format(cache.prune(max_bytes)))
+    elif args.command == "convert":
+        print("{} entries converted to {}".format(cache.convert(args.storage), args.storage))
+    else:
+        from read_graph import read_graph
+        Graph = read_graph(args.graph, directed=args.directed, threshold=args.threshold)
+        imported = cache.migrate_legacy(Graph, legacy_generators(), args.legacy_directory, remove=args.remove)
+        print("Imported {}".format(", ".join(imported) if imported else "nothing"))
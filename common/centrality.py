@@ -0,0 +1,234 @@
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+import scipy.sparse.linalg
+
+from common.parallel import effective_n_jobs, get_shared, parallel_map, split
+
+
+def pagerank(A, alpha=0.85, personalization=None, nstart=None, dangling=None, max_iter=100, tol=1.0e-6):
+    '''
+    PageRank by power iteration on the sparse adjacency A (row i holds the
+    out-links of i), with the same conventions as networkx.pagerank:
+    personalization, nstart and dangling are arrays indexed by node, dangling
+    nodes redistribute their score along dangling (personalization by default)
+    and convergence is reached when the l1 change is below n * tol.
+    nstart is typically the score vector of a previous run (warm start).
+    Returns the scores and the number of iterations.
+    '''
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0), 0
+    A = sp.csr_matrix(A, dtype=np.float64)
+    out_weight = np.asarray(A.sum(axis=1)).ravel()
+    is_dangling = out_weight == 0
+    inverse = np.zeros(n)
+    inverse[~is_dangling] = 1.0 / out_weight[~is_dangling]
+    # transition matrix, transposed so that each iteration is one csr product
+    P = (sp.diags(inverse) @ A).T.tocsr()
+
+    x = _distribution(nstart, n)
+    p = _distribution(personalization, n)
+    dangling_weights = p if dangling is None else _distribution(dangling, n)
+
+    for n_iter in range(1, max_iter + 1):
+        xlast = x
+        x = alpha * (P @ xlast + xlast[is_dangling].sum() * dangling_weights) + (1 - alpha) * p
+        if np.absolute(x - xlast).sum() < n * tol:
+            return x, n_iter
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def hits(A, nstart=None, method="svd", max_iter=100, tol=1.0e-8):
+    '''
+    HITS hubs and authorities of the sparse adjacency A, normalized to sum to 1.
+    method is "svd" (leading singular vectors, as networkx.hits) or "power"
+    (power iteration on A^T A, converged when the l1 change of the max-scaled
+    authorities is below tol). nstart is a starting authority vector, e.g. the
+    authorities of a previous run (uniform by default, so that the scores are
+    reproducible).
+    Returns hubs, authorities and the number of iterations (None for "svd").
+    '''
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0), np.zeros(0), 0
+    A = sp.csr_matrix(A, dtype=np.float64)
+    AT = A.T.tocsr()
+    n_iter = None
+    if method == "svd":
+        # ARPACK starts from a random vector otherwise, which changes the last digits from one run to the next
+        v0 = np.ones(n) if nstart is None else np.asarray(nstart, dtype=np.float64)
+        try:
+            _, _, vt = scipy.sparse.linalg.svds(A, k=1, v0=v0, maxiter=max_iter, tol=tol)
+        except scipy.sparse.linalg.ArpackNoConvergence:
+            raise nx.PowerIterationFailedConvergence(max_iter)
+        a = vt.ravel().real
+    elif method == "power":
+        a = _distribution(nstart, n)
+        for n_iter in range(1, max_iter + 1):
+            alast = a
+            a = AT @ (A @ alast)
+            a /= a.max()
+            if np.absolute(a - alast / alast.max()).sum() < tol:
+                break
+        else:
+            raise nx.PowerIterationFailedConvergence(max_iter)
+    else:
+        raise ValueError("Unknown HITS method {}".format(method))
+    h = A @ a
+    return h / h.sum(), a / a.sum(), n_iter
+
+
+def betweenness_centrality(G, k=None, seed=None, n_jobs=1):
+    '''
+    Normalized shortest-path betweenness of the CSRGraph G (unweighted, as
+    networkx.betweenness_centrality), accumulated with Brandes' algorithm from
+    every node and divided by (n - 1)(n - 2). With k pivots drawn with seed,
+    the sum over the pivots is scaled to the n - 1 sources that can count
+    for a node: by (n - 1) / k, or (n - 1) / (k - 1) for the pivots, whose
+    own source counts for nothing (nan with a single pivot). networkx 3.5
+    and later scale pivots the same way; earlier versions use n / k for
+    every node.
+    Sources are split across n_jobs processes and the partial sums reduced.
+    '''
+    n = G.number_of_nodes()
+    sources = _pivots(n, k, seed)
+    partial = parallel_map(_betweenness_from_sources, split(sources, 4 * effective_n_jobs(n_jobs)), n_jobs=n_jobs,
+                           shared=dict(indptr=G.indptr, indices=G.indices), desc="Betweenness")
+    betweenness = np.sum(partial, axis=0) if partial else np.zeros(n)
+    if n <= 2:
+        return betweenness
+    if k is None:
+        return betweenness / ((n - 1) * (n - 2))
+    scale = np.full(n, 1.0 / (len(sources) * (n - 2)))
+    scale[sources] = 1.0 / ((len(sources) - 1) * (n - 2)) if len(sources) > 1 else np.nan
+    return betweenness * scale
+
+
+def closeness_centrality(G, k=None, seed=None, n_jobs=1):
+    '''
+    Closeness centrality of the CSRGraph G (unweighted, incoming distances and
+    Wasserman-Faust scaling, as networkx.closeness_centrality), from a BFS
+    from every node. With k pivots drawn with seed, the distance sum and the
+    number of nodes reaching each node are estimated from the pivots alone
+    (Eppstein-Wang). BFS sources are split across n_jobs processes.
+    Returns the closeness and the largest distance seen.
+    '''
+    n = G.number_of_nodes()
+    sources = _pivots(n, k, seed)
+    partial = parallel_map(_distances_from_sources, split(sources, 4 * effective_n_jobs(n_jobs)), n_jobs=n_jobs,
+                           shared=dict(indptr=G.indptr, indices=G.indices), desc="Closeness")
+    totsp = np.sum([p[0] for p in partial], axis=0)
+    reach = np.sum([p[1] for p in partial], axis=0)
+    diameter = max([p[2] for p in partial] + [0])
+    closeness = np.zeros(n)
+    if n <= 1:
+        return closeness, diameter
+    reached = totsp > 0
+    if k is None:
+        closeness[reached] = (reach[reached] - 1.0) ** 2 / (totsp[reached] * (n - 1))
+    else:
+        # reach counts the pivots reaching each node, the node itself included
+        is_pivot = np.zeros(n, dtype=bool)
+        is_pivot[sources] = True
+        others = len(sources) - is_pivot
+        reach = reach - is_pivot
+        closeness[reached] = reach[reached] ** 2.0 / (totsp[reached] * others[reached])
+    return closeness, diameter
+
+
+def sampling_error_bound(n, k, delta=0.05, value_range=1.0):
+    '''
+    Hoeffding bound on the absolute error of a mean over k random pivots of
+    per-pivot terms lying in an interval of width value_range, holding for all
+    n nodes at once with probability 1 - delta.
+    For betweenness the terms lie in [0, 1]; for closeness the bound applies to
+    the average distance and value_range is the diameter.
+    '''
+    return value_range * np.sqrt(np.log(2.0 * n / delta) / (2.0 * k))
+
+
+def expand(indptr, indices, frontier):
+    '''
+    All (u, v) edges leaving the nodes of frontier, as two aligned arrays.
+    '''
+    starts = indptr[frontier].astype(np.int64)
+    counts = indptr[frontier + 1] - starts
+    ends = np.cumsum(counts)
+    offsets = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - ends + counts, counts)
+    return np.repeat(frontier, counts), indices[offsets]
+
+
+def _pivots(n, k, seed):
+    if k is None or k >= n:
+        return np.arange(n)
+    return np.sort(np.random.RandomState(seed).choice(n, k, replace=False))
+
+
+def _betweenness_from_sources(sources):
+    shared = get_shared()
+    indptr, indices = shared['indptr'], shared['indices']
+    n = len(indptr) - 1
+    betweenness = np.zeros(n)
+    dist = np.empty(n, dtype=np.int64)
+    sigma = np.empty(n)
+    delta = np.empty(n)
+    for s in sources:
+        dist.fill(-1)
+        sigma.fill(0.0)
+        delta.fill(0.0)
+        dist[s] = 0
+        sigma[s] = 1.0
+        frontier = np.array([s])
+        levels = []
+        d = 0
+        # level-synchronous BFS counting shortest paths
+        while len(frontier):
+            u, v = expand(indptr, indices, frontier)
+            dist[v[dist[v] < 0]] = d + 1
+            on_path = dist[v] == d + 1
+            u, v = u[on_path], v[on_path]
+            np.add.at(sigma, v, sigma[u])
+            levels.append((u, v))
+            frontier = np.unique(v)
+            d += 1
+        # dependency accumulation, deepest level first
+        for u, v in reversed(levels):
+            np.add.at(delta, u, sigma[u] / sigma[v] * (1.0 + delta[v]))
+        delta[s] = 0.0
+        betweenness += delta
+    return betweenness
+
+
+def _distances_from_sources(sources):
+    shared = get_shared()
+    indptr, indices = shared['indptr'], shared['indices']
+    n = len(indptr) - 1
+    totsp = np.zeros(n)
+    reach = np.zeros(n)
+    diameter = 0
+    dist = np.empty(n, dtype=np.int64)
+    for s in sources:
+        dist.fill(-1)
+        dist[s] = 0
+        frontier = np.array([s])
+        d = 0
+        while len(frontier):
+            _, v = expand(indptr, indices, frontier)
+            frontier = np.unique(v[dist[v] < 0])
+            d += 1
+            dist[frontier] = d
+        reached = dist >= 0
+        totsp[reached] += dist[reached]
+        reach[reached] += 1
+        diameter = max(diameter, d - 1)
+    return totsp, reach, diameter
+
+
+def _distribution(x, n):
+    if x is None:
+        return np.ones(n) / n
+    x = np.asarray(x, dtype=np.float64).ravel()
+    if x.shape != (n,):
+        raise ValueError("Expected a vector of {} values, got {}".format(n, x.shape))
+    return x / x.sum()
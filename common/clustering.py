@@ -0,0 +1,155 @@
+import numpy as np
+import scipy.sparse as sp
+
+from common.centrality import expand
+from common.parallel import effective_n_jobs, get_shared, parallel_map, split
+
+
+def clustering(G, weighted=False, n_jobs=1, chunk_size=256, nodes=None):
+    '''
+    Clustering coefficient of every node of the CSRGraph G (or of nodes only),
+    with the same definitions as networkx.clustering: unweighted or with the
+    geometric mean of the max-normalized weights, and the directed variant of
+    Fagiolo for directed graphs. Self-loops are ignored.
+
+    Triangles are counted from the sparse products diag(M^3) with M the
+    symmetric (A + A^T for directed graphs) adjacency, chunk_size rows at a
+    time; the rows are spread over n_jobs processes.
+    '''
+    n = G.number_of_nodes()
+    if nodes is None:
+        nodes = np.arange(n)
+    M, degree, bidirectional = triangle_matrix(G, weighted)
+    blocks = split(nodes, 4 * effective_n_jobs(n_jobs))
+    triangles = np.concatenate([np.zeros(0)] + parallel_map(_closed_walks, blocks, n_jobs=n_jobs,
+                                                            shared=dict(M=M, chunk_size=chunk_size),
+                                                            desc="Clustering Coefficient"))
+    return normalize_triangles(triangles, degree[nodes],
+                               None if bidirectional is None else bidirectional[nodes])
+
+
+def clustering_sweep(G, thresholds, weighted=False, chunk_size=256):
+    '''
+    Clustering coefficients of the undirected CSRGraph G filtered at each of
+    thresholds (see CSRGraph.filter), by threshold. The triangles are
+    updated with the edges added from one threshold to the next, highest
+    first: with A the symmetric matrix before and D the added edges,
+    diag((A + D)^3) - diag(A^3) is the row sum of
+    (A @ A) * D + ((A + D) @ D + D @ A) * (A + D), only nonzero on the rows of
+    the added edges and of their neighbours, chunk_size rows at a time.
+    Batches that reach most of the graph are counted again instead.
+    '''
+    n = G.number_of_nodes()
+    scale = G.weights.max() if weighted and len(G.weights) else None
+    A = sp.csr_matrix((n, n))
+    triangles = np.zeros(n)
+    degree = np.zeros(n)
+    results = dict()
+    for threshold, rows, cols, weights in G.edge_batches(thresholds):
+        loop = rows == cols
+        rows, cols, weights = rows[~loop], cols[~loop], weights[~loop]
+        values = np.cbrt(weights / scale) if scale is not None else np.ones(len(rows))
+        D = sp.csr_matrix((values.astype(np.float64), (rows, cols)), shape=(n, n))
+        A_new = (A + D).tocsr()
+        degree += np.bincount(rows, minlength=n)
+        touched = np.unique(rows)
+        affected = np.union1d(touched, A_new[touched].indices)
+        active = np.flatnonzero(degree)
+        if 3 * len(affected) > len(active):
+            # the update costs about three products per affected row: when
+            # most rows are affected, counting again is cheaper
+            triangles[:] = 0
+            for i in range(0, len(active), chunk_size):
+                R = active[i:i + chunk_size]
+                triangles[R] = closed_walks(A_new, R)
+        else:
+            for i in range(0, len(affected), chunk_size):
+                R = affected[i:i + chunk_size]
+                triangles[R] += np.asarray((A_new[R] @ D + D[R] @ A).multiply(A_new[R]).sum(axis=1)).ravel()
+            for i in range(0, len(touched), chunk_size):
+                R = touched[i:i + chunk_size]
+                triangles[R] += np.asarray((A[R] @ A).multiply(D[R]).sum(axis=1)).ravel()
+        A = A_new
+        results[threshold] = normalize_triangles(triangles, degree)
+    return results
+
+
+def update_clustering(G, H, diff, result, weighted=False, n_jobs=1, chunk_size=256):
+    '''
+    clustering of the CSRGraph H, the graph G with the EdgeDiff diff applied,
+    from result, that of G: a changed edge (u, v) only changes the triangles
+    and degrees of u, v and their common neighbours, so only the endpoints
+    and their neighbours in G and H are computed again. With weighted, a
+    change of the largest weight, which normalizes all of them, means
+    computing every node again.
+    '''
+    if not diff.changes_edges() and not weighted:
+        return result
+    if weighted and _max_weight(G) != _max_weight(H):
+        return clustering(H, weighted=True, n_jobs=n_jobs, chunk_size=chunk_size)
+    endpoints = diff.nodes()
+    nodes = [endpoints]
+    for graph in (G, H):
+        nodes.append(expand(graph.indptr, graph.indices, endpoints)[1])
+        if graph.is_directed():
+            nodes.append(expand(graph.in_indptr, graph.in_indices, endpoints)[1])
+    nodes = np.unique(np.concatenate(nodes))
+    result = np.array(result, dtype=np.float64).reshape(-1)
+    result[nodes] = clustering(H, weighted=weighted, n_jobs=n_jobs, chunk_size=chunk_size, nodes=nodes)
+    return result
+
+
+def _max_weight(G):
+    return G.weights.max() if len(G.weights) else None
+
+
+def triangle_matrix(G, weighted=False):
+    '''
+    Symmetric matrix M whose cube has the (weighted) closed walks of length 3
+    on its diagonal, with the degrees (and for directed graphs the numbers of
+    reciprocated edges) used to normalize them.
+    '''
+    A = sp.csr_matrix(G.adjacency(), dtype=np.float64)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A.sort_indices()
+    binary = A.copy()
+    binary.data[:] = 1.0
+    if weighted and len(G.weights):
+        A.data = np.cbrt(A.data / G.weights.max())
+    else:
+        A = binary
+    if not G.is_directed():
+        return A, np.diff(binary.indptr).astype(np.float64), None
+    degree = (np.diff(binary.indptr) + np.diff(binary.T.tocsr().indptr)).astype(np.float64)
+    bidirectional = np.asarray(binary.multiply(binary.T).sum(axis=1)).ravel()
+    return (A + A.T).tocsr(), degree, bidirectional
+
+
+def closed_walks(M, rows):
+    '''
+    diag(M^3) restricted to rows, for the symmetric matrix M.
+    '''
+    return np.asarray((M[rows] @ M).multiply(M[rows]).sum(axis=1)).ravel()
+
+
+def normalize_triangles(triangles, degree, bidirectional=None):
+    '''
+    Clustering coefficients from diag(M^3) and the degrees (and numbers of
+    reciprocated edges, for directed graphs).
+    '''
+    if bidirectional is None:
+        denominator = degree * (degree - 1.0)
+    else:
+        denominator = 2.0 * (degree * (degree - 1.0) - 2.0 * bidirectional)
+    result = np.zeros(len(triangles))
+    nonzero = triangles != 0
+    result[nonzero] = triangles[nonzero] / denominator[nonzero]
+    return result
+
+
+def _closed_walks(rows):
+    shared = get_shared()
+    M, chunk_size = shared['M'], shared['chunk_size']
+    return np.concatenate([np.zeros(0)] + [closed_walks(M, rows[i:i + chunk_size])
+                                           for i in range(0, len(rows), chunk_size)])
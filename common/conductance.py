@@ -0,0 +1,178 @@
+import numpy as np
+
+from common.centrality import expand
+from common.parallel import effective_n_jobs, get_shared, parallel_map, split
+
+
+def neighbouring_conductance(G, ranges, n_jobs=1, nodes=None):
+    '''
+    Conductance (unweighted, as networkx.algorithms.cuts.conductance) of the
+    ball around every node of the CSRGraph G, for each range in ranges: range r
+    is the ball of the nodes within r - 1 hops (following out-edges).
+    Nodes without any edge get nan.
+    Returns an array of shape (len(nodes), len(ranges)).
+    '''
+    cut, volume = ball_statistics(G, ranges, n_jobs=n_jobs, nodes=nodes)
+    return conductance(cut, volume, total_volume(G))
+
+
+def ball_statistics(G, ranges, n_jobs=1, nodes=None):
+    '''
+    Cut size and volume of the ball around every node of the CSRGraph G (see
+    neighbouring_conductance), for each range in ranges.
+
+    All ranges come out of a single BFS per node, in which the volume and the
+    cut size of the ball are updated level by level. Each level is processed
+    from whichever side is cheaper: the new frontier's edges, or once the ball
+    covers most of the graph, the edges of the nodes still outside it.
+    Nodes are spread over n_jobs processes.
+    Returns two arrays of shape (len(nodes), len(ranges)), the cuts and the
+    volumes.
+    '''
+    n = G.number_of_nodes()
+    if nodes is None:
+        nodes = np.arange(n)
+    volume_degree, total_degree = _degrees(G)
+    pred = (G.in_indptr, G.in_indices) if G.is_directed() else (G.indptr, G.indices)
+    shared = dict(succ=(G.indptr, G.indices), pred=pred, directed=G.is_directed(), ranges=list(ranges),
+                  volume_degree=volume_degree, total_degree=total_degree)
+    blocks = split(nodes, 4 * effective_n_jobs(n_jobs))
+    parts = [(np.zeros((0, len(ranges))), np.zeros((0, len(ranges))))]
+    parts += parallel_map(_statistics_from_nodes, blocks, n_jobs=n_jobs, shared=shared, desc="Nconductance")
+    return np.concatenate([cut for cut, _ in parts]), np.concatenate([volume for _, volume in parts])
+
+
+def conductance(cut, volume, total_volume):
+    '''
+    Conductance of balls of the given cut sizes and volumes in a graph of the
+    given total volume, nan for empty balls or balls covering the graph.
+    '''
+    denominator = np.minimum(volume, total_volume - volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, cut / denominator, np.nan)
+
+
+def total_volume(G):
+    return _degrees(G)[0].sum()
+
+
+def _degrees(G):
+    '''
+    Degrees counted in the volume of a ball, and degrees counting all the
+    edges of a node (out-edges and in-edges of a directed graph).
+    '''
+    n = G.number_of_nodes()
+    out_degree = G.out_degree().astype(np.int64)
+    if G.is_directed():
+        return out_degree, out_degree + G.in_degree()
+    # as in networkx, a self-loop adds 2 to the degree of an undirected graph
+    rows = np.repeat(np.arange(n), out_degree)
+    volume_degree = out_degree + np.bincount(rows[rows == G.indices], minlength=n)
+    return volume_degree, volume_degree
+
+
+def reaching_nodes(G, nodes, hops):
+    '''
+    Nodes of the CSRGraph G from which one of nodes is reached within hops
+    hops (following out-edges): the nodes whose balls of hops hops contain
+    one of nodes.
+    '''
+    if G.is_directed():
+        indptr, indices = G.in_indptr, G.in_indices
+    else:
+        indptr, indices = G.indptr, G.indices
+    reached = np.zeros(G.number_of_nodes(), dtype=bool)
+    frontier = np.unique(np.asarray(nodes, dtype=np.int64))
+    reached[frontier] = True
+    for _ in range(hops):
+        _, v = expand(indptr, indices, frontier)
+        frontier = np.unique(v[~reached[v]])
+        reached[frontier] = True
+    return np.flatnonzero(reached)
+
+
+def update_conductance(G, H, diff, result, ranges, n_jobs=1, statistics=None):
+    '''
+    neighbouring_conductance of the CSRGraph H, the graph G with the EdgeDiff
+    diff applied, from result, that of G, and statistics, the cuts and volumes
+    of the balls of G (see ball_statistics). The cut and volume of a ball only
+    change when it holds an endpoint of a changed edge in G or H, so only
+    those balls are computed again; the conductance of the others is that of
+    their cut and volume in the total volume of H. Without statistics, all
+    the balls are computed again.
+    Reweighted edges change nothing, the conductance being unweighted.
+    Returns the result and the statistics of H.
+    '''
+    if not diff.changes_edges():
+        return result, statistics
+    if statistics is None:
+        cut, volume = ball_statistics(H, ranges, n_jobs=n_jobs)
+    else:
+        hops = max(ranges) - 1
+        nodes = np.union1d(reaching_nodes(G, diff.nodes(), hops), reaching_nodes(H, diff.nodes(), hops))
+        cut, volume = [np.array(a, dtype=np.float64).reshape(H.number_of_nodes(), len(ranges)) for a in statistics]
+        cut[nodes], volume[nodes] = ball_statistics(H, ranges, n_jobs=n_jobs, nodes=nodes)
+    return conductance(cut, volume, total_volume(H)), (cut, volume)
+
+
+def _statistics_from_nodes(nodes):
+    shared = get_shared()
+    succ, pred, directed = shared['succ'], shared['pred'], shared['directed']
+    ranges, volume_degree, total_degree = shared['ranges'], shared['volume_degree'], shared['total_degree']
+    n = len(volume_degree)
+    all_volume = volume_degree.sum()
+    total_cost = total_degree.sum()
+    columns = dict()
+    for i, r in enumerate(ranges):
+        columns.setdefault(r - 1, []).append(i)
+    stamp = np.full(n, -1, dtype=np.int64)
+    level = np.zeros(n, dtype=np.int64)
+    cuts = np.zeros((len(nodes), len(ranges)))
+    volumes = np.zeros((len(nodes), len(ranges)))
+
+    for row, x in enumerate(nodes):
+        if total_degree[x] == 0:
+            continue
+        stamp[x] = x
+        level[x] = 0
+        frontier = np.array([x])
+        volume = cut = ball_cost = 0
+        for l in range(max(ranges)):
+            frontier_cost = total_degree[frontier].sum()
+            ball_cost += frontier_cost
+            if frontier_cost <= total_cost - ball_cost:
+                # top-down: update the cut with the edges of the new level
+                u, v = expand(succ[0], succ[1], frontier)
+                inside = stamp[v] == x
+                s_before = np.count_nonzero(inside & (level[v] < l))
+                s_level = np.count_nonzero(inside & (level[v] == l))
+                volume += volume_degree[frontier].sum()
+                if directed:
+                    _, pv = expand(pred[0], pred[1], frontier)
+                    p_inside = stamp[pv] == x
+                    p_before = np.count_nonzero(p_inside & (level[pv] < l))
+                    p_level = np.count_nonzero(p_inside & (level[pv] == l))
+                    cut += (len(v) - s_before - s_level - p_before) + (len(pv) - p_before - p_level - s_before)
+                else:
+                    cut += len(v) - 2 * s_before - s_level
+                frontier = np.unique(v[~inside])
+            else:
+                # bottom-up: recount the cut from the nodes outside the ball
+                outside = np.flatnonzero(stamp != x)
+                volume = all_volume - volume_degree[outside].sum()
+                u, v = expand(succ[0], succ[1], outside)
+                inside = stamp[v] == x
+                if directed:
+                    pu, pv = expand(pred[0], pred[1], outside)
+                    p_inside = stamp[pv] == x
+                    cut = np.count_nonzero(inside) + np.count_nonzero(p_inside)
+                    frontier = np.unique(pu[p_inside])
+                else:
+                    cut = np.count_nonzero(inside)
+                    frontier = np.unique(u[inside])
+            for i in columns.get(l, []):
+                cuts[row, i] = cut
+                volumes[row, i] = volume
+            stamp[frontier] = x
+            level[frontier] = l + 1
+    return cuts, volumes
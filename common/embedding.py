@@ -0,0 +1,321 @@
+import os
+import warnings
+import zlib
+
+import numpy as np
+import scipy.sparse as sp
+
+from common.cache import cache_key, default_cache
+from common.parallel import get_shared, parallel_map
+
+try:
+    import gensim
+except ImportError:
+    gensim = None
+
+
+def alias_tables(indptr, weights):
+    '''
+    Alias tables of the rows of a CSR matrix, each row being the distribution
+    of its entries in proportion to weights: draw an entry k of the row
+    uniformly, keep it with probability prob[k], otherwise take alias[k]
+    (both indexed by global entry position).
+    All the rows are built together with the sweeping construction, one step
+    per row at a time: the light entries (below the mean) are filled in order
+    from the current heavy entry, which becomes a light one itself once it
+    has given away its excess and is then filled from the next heavy entry.
+    '''
+    n = len(indptr) - 1
+    degree = np.diff(indptr).astype(np.int64)
+    rows = np.repeat(np.arange(n), degree)
+    weights = np.asarray(weights, dtype=np.float64)
+    totals = np.bincount(rows, weights=weights, minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = np.where(totals[rows] > 0, weights * degree[rows] / totals[rows], 1.0)
+    prob = np.ones(len(scaled))
+    alias = np.arange(len(scaled))
+    heavy = scaled > 1.0
+    order = np.lexsort((heavy, rows))
+    light_ptr = indptr[:-1].astype(np.int64)
+    light_end = light_ptr + np.bincount(rows[~heavy], minlength=n)
+    heavy_ptr = light_end.copy()
+    heavy_end = indptr[1:].astype(np.int64)
+    active = np.flatnonzero(heavy_ptr < heavy_end)
+    excess = scaled[order[heavy_ptr[active]]]
+    while len(active):
+        j = order[heavy_ptr[active]]
+        give = (excess > 1.0) & (light_ptr[active] < light_end[active])
+        # the current heavy entry fills the next light entry
+        r = active[give]
+        i = order[light_ptr[r]]
+        prob[i] = scaled[i]
+        alias[i] = j[give]
+        excess[give] -= 1.0 - scaled[i]
+        light_ptr[r] += 1
+        # or is light itself now, and is filled from the next heavy entry
+        take = ~give
+        r = active[take]
+        heavy_ptr[r] += 1
+        last = heavy_ptr[r] >= heavy_end[r]
+        prob[j[take]] = np.where(last, 1.0, np.minimum(excess[take], 1.0))
+        following = order[np.minimum(heavy_ptr[r], heavy_end[r] - 1)]
+        alias[j[take]] = np.where(last, j[take], following)
+        excess[take] = scaled[following] - (1.0 - excess[take])
+        keep = np.ones(len(active), dtype=bool)
+        keep[np.flatnonzero(take)[last]] = False
+        active, excess = active[keep], excess[keep]
+    return prob, alias
+
+
+def node2vec_walks(G, walk_length=80, num_walks=10, p=1.0, q=1.0, weighted=False, seed=0, n_jobs=1):
+    '''
+    num_walks rounds of biased second-order random walks (node2vec) of
+    walk_length nodes from every node of the CSRGraph G, following out-edges.
+    Each step draws a neighbour from the alias table of the current node
+    (in proportion to the weights with weighted) and accepts it with
+    probability alpha / max(alpha) (rejection sampling, so that no table per
+    edge is needed), with alpha 1 / p for going back to the previous node, 1
+    for a neighbour of the previous node and 1 / q otherwise.
+    The walkers of a round advance together; the rounds are spread over n_jobs
+    processes, round r drawing from the seed (seed, r) so that the walks do
+    not depend on n_jobs.
+    Returns an int32 array (num_walks * nodes, walk_length) of node indices,
+    padded with -1 after the walks that reach a node without out-edges.
+    '''
+    n = G.number_of_nodes()
+    indptr = np.asarray(G.indptr, dtype=np.int64)
+    indices = np.asarray(G.indices, dtype=np.int64)
+    weights = G.weights if weighted else np.ones(len(indices))
+    prob, alias = alias_tables(indptr, weights)
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    # sorted (source, target) keys, to tell whether a candidate is a neighbour of the previous node
+    edge_keys = np.unique(rows * n + indices)
+    shared = dict(indptr=indptr, indices=indices, prob=prob, alias=alias, edge_keys=edge_keys,
+                  walk_length=walk_length, p=p, q=q, seed=seed)
+    return np.concatenate(parallel_map(_walk_round, list(range(num_walks)), n_jobs=n_jobs, shared=shared,
+                                       desc="node2vec walks"))
+
+
+def _walk_round(index):
+    shared = get_shared()
+    indptr, indices, prob, alias = shared['indptr'], shared['indices'], shared['prob'], shared['alias']
+    edge_keys, walk_length, p, q = shared['edge_keys'], shared['walk_length'], shared['p'], shared['q']
+    n = len(indptr) - 1
+    rng = np.random.RandomState([shared['seed'], index])
+    walks = np.full((n, walk_length), -1, dtype=np.int32)
+    walks[:, 0] = rng.permutation(n)
+    current = walks[:, 0].astype(np.int64)
+    previous = None
+    alive = np.arange(n)
+    bias = np.array([1.0 / p, 1.0, 1.0 / q])
+    bias /= bias.max()
+    for step in range(1, walk_length):
+        keep = indptr[current + 1] > indptr[current]
+        alive, current = alive[keep], current[keep]
+        previous = None if previous is None else previous[keep]
+        chosen = np.empty(len(alive), dtype=np.int64)
+        pending = np.arange(len(alive))
+        while len(pending):
+            v = current[pending]
+            k = indptr[v] + (rng.random_sample(len(pending)) * (indptr[v + 1] - indptr[v])).astype(np.int64)
+            k = np.where(rng.random_sample(len(pending)) < prob[k], k, alias[k])
+            x = indices[k]
+            if previous is None:
+                accepted = np.ones(len(pending), dtype=bool)
+            else:
+                t = previous[pending]
+                key = t * n + x
+                found = np.minimum(np.searchsorted(edge_keys, key), len(edge_keys) - 1)
+                kind = np.where(x == t, 0, np.where(edge_keys[found] == key, 1, 2))
+                accepted = rng.random_sample(len(pending)) < bias[kind]
+            chosen[pending[accepted]] = x[accepted]
+            pending = pending[~accepted]
+        walks[alive, step] = chosen
+        previous, current = current, chosen
+    return walks
+
+
+def skipgram_pairs(walks, window, rng):
+    '''
+    (center, context) pairs of a block of walks, both ways within a window
+    drawn for each center between 1 and window (the reduced windows of
+    word2vec), leaving out the -1 padding.
+    '''
+    reduced = rng.randint(1, window + 1, size=walks.shape)
+    centers, contexts = [], []
+    for offset in range(1, window + 1):
+        left, right = walks[:, :-offset], walks[:, offset:]
+        valid = (left >= 0) & (right >= 0)
+        forward = valid & (reduced[:, :-offset] >= offset)
+        backward = valid & (reduced[:, offset:] >= offset)
+        centers.extend([left[forward], right[backward]])
+        contexts.extend([right[forward], left[backward]])
+    return np.concatenate(centers), np.concatenate(contexts)
+
+
+def skipgram(walks, n, dimensions=32, window=10, negative=5, epochs=1, alpha=0.025, min_alpha=0.0001,
+             batch_size=4096, block_size=2048, seed=0):
+    '''
+    Skip-gram with negative sampling of the walks (as word2vec: contexts
+    within reduced windows, negatives drawn from the unigram distribution to
+    the power 0.75, learning rate decreasing linearly from alpha to
+    min_alpha) trained with numpy, batch_size pairs per gradient step, over
+    the pairs of block_size walks at a time. Nodes that are not in any pair
+    get zero vectors.
+    Returns the (n, dimensions) input vectors.
+    '''
+    # the updates of a batch to the same row add up: on small graphs, a batch
+    # much larger than n makes each row take dozens of steps at once and diverge
+    batch_size = min(batch_size, max(n, 1))
+    rng = np.random.RandomState(seed)
+    walks = np.asarray(walks)
+    counts = np.bincount(walks[walks >= 0], minlength=n).astype(np.float64)
+    noise_prob, noise_alias = alias_tables(np.array([0, n]), counts ** 0.75)
+    vectors = ((rng.random_sample((n, dimensions)) - 0.5) / dimensions).astype(np.float32)
+    output = np.zeros((n, dimensions), dtype=np.float32)
+    labels = np.zeros((1, 1 + negative), dtype=np.float32)
+    labels[0, 0] = 1.0
+    seen = np.zeros(n, dtype=bool)
+    total = float(epochs * len(walks))
+    done = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(walks))
+        for start in range(0, len(walks), block_size):
+            block = walks[order[start:start + block_size]]
+            centers, contexts = skipgram_pairs(block, window, rng)
+            seen[centers] = True
+            shuffle = rng.permutation(len(centers))
+            centers, contexts = centers[shuffle], contexts[shuffle]
+            lr = np.float32(max(min_alpha, alpha - (alpha - min_alpha) * done / total))
+            for i in range(0, len(centers), batch_size):
+                c = centers[i:i + batch_size]
+                k = rng.randint(0, n, size=(len(c), negative))
+                k = np.where(rng.random_sample(k.shape) < noise_prob[k], k, noise_alias[k])
+                targets = np.concatenate([contexts[i:i + batch_size, None], k], axis=1)
+                v = vectors[c]
+                u = output[targets]
+                scores = np.einsum('bd,bkd->bk', v, u)
+                gradient = lr * (labels - 1.0 / (1.0 + np.exp(-np.clip(scores, -6, 6))))
+                _scatter_add(vectors, c, np.einsum('bk,bkd->bd', gradient, u))
+                _scatter_add(output, targets.ravel(), (gradient[:, :, None] * v[:, None, :]).reshape(-1, dimensions))
+            done += len(block)
+    vectors[~seen] = 0
+    return vectors
+
+
+def _scatter_add(target, index, values):
+    # target[index] += values with repeated indices added up, as the product
+    # of the (rows, len(index)) one-hot matrix (much faster than np.add.at)
+    one_hot = sp.csc_matrix((np.ones(len(index), dtype=values.dtype), index, np.arange(len(index) + 1)),
+                            shape=(target.shape[0], len(index)))
+    target += one_hot @ values
+
+
+def gensim_skipgram(walks, n, dimensions=32, window=10, negative=5, epochs=1, alpha=0.025, min_alpha=0.0001,
+                    seed=0):
+    '''
+    Same as skipgram, trained with gensim's Word2Vec (single worker, so that
+    seed fixes the result).
+    '''
+    tokens = [str(i) for i in range(n)]
+    sentences = [[tokens[x] for x in walk[walk >= 0]] for walk in walks]
+    model = gensim.models.Word2Vec(sentences, vector_size=dimensions, window=window, negative=negative, sg=1,
+                                   min_count=0, sample=0, epochs=epochs, alpha=alpha, min_alpha=min_alpha,
+                                   seed=seed, workers=1, hashfxn=_stable_hash)
+    vectors = np.zeros((n, dimensions), dtype=np.float32)
+    paired = walks[np.count_nonzero(walks >= 0, axis=1) > 1]
+    seen = np.bincount(paired[paired >= 0], minlength=n) > 0
+    for i in np.flatnonzero(seen):
+        vectors[i] = model.wv[tokens[i]]
+    return vectors
+
+
+def _stable_hash(value):
+    # gensim seeds its vectors with hashfxn(word + str(seed)): Python's str
+    # hash changes from one process to the next
+    return zlib.crc32(value.encode('utf-8'))
+
+
+def embedding_shape(path):
+    '''
+    Number of vectors and dimensions of an embedding file, without reading
+    its data: the header line of a text file in the word2vec format of
+    node2vec (.emb), or the shape of a .npy array.
+    '''
+    if path.endswith('.npy'):
+        shape = np.load(path, mmap_mode='r').shape
+    else:
+        with open(path, 'r') as f:
+            header = f.readline().split()
+        try:
+            shape = tuple(int(x) for x in header)
+        except ValueError:
+            shape = tuple(header)
+    if len(shape) != 2 or not all(isinstance(x, int) and x >= 0 for x in shape):
+        raise ValueError("{} is not a (nodes, dimensions) embedding: shape {}".format(path, shape))
+    return shape
+
+
+def read_embedding(path, nodes=None, chunksize=None):
+    '''
+    (nodes, dimensions) matrix of an embedding file. A .npy array indexed by
+    node is memory-mapped. A text file (header "vectors dimensions", then one
+    line "node value ..." per vector) is parsed by numpy's C parser in one
+    call, or chunksize lines at a time, into a matrix of nodes rows (by
+    default the number of vectors of the header): the nodes it leaves out
+    (node2vec skips the isolated ones) get zeros.
+    Raises ValueError for node ids that are not integers, not below nodes or
+    repeated, for more vectors than the header states, and for lines without
+    one value per dimension.
+    '''
+    vectors, dimensions = embedding_shape(path)
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    n = vectors if nodes is None else nodes
+    if n < vectors:
+        raise ValueError("{}: {} vectors for {} nodes".format(path, vectors, n))
+    result = np.zeros((n, dimensions))
+    seen = np.zeros(n, dtype=bool)
+    count = 0
+    with open(path, 'r') as f, warnings.catch_warnings():
+        # loadtxt warns when a chunk starts at the end of the file
+        warnings.simplefilter('ignore', UserWarning)
+        f.readline()
+        while True:
+            values = np.loadtxt(f, dtype=np.float64, ndmin=2, max_rows=chunksize)
+            if len(values):
+                if values.shape[1] != dimensions + 1:
+                    raise ValueError("{}: lines of {} values, expected {}".format(path, values.shape[1] - 1,
+                                                                                  dimensions))
+                count += len(values)
+                if count > vectors:
+                    raise ValueError("{}: more than the {} vectors of the header".format(path, vectors))
+                ids = values[:, 0].astype(np.int64)
+                if (ids != values[:, 0]).any() or ids.min() < 0 or ids.max() >= n:
+                    raise ValueError("{}: node ids are not in 0..{}".format(path, n - 1))
+                if seen[ids].any() or len(np.unique(ids)) != len(ids):
+                    raise ValueError("{}: repeated node ids".format(path))
+                seen[ids] = True
+                result[ids] = values[:, 1:]
+            if chunksize is None or len(values) < chunksize:
+                break
+    return result
+
+
+def load_embedding(path, nodes=None, cache=None, chunksize=None):
+    '''
+    read_embedding of path, kept in cache (default_cache by default) under
+    the size and modification time of the file and the number of nodes:
+    text files are parsed once, later loads memory-map the parsed matrix.
+    '''
+    if path.endswith('.npy'):
+        return read_embedding(path)
+    cache = default_cache if cache is None else cache
+    stat = os.stat(path)
+    description = dict(embedding=os.path.abspath(path), size=stat.st_size, mtime=stat.st_mtime, nodes=nodes)
+    key = cache_key(description, None)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = read_embedding(path, nodes=nodes, chunksize=chunksize)
+        cache.put(key, matrix, "embedding-" + os.path.basename(path), description, None)
+    return matrix
@@ -1,18 +1,29 @@
+import inspect
 import numpy as np
-import networkx as nx
-import pickle
-from tqdm import tqdm
+import scipy.sparse as sp
 import os
 
+from common.cache import cache_key, default_cache, hash_value
+from common.centrality import betweenness_centrality, closeness_centrality, hits, pagerank, sampling_error_bound
+from common.clustering import clustering, clustering_sweep, update_clustering
+from common.conductance import ball_statistics, conductance, total_volume, update_conductance
+from common import embedding
+from common.graph import as_csr, graph_fingerprint
+
 EXTERNAL_FEATURE_PATH = "data/external_features/"
 
 class FeatureGenerator(object):
-    def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
-        self.cache_filename = None
+    # constructor arguments that do not change the result, left out of the cache key
+    execution_params = ('n_jobs', 'chunk_size', 'chunksize', 'nstart')
+    # whether the result depends on the edge weights, and not only on the edges
+    uses_weights = True
+
+    def __init__(self, default_recomputing=False, default_dump=True, prefix='', cache=None):
         self.default_recomputing = default_recomputing
         self.prefix = prefix
         self.default_dump = default_dump
         self.nfeat=None
+        self.cache = default_cache if cache is None else cache
 
     def get_name(self):
         pass
@@ -23,24 +34,99 @@ class FeatureGenerator(object):
         else:
             return [self.get_name() +"#" +str(i) for i in range(self.nfeat)]
 
+    def get_params(self):
+        '''
+        Parameters of the generator: the arguments of its constructor, read
+        back from the attributes of the same name
+        '''
+        base = inspect.signature(FeatureGenerator.__init__).parameters
+        return {name: hash_value(getattr(self, name)) for name in inspect.signature(self.__init__).parameters
+                if name not in base and name not in self.execution_params and hasattr(self, name)}
+
+    def describe(self):
+        return dict(generator=type(self).__name__, name=self.get_name(), prefix=self.prefix,
+                    params=self.get_params())
+
+    def dependencies(self):
+        '''
+        Generators whose results this one is computed from. Generators with
+        dependencies also define transform, which computes their result from
+        the results of their dependencies.
+        '''
+        return []
+
+    def get_cache_key(self, Graph):
+        return cache_key(self.describe(), graph_fingerprint(Graph))
+
     def compute(self):
         pass
 
-    def init_filename(self):
-        if not os.path.exists('data/cache/'):
-            os.mkdir('data/cache/')
-        self.cache_filename = 'data/cache/{}_featurecache_{}.pkl'.format(self.prefix, self.get_name())
-
-    def load_from_cache(self):
-        if self.cache_filename is None:
-            self.init_filename()
-        result = pickle.load(open(self.cache_filename, 'rb'))
+    def sweep(self, Graph, thresholds):
+        '''
+        Results on Graph filtered at each of thresholds (see CSRGraph.filter).
+        Generators that can update their result from one threshold to the
+        next override this; by default each filtered graph is computed. The
+        results are not cached here (see Pipeline.sweep_all).
+        '''
+        G = as_csr(Graph)
+        return [self.compute(G.filter(threshold)) for threshold in thresholds]
+
+    def describe_sweep(self):
+        '''
+        Description the results of sweep are cached under: that of compute,
+        unless sweep (or that of a dependency) gives results that are not
+        exactly those of compute.
+        '''
+        if any(d.describe_sweep() != d.describe() for d in self.dependencies()):
+            return dict(self.describe(), part="sweep")
+        return self.describe()
+
+    def changed_by(self, diff):
+        '''
+        Whether the EdgeDiff diff can change the result.
+        '''
+        if self.dependencies():
+            return any(d.changed_by(diff) for d in self.dependencies())
+        return diff.changes_edges() or (self.uses_weights and len(diff) > 0)
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        Result on new_graph, the graph Graph with the EdgeDiff diff applied,
+        from result, the result on Graph. Generators that can update only the
+        affected nodes, or warm-start from result, override this; by default
+        the result is computed again.
+        '''
+        return self.compute(new_graph)
+
+    def apply_update(self, Graph, diff, new_graph=None, result=None, dump=None):
+        '''
+        Result on Graph with the EdgeDiff diff applied (new_graph, if already
+        built with CSRGraph.apply_diff), updated from result or from the
+        cached result on Graph. Results that diff cannot change are carried
+        over to the cache key of the new graph as they are; without a result
+        to start from, the new graph goes through apply.
+        '''
+        if dump is None:
+            dump = self.default_dump
+        G = as_csr(Graph)
+        if new_graph is None:
+            new_graph = G.apply_diff(diff)
+        if result is None and not self.default_recomputing:
+            result = self.load_from_cache(G)
+        if result is None:
+            return self.apply(new_graph, dump=dump)
+        if self.changed_by(diff):
+            result = self.update(G, new_graph, diff, result)
+        if dump:
+            self.dump_to_cache(new_graph, result)
         return result
 
-    def dump_to_cache(self, result):
-        if self.cache_filename is None:
-            self.init_filename()
-        pickle.dump(result, open(self.cache_filename, 'wb'))
+    def load_from_cache(self, Graph):
+        return self.cache.get(self.get_cache_key(Graph))
+
+    def dump_to_cache(self, Graph, result):
+        self.cache.put(self.get_cache_key(Graph), result, self.get_name(), self.describe(),
+                       graph_fingerprint(Graph), prefix=self.prefix)
 
     def apply(self, Graph, recompute=None, dump=None):
         if recompute is None:
@@ -48,21 +134,20 @@ class FeatureGenerator(object):
         if dump is None:
             dump = self.default_dump
         if not recompute:
-            try:
-                return self.load_from_cache()
-            except:
-                return self.apply(Graph, recompute=True)
-        else:
-            result = self.compute(Graph)
-            if dump:
-                self.dump_to_cache(result)
-            return result
+            result = self.load_from_cache(Graph)
+            if result is not None:
+                return result
+        result = self.compute(Graph)
+        if dump:
+            self.dump_to_cache(Graph, result)
+        return result
 
 
 class Degree(FeatureGenerator):
     '''
     Degree of every node (in/out if directed)
     '''
+    uses_weights = False
 
     def __init__(self, directed=False, default_recomputing=True, default_dump=False, prefix=''):
         super(Degree, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump, prefix=prefix)
@@ -73,15 +158,56 @@ class Degree(FeatureGenerator):
         return "degree_{}directed".format("" if self.directed else "un")
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
-        if not self.directed:
-            for i in range(n):
-                result[i] = Graph.degree(i)
+        if not self.directed and G.is_directed():
+            result[:, 0] = G.out_degree() + G.in_degree()
+        elif not self.directed:
+            # as in networkx, a self-loop adds 2 to the degree of an undirected graph
+            rows = np.repeat(np.arange(n), G.out_degree())
+            result[:, 0] = G.out_degree() + np.bincount(rows[rows == G.indices], minlength=n)
         else:
-            for i in range(n):
-                result[i, 0] = Graph.out_degree(i)
-                result[i, 1] = Graph.in_degree(i)
+            result[:, 0] = G.out_degree()
+            result[:, 1] = G.in_degree()
+        return result
+
+    def sweep(self, Graph, thresholds):
+        '''
+        Degrees at every threshold, from the counts of the edges added from
+        one threshold to the next.
+        '''
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
+        result = np.zeros((n, self.nfeat))
+        results = dict()
+        for threshold, rows, cols, _ in G.edge_batches(thresholds):
+            if not self.directed and G.is_directed():
+                result[:, 0] += np.bincount(rows, minlength=n) + np.bincount(cols, minlength=n)
+            elif not self.directed:
+                result[:, 0] += np.bincount(rows, minlength=n) + np.bincount(rows[rows == cols], minlength=n)
+            else:
+                result[:, 0] += np.bincount(rows, minlength=n)
+                result[:, 1] += np.bincount(cols, minlength=n)
+            results[threshold] = result.copy()
+        return [results[threshold] for threshold in thresholds]
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        Degrees of new_graph, from the degrees of result changed by the added
+        and removed edges.
+        '''
+        if self.directed and not new_graph.is_directed():
+            return self.compute(new_graph)
+        n = new_graph.number_of_nodes()
+        result = np.array(result, dtype=np.float64).reshape(n, self.nfeat)
+        for sign, (src, dst) in [(1, diff.added[:2]), (-1, diff.removed)]:
+            if self.directed:
+                result[:, 0] += sign * np.bincount(src, minlength=n)
+                result[:, 1] += sign * np.bincount(dst, minlength=n)
+            else:
+                # a self-loop adds 2 to the degree, as in compute
+                result[:, 0] += sign * (np.bincount(src, minlength=n) + np.bincount(dst, minlength=n))
         return result
 
 
@@ -101,114 +227,249 @@ class ExpectedDegree(FeatureGenerator):
         return "expecteddegree_{}directed".format("" if self.directed else "un")
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
-        if not self.directed:
-            for i in range(n):
-                for j in Graph.neighbors(i):
-                    result[i] += Graph[i][j]['weight'] / 1000.0
-        else:
-            for i in range(n):
-                for j in Graph.successors(i):
-                    result[i, 0] += Graph[i][j]['weight'] / 1000.0
-                for j in Graph.predecessors(i):
-                    result[i, 1] += Graph[j][i]['weight'] / 1000.0
+        # csr products add up each row sequentially in neighbour order, which
+        # reproduces the float64 sums of the per-edge loop exactly
+        ones = np.ones(n)
+        result[:, 0] = _probability_adjacency(G) @ ones
+        if self.directed:
+            result[:, 1] = _probability_adjacency(G, incoming=True) @ ones
         return result
 
+    def sweep(self, Graph, thresholds):
+        '''
+        Expected degrees at every threshold, without building the filtered
+        graphs: the probabilities of the edges not above the threshold are
+        set to zero, so that each row is summed in the same order as compute
+        sums it on the filtered graph, and the results are exactly the same.
+        '''
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
+        ones = np.ones(n)
+        results = []
+        for threshold in thresholds:
+            result = np.zeros((n, self.nfeat))
+            for j in range(self.nfeat):
+                A = G.adjacency(incoming=j == 1)
+                probabilities = np.where(A.data > threshold, A.data.astype(np.float64) / 1000.0, 0.0)
+                result[:, j] = sp.csr_matrix((probabilities, A.indices, A.indptr), shape=A.shape) @ ones
+            results.append(result)
+        return results
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        Expected degrees of new_graph: only the rows of the endpoints of the
+        changed edges are summed again.
+        '''
+        n = new_graph.number_of_nodes()
+        nodes = diff.nodes()
+        result = np.array(result, dtype=np.float64).reshape(n, self.nfeat)
+        ones = np.ones(n)
+        result[nodes, 0] = _probability_adjacency(new_graph)[nodes] @ ones
+        if self.directed:
+            result[nodes, 1] = _probability_adjacency(new_graph, incoming=True)[nodes] @ ones
+        return result
+
+
+def _probability_adjacency(G, incoming=False):
+    A = G.adjacency(incoming=incoming)
+    return sp.csr_matrix((A.data.astype(np.float64) / 1000.0, A.indices, A.indptr), shape=A.shape)
+
 
 class PageRank(FeatureGenerator):
     '''
-    PageRank score of every node in the graph (can be quite heavy to compute)
+    PageRank score of every node in the graph, by sparse power iteration.
+    nstart (e.g. the scores of a previous run) warm-starts the iteration;
+    the number of iterations of the last run is kept in n_iter.
     '''
 
-    def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
+    def __init__(self, alpha=0.85, personalization=None, dangling=None, nstart=None, max_iter=100, tol=1.0e-6,
+                 default_recomputing=False, default_dump=True, prefix=''):
         super(PageRank, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                        prefix=prefix)
         self.nfeat = 1
+        self.alpha = alpha
+        self.personalization = personalization
+        self.dangling = dangling
+        self.nstart = nstart
+        self.max_iter = max_iter
+        self.tol = tol
+        self.n_iter = None
 
     def get_name(self):
         return "pagerank"
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         print("Computing Pagerank")
         result = np.zeros((n, self.nfeat))
-        pr = nx.algorithms.pagerank(Graph)
-        for i, p in pr.items():
-            result[i] = p
+        result[:, 0], self.n_iter = pagerank(G.adjacency(), alpha=self.alpha, personalization=self.personalization,
+                                             nstart=self.nstart, dangling=self.dangling,
+                                             max_iter=self.max_iter, tol=self.tol)
         return result
 
+    def sweep(self, Graph, thresholds):
+        '''
+        PageRank at every threshold, each run warm-started from the scores at
+        the previous (higher) threshold.
+        '''
+        G = as_csr(Graph)
+        x = self.nstart
+        results = dict()
+        for threshold in sorted(set(thresholds), reverse=True):
+            x, self.n_iter = pagerank(G.filter(threshold).adjacency(), alpha=self.alpha,
+                                      personalization=self.personalization, nstart=x, dangling=self.dangling,
+                                      max_iter=self.max_iter, tol=self.tol)
+            results[threshold] = x[:, None]
+        return [results[threshold] for threshold in thresholds]
+
+    def describe_sweep(self):
+        # warm-started from another threshold, the scores only agree with compute to within tol
+        return dict(self.describe(), part="sweep")
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        PageRank of new_graph, warm-started from the scores of result.
+        '''
+        x, self.n_iter = pagerank(new_graph.adjacency(), alpha=self.alpha, personalization=self.personalization,
+                                  nstart=np.ravel(result), dangling=self.dangling, max_iter=self.max_iter, tol=self.tol)
+        return x[:, None]
+
 
 class BetweennessCentrality(FeatureGenerator):
     '''
-    Betweenness centrality of every node in the graph (can be quite heavy to compute)
+    Betweenness centrality of every node in the graph (can be quite heavy to compute).
+    Brandes sources are spread over n_jobs processes. With k, the scores are
+    estimated from k pivots drawn with seed; error_bound then holds a bound on
+    the absolute error valid for all nodes with probability 1 - delta.
     '''
-    def __init__(self,default_recomputing = False, default_dump=True,prefix=''):
+    uses_weights = False
+
+    def __init__(self, k=None, seed=0, delta=0.05, n_jobs=1, default_recomputing = False, default_dump=True,prefix=''):
         super(BetweennessCentrality,self).__init__(default_recomputing = default_recomputing, default_dump=default_dump,prefix=prefix)
         self.nfeat = 1
+        self.k = k
+        self.seed = seed
+        self.delta = delta
+        self.n_jobs = n_jobs
+        self.error_bound = None
 
     def get_name(self):
-        return "betweenness"
+        if self.k is None:
+            return "betweenness"
+        return "betweenness_k{}_seed{}".format(self.k, self.seed)
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
-        bc = nx.betweenness_centrality(Graph)
-        for i,c in bc.items():
-            result[i] = c
+        result[:, 0] = betweenness_centrality(G, k=self.k, seed=self.seed, n_jobs=self.n_jobs)
+        self.error_bound = 0.0 if self.k is None else sampling_error_bound(n, self.k, self.delta)
         return result
 
 
 class ClusteringCoefficient(FeatureGenerator):
     """
-    Clustering Coefficient
+    Clustering Coefficient, from all triangles counted at once on the sparse
+    adjacency (optionally weighted with the STRING confidences), with blocks of
+    nodes spread over n_jobs processes
     """
-    def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
+    def __init__(self, weighted=False, n_jobs=1, chunk_size=256, default_recomputing=False, default_dump=True, prefix=''):
         super(ClusteringCoefficient, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                        prefix=prefix)
         self.nfeat = 1
+        self.weighted = weighted
+        self.uses_weights = weighted
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
 
     def get_name(self):
-        return "clusteringcoefficient"
+        return "{}clusteringcoefficient".format("weighted" if self.weighted else "")
 
     def compute(self,Graph):
-        list_nodes = Graph.nodes()
-        n = len(list_nodes)
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
-        for node in tqdm(list_nodes,desc="Clustering Coefficient"):
-            result[node]=nx.algorithms.clustering(Graph, node)
+        result[:, 0] = clustering(G, weighted=self.weighted, n_jobs=self.n_jobs, chunk_size=self.chunk_size)
         return result
 
+    def sweep(self, Graph, thresholds):
+        '''
+        Clustering coefficients at every threshold, with triangle counts
+        updated incrementally (see clustering_sweep) on undirected graphs.
+        '''
+        G = as_csr(Graph)
+        if G.is_directed():
+            return super(ClusteringCoefficient, self).sweep(G, thresholds)
+        results = clustering_sweep(G, thresholds, weighted=self.weighted, chunk_size=self.chunk_size)
+        return [results[threshold][:, None] for threshold in thresholds]
+
+    def describe_sweep(self):
+        # weighted triangles are updated with float sums in another order than compute's
+        return dict(self.describe(), part="sweep") if self.weighted else self.describe()
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        Clustering coefficients of new_graph, computed again only around the
+        changed edges (see update_clustering).
+        '''
+        return update_clustering(Graph, new_graph, diff, result, weighted=self.weighted, n_jobs=self.n_jobs,
+                                 chunk_size=self.chunk_size)[:, None]
+
     
 class ClosenessCentrality(FeatureGenerator):
     '''
-    Closeness centrality of every node in the graph (can be quite heavy to compute)
+    Closeness centrality of every node in the graph (can be quite heavy to compute).
+    BFS sources are spread over n_jobs processes. With k, the scores are
+    estimated from k pivots drawn with seed; error_bound then holds a bound on
+    the error of the estimated average distance to each node, valid for all
+    nodes with probability 1 - delta.
     '''
-    def __init__(self,default_recomputing = False, default_dump=True,prefix=''):
+    uses_weights = False
+
+    def __init__(self, k=None, seed=0, delta=0.05, n_jobs=1, default_recomputing = False, default_dump=True,prefix=''):
         super(ClosenessCentrality,self).__init__(default_recomputing = default_recomputing, default_dump=default_dump,prefix=prefix)
         self.nfeat = 1
+        self.k = k
+        self.seed = seed
+        self.delta = delta
+        self.n_jobs = n_jobs
+        self.error_bound = None
 
     def get_name(self):
-        return "closeness"
+        if self.k is None:
+            return "closeness"
+        return "closeness_k{}_seed{}".format(self.k, self.seed)
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
-        cc = nx.closeness_centrality(Graph)
-        for i,c in cc.items():
-            result[i] = c
+        result[:, 0], diameter = closeness_centrality(G, k=self.k, seed=self.seed, n_jobs=self.n_jobs)
+        self.error_bound = 0.0 if self.k is None else sampling_error_bound(n, self.k, self.delta, diameter)
         return result
 
 
 class HITS(FeatureGenerator):
     '''
-    HITS score of every node in the graph (can be quite heavy to compute)
+    HITS score of every node in the graph, from the leading singular vectors of
+    the sparse adjacency (method="svd") or by power iteration (method="power").
+    nstart (e.g. the authorities of a previous run) warm-starts the solver.
     '''
 
-    def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
+    def __init__(self, method="svd", nstart=None, max_iter=100, tol=1.0e-8,
+                 default_recomputing=False, default_dump=True, prefix=''):
         super(HITS, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                        prefix=prefix)
         self.nfeat = 2
+        self.method = method
+        self.nstart = nstart
+        self.max_iter = max_iter
+        self.tol = tol
+        self.n_iter = None
 
     def get_name(self):
         return "hits"
@@ -217,73 +478,226 @@ class HITS(FeatureGenerator):
         return ["hits_hubs","hits_authorities"]
 
     def compute(self, Graph):
-        n = Graph.number_of_nodes()
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
         result = np.zeros((n, self.nfeat))
         print("Computing HITS...")
-        hubs,authorities = nx.algorithms.hits(Graph)
-        for i in hubs.keys():
-            result[i,0] = hubs[i]
-            result[i,1] = authorities[i]
+        result[:, 0], result[:, 1], self.n_iter = hits(G.adjacency(), nstart=self.nstart, method=self.method,
+                                                       max_iter=self.max_iter, tol=self.tol)
+        return result
+
+    def update(self, Graph, new_graph, diff, result):
+        '''
+        HITS of new_graph, warm-started from the authorities of result.
+        '''
+        authorities = np.reshape(result, (new_graph.number_of_nodes(), self.nfeat))[:, 1]
+        result = np.zeros((new_graph.number_of_nodes(), self.nfeat))
+        result[:, 0], result[:, 1], self.n_iter = hits(new_graph.adjacency(), nstart=authorities, method=self.method,
+                                                       max_iter=self.max_iter, tol=self.tol)
+        return result
+
+
+class BallConductance(FeatureGenerator):
+    '''
+    Base of the conductance generators: the cut and volume of the ball of
+    every node on the last graph computed are kept, and stored in the cache
+    next to the result, so that update only computes the balls an edge diff
+    touches again (see update_conductance).
+    '''
+    uses_weights = False
+    # (fingerprint of the graph, cuts, volumes)
+    balls = None
+
+    def compute(self,Graph):
+        G = as_csr(Graph)
+        cut, volume = ball_statistics(G, self.ranges, n_jobs=self.n_jobs)
+        self.balls = (graph_fingerprint(G), cut, volume)
+        return conductance(cut, volume, total_volume(G))
+
+    def update(self, Graph, new_graph, diff, result):
+        result, statistics = update_conductance(as_csr(Graph), as_csr(new_graph), diff, result, self.ranges,
+                                                n_jobs=self.n_jobs, statistics=self.load_balls(Graph))
+        if statistics is None:
+            self.carry_balls_over(Graph, new_graph)
+        else:
+            self.balls = (graph_fingerprint(new_graph),) + tuple(statistics)
         return result
 
+    def apply_update(self, Graph, diff, new_graph=None, result=None, dump=None):
+        if new_graph is None:
+            new_graph = as_csr(Graph).apply_diff(diff)
+        if not self.changed_by(diff):
+            # update is skipped, the balls are those of Graph
+            self.carry_balls_over(Graph, new_graph)
+        return super(BallConductance, self).apply_update(Graph, diff, new_graph=new_graph, result=result, dump=dump)
+
+    def carry_balls_over(self, Graph, new_graph):
+        '''
+        Keep the balls of Graph, if known, as those of new_graph, which has the
+        same edges.
+        '''
+        statistics = self.load_balls(Graph)
+        if statistics is not None:
+            self.balls = (graph_fingerprint(new_graph),) + tuple(statistics)
+
+    def describe_balls(self):
+        return dict(self.describe(), part="balls")
+
+    def load_balls(self, Graph):
+        '''
+        Cuts and volumes of the balls of Graph, or None if they are neither
+        kept nor cached.
+        '''
+        fingerprint = graph_fingerprint(Graph)
+        if self.balls is not None and self.balls[0] == fingerprint:
+            return self.balls[1:]
+        stored = self.cache.get(cache_key(self.describe_balls(), fingerprint))
+        return None if stored is None else (stored[0], stored[1])
+
+    def dump_to_cache(self, Graph, result):
+        super(BallConductance, self).dump_to_cache(Graph, result)
+        fingerprint = graph_fingerprint(Graph)
+        if self.balls is not None and self.balls[0] == fingerprint:
+            self.cache.put(cache_key(self.describe_balls(), fingerprint), np.stack(self.balls[1:]),
+                           self.get_name() + "_balls", self.describe_balls(), fingerprint, prefix=self.prefix)
+
+
+class NeighbouringConductance(BallConductance):
+    '''
+    Conductance of the ball of the nodes within range - 1 hops of every node
+    '''
 
-class NeighbouringConductance(FeatureGenerator):
-    def __init__(self, range = 1,default_recomputing=False, default_dump=True, prefix=''):
+    def __init__(self, range = 1, n_jobs=1, default_recomputing=False, default_dump=True, prefix=''):
         super(NeighbouringConductance, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                        prefix=prefix)
         self.nfeat = 1
         self.range = range
+        self.n_jobs = n_jobs
+
+    @property
+    def ranges(self):
+        return [self.range]
 
     def get_name(self):
         return "Nconductance{}".format(self.range)
 
-    def compute(self,Graph):
-        n = Graph.number_of_nodes()
-        result = np.zeros((n, self.nfeat))
-        for node in tqdm(Graph.nodes(),desc=self.get_name()):
-            neighs = set()
-            new_neighs = set()
-            new_neighs.add(node)
-            for _ in range(self.range):
-                neighs = neighs.union(new_neighs)
-                next_neighs = set()
-                for neigh in new_neighs:
-                    next_neighs = next_neighs.union(set(Graph[neigh].keys()))
-                new_neighs =  next_neighs.difference(neighs)
-            if Graph.degree(node) == 0:
-                result[node] = np.nan
-            else:
-                result[node] = nx.algorithms.cuts.conductance(Graph,neighs)
-        return result
+
+class MultiRangeConductance(BallConductance):
+    '''
+    NeighbouringConductance for several ranges at once (one column per range),
+    computed in a single BFS per node
+    '''
+
+    def __init__(self, ranges = (2, 3, 4), n_jobs=1, default_recomputing=False, default_dump=True, prefix=''):
+        super(MultiRangeConductance, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
+                                       prefix=prefix)
+        self.ranges = list(ranges)
+        self.nfeat = len(self.ranges)
+        self.n_jobs = n_jobs
+
+    def get_name(self):
+        return "Nconductance{}".format("-".join(map(str, self.ranges)))
+
+    def get_feature_names(self):
+        return ["Nconductance{}".format(r) for r in self.ranges]
+
+
+class Node2Vec(FeatureGenerator):
+    '''
+    node2vec embedding of every node, computed from the graph itself instead
+    of read from an .emb file: biased second-order random walks (return
+    parameter p, in-out parameter q, following the STRING weights with
+    weighted) fed to a skip-gram model with negative sampling, trained with
+    gensim when it is installed and with numpy otherwise (see
+    common.embedding). Walk rounds are spread over n_jobs processes; seed
+    fixes the walks and the training.
+    '''
+    def __init__(self, dimensions=32, p=1.0, q=1.0, walk_length=80, num_walks=10, window=10, epochs=1, negative=5,
+                 weighted=False, seed=0, n_jobs=1, default_recomputing=False, default_dump=True, prefix=''):
+        super(Node2Vec, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
+                                       prefix=prefix)
+        self.dimensions = dimensions
+        self.nfeat = dimensions
+        self.p = p
+        self.q = q
+        self.walk_length = walk_length
+        self.num_walks = num_walks
+        self.window = window
+        self.epochs = epochs
+        self.negative = negative
+        self.weighted = weighted
+        self.uses_weights = weighted
+        self.seed = seed
+        self.n_jobs = n_jobs
+
+    def get_name(self):
+        return "node2vec{}dim_p{}_q{}".format(self.dimensions, self.p, self.q)
+
+    def get_params(self):
+        # the two trainers do not give the same vectors
+        return dict(super(Node2Vec, self).get_params(), trainer=self.trainer())
+
+    def trainer(self):
+        return "numpy" if embedding.gensim is None else "gensim"
+
+    def compute(self, Graph):
+        G = as_csr(Graph)
+        print("Computing node2vec walks...")
+        walks = embedding.node2vec_walks(G, walk_length=self.walk_length, num_walks=self.num_walks, p=self.p,
+                                         q=self.q, weighted=self.weighted, seed=self.seed, n_jobs=self.n_jobs)
+        print("Training skip-gram ({})...".format(self.trainer()))
+        train = embedding.skipgram if embedding.gensim is None else embedding.gensim_skipgram
+        return train(walks, G.number_of_nodes(), dimensions=self.dimensions, window=self.window,
+                     negative=self.negative, epochs=self.epochs, seed=self.seed).astype(np.float64)
+
 
 class ExternalFeature(FeatureGenerator):
-    def __init__(self, source_file = None,name = None,default_recomputing=False, default_dump=True, prefix=''):
+    '''
+    Features read from a file of EXTERNAL_FEATURE_PATH, e.g. a node2vec
+    embedding (.emb text file or .npy array, see common.embedding.read_embedding).
+    The header is only read when the number of features is needed, and text
+    files are parsed once, the parsed matrix being kept in the cache (see
+    load_embedding): chunksize bounds the lines parsed at a time.
+    '''
+    def __init__(self, source_file = None,name = None,chunksize=None,default_recomputing=False, default_dump=False, prefix=''):
         super(ExternalFeature, self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                        prefix=prefix)
-        with open(EXTERNAL_FEATURE_PATH +source_file,"r") as f:
-            line = f.readline()
-            self.nfeat = int(line.strip().split()[-1])
         if name is None:
             self.name = source_file
         else:
             self.name = name
         self.source_file = source_file
+        self.chunksize = chunksize
+
+    @property
+    def nfeat(self):
+        if self._nfeat is None:
+            self._nfeat = embedding.embedding_shape(EXTERNAL_FEATURE_PATH + self.source_file)[1]
+        return self._nfeat
 
+    @nfeat.setter
+    def nfeat(self, value):
+        self._nfeat = value
 
     def get_name(self):
         return self.name
 
+    def get_params(self):
+        # a rewritten source file invalidates the cached features
+        stat = os.stat(EXTERNAL_FEATURE_PATH + self.source_file)
+        return dict(super(ExternalFeature, self).get_params(), source_size=stat.st_size, source_mtime=stat.st_mtime)
+
+    def changed_by(self, diff):
+        # the features are read by node, whatever the edges
+        return False
+
     def compute(self,Graph):
         n = Graph.number_of_nodes()
-        result = np.zeros((n, self.nfeat))
-        with open(EXTERNAL_FEATURE_PATH +self.source_file,"r") as f:
-            line = f.readline()
-            assert n == int(line.strip().split()[0])
-            for line in f:
-                line_as_list = line.strip().split()
-                node_id = int(line_as_list[0])
-                features_list = [float(line_as_list[i]) for i in range(1,self.nfeat+1)]
-                result[node_id,:] = features_list
+        result = embedding.load_embedding(EXTERNAL_FEATURE_PATH + self.source_file, nodes=n, cache=self.cache,
+                                          chunksize=self.chunksize)
+        if result.shape[0] != n:
+            raise ValueError("{} has features for {} nodes, the graph has {}".format(
+                self.source_file, result.shape[0], n))
         return result
 
 
@@ -297,17 +711,33 @@ def Log10Wrapper(FeatureObject):
         def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
             super(Log10,self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                            prefix=prefix)
-            self.nfeat = FeatureObject.nfeat
+
+        @property
+        def nfeat(self):
+            # read from FeatureObject when needed (see ExternalFeature)
+            return FeatureObject.nfeat
+
+        @nfeat.setter
+        def nfeat(self, value):
+            pass
 
         def get_name(self):
             return "log10-"+FeatureObject.get_name()
 
+        def dependencies(self):
+            return [FeatureObject]
+
+        def get_params(self):
+            return dict(base=FeatureObject.describe())
+
         def get_feature_names(self):
             return ["log10-"+ x for x in FeatureObject.get_feature_names()]
 
+        def transform(self, result_origin):
+            return np.log10(result_origin)
+
         def compute(self,Graph):
-            result_local  = FeatureObject.apply(Graph)
-            return np.log10(result_local)
+            return self.transform(FeatureObject.apply(Graph))
     return Log10
 
 
@@ -320,23 +750,39 @@ def NormalizeWrapper(FeatureObject):
         def __init__(self, default_recomputing=False, default_dump=True, prefix=''):
             super(Normalized,self).__init__(default_recomputing=default_recomputing, default_dump=default_dump,
                                            prefix=prefix)
-            self.nfeat = FeatureObject.nfeat
             self.mean=None
             self.sd=None
 
+        @property
+        def nfeat(self):
+            # read from FeatureObject when needed (see ExternalFeature)
+            return FeatureObject.nfeat
+
+        @nfeat.setter
+        def nfeat(self, value):
+            pass
+
         def get_name(self):
             return "normalized-"+FeatureObject.get_name()
 
+        def dependencies(self):
+            return [FeatureObject]
+
+        def get_params(self):
+            return dict(base=FeatureObject.describe())
+
         def get_feature_names(self):
             return ["normalized-" + x for x in FeatureObject.get_feature_names()]
 
-        def compute(self,Graph):
-            result_local  = FeatureObject.apply(Graph)
+        def transform(self, result_local):
             self.mean = np.mean(result_local,axis=0)
             result_local = result_local - self.mean
             self.sd = np.std(result_local,axis = 0)
             result_local = result_local/self.sd
             return result_local
+
+        def compute(self,Graph):
+            return self.transform(FeatureObject.apply(Graph))
     return Normalized
 
 def FeatureSelector(FeatureObject):
@@ -360,14 +806,19 @@ def FeatureSelector(FeatureObject):
         def get_name(self):
             return "selected{}-".format("-".join(list(map(str,self.columns))))+FeatureObject.get_name()
 
+        def dependencies(self):
+            return [FeatureObject]
+
+        def get_params(self):
+            return dict(base=FeatureObject.describe(), columns=hash_value(self.columns))
+
         def get_feature_names(self):
             original_feature_names = FeatureObject.get_feature_names()
             return [original_feature_names[col] for col in self.columns]
 
+        def transform(self, result_origin):
+            return np.reshape(result_origin, (len(result_origin), -1))[:, self.columns]
+
         def compute(self,Graph):
-            result_origin  = FeatureObject.apply(Graph)
-            result_local = np.zeros((result_origin.shape[0],self.nfeat))
-            for i,col in enumerate(self.columns):
-                result_local[:,i]=  result_origin[:,col]
-            return result_local
+            return self.transform(FeatureObject.apply(Graph))
     return Selected
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.cache import CACHE_DIR
+
+MAPPING_FILE = "validation_datasets/entrez_to_ENSP_to_symbols.csv"
+STRING_FILE = "validation_datasets/entrez_gene_id.vs.string.v10.28042015.tsv"
+INDEX_CACHE = os.path.join(CACHE_DIR, "gene_ids.pkl")
+ID_TYPES = ("entrez", "string", "symbol")
+
+_loaded = dict()
+
+
+class GeneIdIndex(object):
+    '''
+    Mapping between STRING protein ids (9606.ENSP...), gene symbols and Entrez
+    gene ids, with one lookup table per id type so that whole arrays of ids
+    are translated with a single indexer.
+    '''
+
+    def __init__(self, table):
+        self.table = table.reset_index(drop=True)
+        # as the former dict-based mappings, the last row wins for repeated ids
+        self.lookup = {id_type: pd.Index(self.table[id_type]).drop_duplicates(keep='last')
+                       for id_type in ID_TYPES}
+        self.rows = {id_type: np.flatnonzero(~pd.Index(self.table[id_type]).duplicated(keep='last'))
+                     for id_type in ID_TYPES}
+
+    def positions(self, ids, source="string"):
+        '''
+        Row of the table of each of ids (of type source), -1 when unknown.
+        '''
+        found = self.lookup[source].get_indexer(pd.Index(ids, dtype=object))
+        return np.where(found >= 0, self.rows[source][found], -1)
+
+    def map(self, ids, source="string", target="symbol"):
+        '''
+        Translate ids from source to target type, with None for the ids that
+        are unknown or have no target id.
+        '''
+        positions = self.positions(ids, source)
+        values = self.table[target].values[positions].astype(object)
+        values[(positions < 0) | pd.isnull(values)] = None
+        return values
+
+    def select(self, ids, source="string", target="symbol"):
+        '''
+        Positions of the ids (of type source) that have a target id, and those
+        target ids.
+        '''
+        values = self.map(ids, source, target)
+        keep = np.flatnonzero(values != None)
+        return keep, values[keep].tolist()
+
+    def contains(self, ids, source="string"):
+        return self.positions(ids, source) >= 0
+
+
+def build_table(mapping_file=MAPPING_FILE, string_file=STRING_FILE):
+    '''
+    Table of (entrez, string, symbol) ids: the symbol mapping file, completed
+    with the Entrez to STRING pairs it does not list.
+    '''
+    mapping = pd.read_csv(mapping_file, usecols=[1, 2, 3])
+    mapping.columns = ["entrez", "string", "symbol"]
+    pairs = pd.read_csv(string_file, sep="\t")
+    pairs.columns = ["entrez", "string"]
+    table = mapping.merge(pairs, on=["entrez", "string"], how="outer", sort=False)
+    table["entrez"] = table["entrez"].astype(np.int64).astype(str)
+    table["string"] = table["string"].astype(str)
+    table["symbol"] = table["symbol"].astype(object).where(table["symbol"].notnull(), None)
+    return table
+
+
+def load_gene_index(mapping_file=MAPPING_FILE, string_file=STRING_FILE, cache_file=INDEX_CACHE):
+    '''
+    GeneIdIndex of the mapping files, built once per process and kept on disk
+    in cache_file (None to disable) until one of the files changes.
+    '''
+    sources = [(os.path.abspath(f), os.path.getsize(f), os.path.getmtime(f)) for f in (mapping_file, string_file)]
+    key = tuple(sources)
+    if key in _loaded:
+        return _loaded[key]
+    table = None
+    if cache_file is not None and os.path.exists(cache_file):
+        try:
+            cached = pd.read_pickle(cache_file)
+            if cached["sources"] == sources:
+                table = cached["table"]
+        except Exception as e:
+            print("Gene id index cache {} is unreadable, rebuilding it: {!r}".format(cache_file, e))
+    if table is None:
+        table = build_table(mapping_file, string_file)
+        if cache_file is not None:
+            if not os.path.exists(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            pd.to_pickle(dict(sources=sources, table=table), cache_file)
+    _loaded[key] = GeneIdIndex(table)
+    return _loaded[key]
@@ -0,0 +1,547 @@
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import networkx as nx
+import pandas as pd
+import scipy.sparse as sp
+
+
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ARRAYS = ['indptr', 'indices', 'weights', 'node_names', 'in_indptr', 'in_indices', 'in_weights']
+EDGE_DTYPE = np.dtype([('src', '<i4'), ('dst', '<i4'), ('weight', '<f4')])
+
+
+class CSRGraph(object):
+    '''
+    Compact graph stored as compressed sparse rows (int32 indptr/indices,
+    float32 weights, array of node names).
+
+    Row i holds the successors of node i (its neighbours if undirected) in the
+    order the edges were first seen, which is the order networkx uses for the
+    same input. Directed graphs also keep their predecessors in the in_* arrays.
+    '''
+
+    def __init__(self, indptr, indices, weights, node_names, directed=True, threshold=None,
+                 in_indptr=None, in_indices=None, in_weights=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.node_names = node_names
+        self.directed = directed
+        self.threshold = threshold
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.in_weights = in_weights
+        self._nx = None
+        self._fingerprint = None
+
+    def is_directed(self):
+        return self.directed
+
+    def number_of_nodes(self):
+        return len(self.indptr) - 1
+
+    def number_of_edges(self):
+        if self.directed:
+            return len(self.indices)
+        return (len(self.indices) + self.number_of_selfloops()) // 2
+
+    def number_of_selfloops(self):
+        rows = np.repeat(np.arange(self.number_of_nodes(), dtype=np.int32), np.diff(self.indptr))
+        return int(np.count_nonzero(rows == self.indices))
+
+    def fingerprint(self):
+        '''
+        Node and edge counts, orientation, threshold and a checksum of the
+        adjacency arrays, computed once.
+        '''
+        if self._fingerprint is None:
+            checksum = hashlib.sha1()
+            for array in [self.indptr, self.indices, self.weights]:
+                checksum.update(np.ascontiguousarray(array).tobytes())
+            self._fingerprint = dict(n_nodes=self.number_of_nodes(),
+                                     n_edges=self.number_of_edges(),
+                                     directed=self.directed,
+                                     threshold=self.threshold,
+                                     edge_checksum=checksum.hexdigest())
+        return self._fingerprint
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        if not self.directed:
+            return self.out_degree()
+        return np.diff(self.in_indptr)
+
+    def adjacency(self, weighted=True, incoming=False):
+        '''
+        scipy.sparse view of the adjacency (shares the underlying arrays).
+        With incoming=True, row i lists the predecessors of i.
+        '''
+        if incoming and self.directed:
+            indptr, indices, weights = self.in_indptr, self.in_indices, self.in_weights
+        else:
+            indptr, indices, weights = self.indptr, self.indices, self.weights
+        if not weighted:
+            weights = np.ones(len(indices), dtype=np.float32)
+        n = self.number_of_nodes()
+        return sp.csr_matrix((weights, indices, indptr), shape=(n, n), copy=False)
+
+    def to_networkx(self):
+        '''
+        networkx view of the graph, built once and cached. The adjacency dicts
+        are filled row by row so that every node lists its neighbours in the
+        same order as in the CSR arrays.
+        '''
+        if self._nx is None:
+            G = nx.DiGraph(threshold=self.threshold) if self.directed else nx.Graph(threshold=self.threshold)
+            G.add_nodes_from((i, {'name': name}) for i, name in enumerate(self.node_names))
+            n = self.number_of_nodes()
+            rows = np.repeat(np.arange(n), np.diff(self.indptr)).tolist()
+            adj = G._adj
+            if self.directed:
+                for i, j, w in zip(rows, self.indices.tolist(), self.weights.tolist()):
+                    adj[i][j] = {'weight': w}
+                in_rows = np.repeat(np.arange(n), np.diff(self.in_indptr)).tolist()
+                pred = G._pred
+                for i, j in zip(in_rows, self.in_indices.tolist()):
+                    pred[i][j] = adj[j][i]
+            else:
+                for i, j, w in zip(rows, self.indices.tolist(), self.weights.tolist()):
+                    # both directions of an undirected edge share one data dict
+                    adj[i][j] = adj[j][i] if j < i else {'weight': w}
+            self._nx = G
+        return self._nx
+
+    def filter(self, threshold):
+        '''
+        New CSRGraph keeping only the edges whose weight is above threshold.
+        '''
+        keep = self.weights > threshold
+        indptr, indices, weights = _filter_rows(self.indptr, self.indices, self.weights, keep)
+        if not self.directed:
+            return CSRGraph(indptr, indices, weights, self.node_names, directed=False, threshold=threshold)
+        keep = self.in_weights > threshold
+        in_indptr, in_indices, in_weights = _filter_rows(self.in_indptr, self.in_indices, self.in_weights, keep)
+        return CSRGraph(indptr, indices, weights, self.node_names, directed=True, threshold=threshold,
+                        in_indptr=in_indptr, in_indices=in_indices, in_weights=in_weights)
+
+    def edge_batches(self, thresholds):
+        '''
+        The out-edges of the graph sorted by decreasing weight once, cut at
+        each of thresholds, highest first: yields the threshold and the rows,
+        columns and weights of the edges above it that are not above the
+        previous (higher) threshold, so that the edges of filter(threshold)
+        are those of its batch and of all the batches before it.
+        '''
+        rows = np.repeat(np.arange(self.number_of_nodes()), np.diff(self.indptr))
+        order = np.argsort(-self.weights, kind='stable')
+        descending = -self.weights[order]
+        start = 0
+        for threshold in sorted(set(thresholds), reverse=True):
+            end = np.searchsorted(descending, -threshold, side='left')
+            batch = order[start:end]
+            yield threshold, rows[batch], self.indices[batch], self.weights[batch]
+            start = max(start, end)
+
+    def apply_diff(self, diff):
+        '''
+        New CSRGraph with the edges of the EdgeDiff diff removed, reweighted
+        and added, on the same nodes and with the same threshold (the weights
+        of the diff are taken as they are). Existing edges keep their place
+        among the neighbours of their nodes, added edges come after them.
+        '''
+        n = self.number_of_nodes()
+        nodes = diff.nodes()
+        if len(nodes) and (nodes[0] < 0 or nodes[-1] >= n):
+            raise ValueError("The edge diff has nodes outside the {} nodes of the graph".format(n))
+        indptr, indices, weights = _apply_entries(self.indptr, self.indices, self.weights, n,
+                                                  *_diff_entries(diff, self.directed, incoming=False))
+        if not self.directed:
+            return CSRGraph(indptr, indices, weights, self.node_names, directed=False, threshold=self.threshold)
+        in_indptr, in_indices, in_weights = _apply_entries(self.in_indptr, self.in_indices, self.in_weights, n,
+                                                           *_diff_entries(diff, True, incoming=True))
+        return CSRGraph(indptr, indices, weights, self.node_names, directed=True, threshold=self.threshold,
+                        in_indptr=in_indptr, in_indices=in_indices, in_weights=in_weights)
+
+    def save(self, path):
+        '''
+        Write the graph as a binary bundle: one .npy file per array plus a
+        meta.json describing the bundle.
+        '''
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for name in BUNDLE_ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(path, name + '.npy'), np.asarray(array))
+        _write_bundle_meta(path, self.directed, self.threshold, self.number_of_nodes(), self.number_of_edges())
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Open a bundle written by save. Arrays are memory-mapped by default, so
+        processes loading the same bundle share one copy of the adjacency.
+        '''
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != BUNDLE_FORMAT_VERSION:
+            raise ValueError("{} has bundle format version {}, expected {}".format(
+                path, meta['format_version'], BUNDLE_FORMAT_VERSION))
+        arrays = dict()
+        for name in BUNDLE_ARRAYS:
+            file_name = os.path.join(path, name + '.npy')
+            if os.path.exists(file_name):
+                arrays[name] = np.load(file_name, mmap_mode=mmap_mode)
+        return cls(directed=meta['directed'], threshold=meta['threshold'], **arrays)
+
+    @classmethod
+    def from_edges(cls, src, dst, weights, node_names, directed=True, threshold=None):
+        '''
+        Build the CSR arrays from an edge list. As with networkx, a repeated edge
+        keeps the position of its first occurrence and the weight of its last one.
+        '''
+        n = len(node_names)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+        if directed:
+            key = src * n + dst
+        else:
+            key = np.minimum(src, dst) * n + np.maximum(src, dst)
+        _, first = np.unique(key, return_index=True)
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        order = np.argsort(first, kind='stable')
+        src, dst, weights = src[first[order]], dst[first[order]], weights[last[order]]
+
+        if directed:
+            indptr, indices, wght = _rows_to_csr(src, dst, weights, n)
+            in_indptr, in_indices, in_wght = _rows_to_csr(dst, src, weights, n)
+            return cls(indptr, indices, wght, np.asarray(node_names), directed=True, threshold=threshold,
+                       in_indptr=in_indptr, in_indices=in_indices, in_weights=in_wght)
+
+        loops = src == dst
+        rows = np.concatenate([src, dst[~loops]])
+        cols = np.concatenate([dst, src[~loops]])
+        wght = np.concatenate([weights, weights[~loops]])
+        position = np.concatenate([np.arange(len(src)), np.flatnonzero(~loops)])
+        order = np.lexsort((position, rows))
+        indptr, indices, wght = _rows_to_csr(rows[order], cols[order], wght[order], n, presorted=True)
+        return cls(indptr, indices, wght, np.asarray(node_names), directed=False, threshold=threshold)
+
+    @classmethod
+    def from_networkx(cls, Graph):
+        '''
+        Convert a networkx graph whose nodes are labelled 0..n-1, keeping its
+        neighbour order.
+        '''
+        n = Graph.number_of_nodes()
+        node_names = np.array([Graph.nodes[i].get('name', str(i)) for i in range(n)])
+        directed = Graph.is_directed()
+        threshold = Graph.graph.get('threshold')
+        indptr, indices, weights = _adjacency_to_csr(Graph.adj, n)
+        if not directed:
+            return cls(indptr, indices, weights, node_names, directed=False, threshold=threshold)
+        in_indptr, in_indices, in_weights = _adjacency_to_csr(Graph.pred, n)
+        return cls(indptr, indices, weights, node_names, directed=True, threshold=threshold,
+                   in_indptr=in_indptr, in_indices=in_indices, in_weights=in_weights)
+
+
+class EdgeDiff(object):
+    '''
+    Edge-level changes to a graph with a fixed set of nodes: edges added
+    (with their weights), removed, and reweighted (with their new weights),
+    each as aligned arrays of node indices (and weights). Edges of undirected
+    graphs can be given in either orientation.
+    '''
+
+    def __init__(self, added=None, removed=None, reweighted=None):
+        self.added = _edge_arrays(added, weighted=True)
+        self.removed = _edge_arrays(removed, weighted=False)
+        self.reweighted = _edge_arrays(reweighted, weighted=True)
+
+    def __len__(self):
+        return len(self.added[0]) + len(self.removed[0]) + len(self.reweighted[0])
+
+    def changes_edges(self):
+        '''
+        Whether edges are added or removed (and not only reweighted).
+        '''
+        return len(self.added[0]) + len(self.removed[0]) > 0
+
+    def nodes(self):
+        '''
+        Endpoints of all the changed edges.
+        '''
+        return np.unique(np.concatenate([self.added[0], self.added[1], self.removed[0], self.removed[1],
+                                         self.reweighted[0], self.reweighted[1]]))
+
+    @classmethod
+    def from_names(cls, node_names, added=None, removed=None, reweighted=None):
+        '''
+        EdgeDiff of edges given by node names (e.g. STRING protein ids) as
+        (sources, targets[, weights]) sequences.
+        '''
+        index = pd.Index(node_names)
+
+        def positions(edges):
+            if edges is None:
+                return None
+            ends = [index.get_indexer(pd.Index(names, dtype=object)) for names in edges[:2]]
+            for names, found in zip(edges[:2], ends):
+                if (found < 0).any():
+                    raise ValueError("Unknown nodes in the edge diff: {}".format(
+                        list(np.asarray(names, dtype=object)[found < 0][:5])))
+            return tuple(ends) + tuple(edges[2:])
+
+        return cls(positions(added), positions(removed), positions(reweighted))
+
+    @classmethod
+    def from_graphs(cls, old, new):
+        '''
+        EdgeDiff turning the CSRGraph old into new, e.g. two releases of
+        STRING read on the same nodes.
+        '''
+        if old.directed != new.directed or not np.array_equal(old.node_names, new.node_names):
+            raise ValueError("The graphs of an edge diff must have the same nodes and orientation")
+        n = old.number_of_nodes()
+        old_keys, old_weights = _edge_keys(old)
+        new_keys, new_weights = _edge_keys(new)
+        _, in_old, in_new = np.intersect1d(old_keys, new_keys, assume_unique=True, return_indices=True)
+        removed = np.setdiff1d(old_keys, new_keys, assume_unique=True)
+        added = np.setdiff1d(new_keys, old_keys, assume_unique=True)
+        added_weights = new_weights[np.searchsorted(new_keys, added)]
+        changed = old_weights[in_old] != new_weights[in_new]
+        reweighted = old_keys[in_old][changed]
+        return cls(added=(added // n, added % n, added_weights), removed=(removed // n, removed % n),
+                   reweighted=(reweighted // n, reweighted % n, new_weights[in_new][changed]))
+
+
+def _edge_arrays(edges, weighted):
+    if edges is None:
+        edges = ([], [], []) if weighted else ([], [])
+    arrays = (np.asarray(edges[0], dtype=np.int64), np.asarray(edges[1], dtype=np.int64))
+    if weighted:
+        arrays += (np.asarray(edges[2], dtype=np.float32),)
+    if any(len(a) != len(arrays[0]) for a in arrays):
+        raise ValueError("The arrays of an edge diff must have the same length")
+    return arrays
+
+
+def _edge_keys(G):
+    '''
+    Sorted keys (source * n + target, once per undirected edge) and weights of
+    the edges of the CSRGraph G.
+    '''
+    n = G.number_of_nodes()
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(G.indptr))
+    cols = G.indices.astype(np.int64)
+    keep = np.ones(len(cols), dtype=bool) if G.directed else rows <= cols
+    keys = rows[keep] * n + cols[keep]
+    order = np.argsort(keys)
+    return keys[order], G.weights[keep][order]
+
+
+def _diff_entries(diff, directed, incoming):
+    '''
+    CSR entries (rows, columns[, weights]) of the removed, reweighted and
+    added edges of diff: both orientations of undirected edges, and the
+    reversed edges for the predecessor arrays of directed graphs.
+    '''
+    def entries(edges):
+        rows, cols = (edges[1], edges[0]) if incoming else (edges[0], edges[1])
+        if directed:
+            return (rows, cols) + tuple(edges[2:])
+        loops = rows == cols
+        both = (np.concatenate([rows, cols[~loops]]), np.concatenate([cols, rows[~loops]]))
+        return both + tuple(np.concatenate([w, w[~loops]]) for w in edges[2:])
+
+    return entries(diff.removed), entries(diff.reweighted), entries(diff.added)
+
+
+def _apply_entries(indptr, indices, weights, n, removed, reweighted, added):
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    keys = rows * n + indices
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    def locate(entries):
+        wanted = entries[0] * n + entries[1]
+        found = np.minimum(np.searchsorted(sorted_keys, wanted), max(len(keys) - 1, 0))
+        exists = sorted_keys[found] == wanted if len(keys) else np.zeros(len(wanted), dtype=bool)
+        return order[found], exists
+
+    position, exists = locate(removed)
+    if not exists.all():
+        raise ValueError("{} removed edges are not in the graph".format(np.count_nonzero(~exists)))
+    keep = np.ones(len(keys), dtype=bool)
+    keep[position] = False
+    position, exists = locate(reweighted)
+    if not exists.all():
+        raise ValueError("{} reweighted edges are not in the graph".format(np.count_nonzero(~exists)))
+    weights = np.array(weights, dtype=np.float32)
+    weights[position] = reweighted[2]
+    _, exists = locate(added)
+    if exists.any():
+        raise ValueError("{} added edges are already in the graph".format(np.count_nonzero(exists)))
+    rows = np.concatenate([rows[keep], added[0]])
+    cols = np.concatenate([indices[keep], added[1]])
+    weights = np.concatenate([weights[keep], added[2]])
+    position = np.concatenate([np.flatnonzero(keep), len(keys) + np.arange(len(added[0]))])
+    order = np.lexsort((position, rows))
+    return _rows_to_csr(rows[order], cols[order], weights[order], n, presorted=True)
+
+
+def _rows_to_csr(rows, cols, weights, n, presorted=False):
+    if not presorted:
+        order = np.argsort(rows, kind='stable')
+        cols, weights = cols[order], weights[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr.astype(np.int32), cols.astype(np.int32), weights.astype(np.float32)
+
+
+def _filter_rows(indptr, indices, weights, keep):
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    new_indptr = np.zeros(len(indptr), dtype=np.int64)
+    np.cumsum(np.bincount(rows[keep], minlength=n), out=new_indptr[1:])
+    return new_indptr.astype(np.int32), indices[keep], weights[keep]
+
+
+def bundle_path(file_name, directed=True, threshold=None):
+    '''
+    Location of the binary bundle converted from a Pajek file, keeping only
+    the edges above threshold if given (each threshold has its own bundle).
+    '''
+    suffix = "" if threshold is None else ".t{:g}".format(threshold)
+    return "{}.{}directed{}.csr".format(os.path.splitext(file_name)[0], "" if directed else "un", suffix)
+
+
+def _write_bundle_meta(path, directed, threshold, n_nodes, n_edges):
+    meta = dict(format_version=BUNDLE_FORMAT_VERSION,
+                directed=directed,
+                threshold=threshold,
+                n_nodes=n_nodes,
+                n_edges=n_edges)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def write_bundle_from_edge_file(path, edge_file, node_names, directed=True, threshold=None, chunksize=1000000):
+    '''
+    Write a bundle from a raw file of EDGE_DTYPE records without holding the
+    edges in memory: a first pass over the file counts the degrees, a second
+    one scatters the edges into memory-mapped output arrays.
+    Edges are assumed distinct; for an undirected graph each edge must appear
+    in one direction only.
+    '''
+    if not os.path.exists(path):
+        os.makedirs(path)
+    if os.path.getsize(edge_file) > 0:
+        edges = np.memmap(edge_file, dtype=EDGE_DTYPE, mode='r')
+    else:
+        edges = np.zeros(0, dtype=EDGE_DTYPE)
+    n = len(node_names)
+    orientations = [('', 'src', 'dst')]
+    if directed:
+        orientations.append(('in_', 'dst', 'src'))
+
+    for prefix, row_field, col_field in orientations:
+        counts = np.zeros(n, dtype=np.int64)
+        for start in range(0, len(edges), chunksize):
+            rows, _, _ = _chunk_entries(edges[start:start + chunksize], row_field, col_field, directed)
+            counts += np.bincount(rows, minlength=n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        nnz = int(indptr[-1])
+        indices = np.lib.format.open_memmap(os.path.join(path, prefix + 'indices.npy'), mode='w+',
+                                            dtype=np.int32, shape=(nnz,))
+        weights = np.lib.format.open_memmap(os.path.join(path, prefix + 'weights.npy'), mode='w+',
+                                            dtype=np.float32, shape=(nnz,))
+        fill = indptr[:-1].copy()
+        for start in range(0, len(edges), chunksize):
+            rows, cols, wght = _chunk_entries(edges[start:start + chunksize], row_field, col_field, directed)
+            chunk_counts = np.bincount(rows, minlength=n)
+            row_starts = np.cumsum(chunk_counts) - chunk_counts
+            destination = fill[rows] + np.arange(len(rows)) - row_starts[rows]
+            indices[destination] = cols
+            weights[destination] = wght
+            fill += chunk_counts
+        indices.flush()
+        weights.flush()
+        del indices, weights
+        np.save(os.path.join(path, prefix + 'indptr.npy'), indptr.astype(np.int32))
+
+    np.save(os.path.join(path, 'node_names.npy'), np.asarray(node_names))
+    _write_bundle_meta(path, directed, threshold, n, len(edges))
+
+
+def _chunk_entries(chunk, row_field, col_field, directed):
+    '''
+    CSR entries of a chunk of edge records, sorted by row and then by position
+    in the file.
+    '''
+    rows, cols, wght = chunk[row_field], chunk[col_field], chunk['weight']
+    if directed:
+        order = np.argsort(rows, kind='stable')
+        return rows[order], cols[order], wght[order]
+    loops = rows == cols
+    position = np.concatenate([np.arange(len(rows)), np.flatnonzero(~loops)])
+    rows, cols = np.concatenate([rows, cols[~loops]]), np.concatenate([cols, rows[~loops]])
+    wght = np.concatenate([wght, wght[~loops]])
+    order = np.lexsort((position, rows))
+    return rows[order], cols[order], wght[order]
+
+
+def _adjacency_to_csr(adj, n):
+    counts = np.fromiter((len(adj[i]) for i in range(n)), dtype=np.int64, count=n)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    nnz = int(indptr[-1])
+    indices = np.fromiter(itertools.chain.from_iterable(adj[i] for i in range(n)), dtype=np.int32, count=nnz)
+    weights = np.fromiter((d.get('weight', 1.0) for i in range(n) for d in adj[i].values()),
+                          dtype=np.float32, count=nnz)
+    return indptr.astype(np.int32), indices, weights
+
+
+def as_csr(Graph):
+    '''
+    CSRGraph for either a CSRGraph or a networkx graph.
+    '''
+    if isinstance(Graph, CSRGraph):
+        return Graph
+    return CSRGraph.from_networkx(Graph)
+
+
+def as_networkx(Graph):
+    '''
+    networkx graph for either a CSRGraph or a networkx graph.
+    '''
+    if isinstance(Graph, CSRGraph):
+        return Graph.to_networkx()
+    return Graph
+
+
+def graph_fingerprint(Graph):
+    '''
+    Fingerprint (see CSRGraph.fingerprint) of a CSRGraph or networkx graph. For
+    a networkx graph it is kept in Graph.graph, so it must not be modified
+    afterwards.
+    '''
+    if isinstance(Graph, CSRGraph):
+        return Graph.fingerprint()
+    if '_fingerprint' not in Graph.graph:
+        Graph.graph['_fingerprint'] = CSRGraph.from_networkx(Graph).fingerprint()
+    return Graph.graph['_fingerprint']
+
+
+def get_node_names(Graph):
+    if isinstance(Graph, CSRGraph):
+        return list(Graph.node_names)
+    return [Graph.nodes[i]['name'] for i in range(Graph.number_of_nodes())]
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+
+from tqdm import tqdm
+
+_shared = dict()
+
+
+def effective_n_jobs(n_jobs):
+    '''
+    Number of processes for n_jobs (None means 1, negative values count back
+    from the number of cores as in scikit-learn, -1 being all of them).
+    '''
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, os.cpu_count() + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def get_shared():
+    '''
+    The shared dict given to the parallel_map call running the current task.
+    '''
+    return _shared
+
+
+def parallel_map(func, items, n_jobs=1, shared=None, desc=None):
+    '''
+    [func(item) for item in items] on a pool of forked processes.
+    shared is made available to func through get_shared(): the workers inherit
+    it when they are forked, so large arrays (or a graph) are not pickled.
+    func must be a module-level function. Runs in the current process when a
+    single job is asked for, when fork is not available, or from within a
+    worker (which cannot start a pool of its own).
+    '''
+    global _shared
+    previous = _shared
+    _shared = dict() if shared is None else shared
+    try:
+        n_jobs = min(effective_n_jobs(n_jobs), len(items))
+        if (n_jobs <= 1 or multiprocessing.current_process().daemon
+                or 'fork' not in multiprocessing.get_all_start_methods()):
+            return [func(item) for item in tqdm(items, desc=desc, disable=desc is None)]
+        with multiprocessing.get_context('fork').Pool(n_jobs) as pool:
+            return list(tqdm(pool.imap(func, items), total=len(items), desc=desc, disable=desc is None))
+    finally:
+        _shared = previous
+
+
+def split(items, n_chunks):
+    '''
+    Split a sequence (or array) into at most n_chunks contiguous chunks.
+    '''
+    n_chunks = max(1, min(n_chunks, len(items)))
+    size, extra = divmod(len(items), n_chunks)
+    chunks = []
+    start = 0
+    for i in range(n_chunks):
+        end = start + size + (i < extra)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
@@ -1,50 +1,350 @@
+import time
+
 import numpy as np
 import pandas as pd
 
+from common.cache import cache_key, default_cache
+from common.gene_ids import INDEX_CACHE, MAPPING_FILE, load_gene_index
+from common.graph import as_csr, get_node_names, graph_fingerprint
+from common.parallel import get_shared, parallel_map
+
 class Pipeline:
     '''
     Implement the general form of a Pipeline.
+    The generators, and the generators they are computed from (the features
+    wrapped by Log10Wrapper, NormalizeWrapper or FeatureSelector), form a
+    dependency graph; the generators whose dependencies are done are computed
+    together on n_jobs processes sharing the graph.
     '''
-    def __init__(self,*featGenList):
+    def __init__(self,*featGenList, n_jobs=1, cache=None):
         self.generators = featGenList
-        self.generator_names = []
+        self.n_jobs = n_jobs
+        self.cache = default_cache if cache is None else cache
+
+    # read when the features are assembled, not when the pipeline is built (reading the number
+    # of features of an ExternalFeature opens its file)
+    @property
+    def generator_names(self):
+        names = []
         for g in self.generators:
-            self.generator_names.extend(g.get_feature_names())
-        self.nfeat = int(sum([g.nfeat for g in self.generators]))
+            names.extend(g.get_feature_names())
+        return names
+
+    @property
+    def nfeat(self):
+        return int(sum([g.nfeat for g in self.generators]))
 
     def get_generator_names(self):
         return self.generator_names
 
-    def apply(self,Graph,verbose = False):
+    def describe(self, dtype=np.float64):
+        return dict(generators=[g.describe() for g in self.generators], dtype=np.dtype(dtype).name)
+
+    def get_cache_key(self, Graph, dtype=np.float64):
+        '''
+        Key of the feature matrix of Graph in the cache, when apply is called
+        with dump=True.
+        '''
+        return cache_key(self.describe(dtype), graph_fingerprint(Graph))
+
+    def get_levels(self):
+        '''
+        All the generators needed, in levels: each generator only depends on
+        generators of earlier levels.
+        '''
+        depth = dict()
+        generators = dict()
+
+        def visit(g, path):
+            if id(g) in path:
+                raise ValueError("Cyclic dependency on {}".format(g.get_name()))
+            if id(g) not in depth:
+                depth[id(g)] = 1 + max([visit(d, path | {id(g)}) for d in g.dependencies()] + [-1])
+                generators[id(g)] = g
+            return depth[id(g)]
+
+        for g in self.generators:
+            visit(g, frozenset())
+        levels = [[] for _ in range(max(depth.values()) + 1)] if depth else []
+        for key, g in generators.items():
+            levels[depth[key]].append(g)
+        return levels
+
+    def compute_all(self, Graph, verbose=False):
+        '''
+        Results of all the generators needed, by generator id. Each distinct
+        generator (same class and parameters) is materialized once per run,
+        from the cache when possible; generators with dependencies (wrappers)
+        are computed from the results of their dependencies, without touching
+        the cache.
+        '''
+        fingerprint = graph_fingerprint(Graph)
+        memo = dict()
+        keys = dict()
+        computed_by = dict()
+        for level in self.get_levels():
+            pending = dict()
+            for g in level:
+                key = keys[id(g)] = cache_key(g.describe(), fingerprint)
+                computed_by.setdefault(key, g)
+                if key in memo or key in pending:
+                    continue
+                start = time.time()
+                if g.dependencies():
+                    memo[key] = g.transform(*[memo[keys[id(d)]] for d in g.dependencies()])
+                    source = " (view)"
+                else:
+                    memo[key] = None if g.default_recomputing else g.load_from_cache(Graph)
+                    if memo[key] is None:
+                        del memo[key]
+                        pending[key] = g
+                        continue
+                    source = " (cache)"
+                if verbose:
+                    print("{}: {:.2f}s{}".format(g.get_name(), time.time() - start, source))
+            generators = list(pending.values())
+            outputs = parallel_map(_compute_generator, list(range(len(generators))), n_jobs=self.n_jobs,
+                                   shared=dict(Graph=Graph, generators=generators))
+            for (key, g), (result, state, elapsed) in zip(pending.items(), outputs):
+                # attributes set by compute in a worker (n_iter, error_bound, ...)
+                vars(g).update(state)
+                if g.default_dump:
+                    g.dump_to_cache(Graph, result)
+                memo[key] = result
+                if verbose:
+                    print("{}: {:.2f}s".format(g.get_name(), elapsed))
+        for level in self.get_levels():
+            for g in level:
+                _copy_state(g, computed_by[keys[id(g)]])
+        return {id_g: memo[key] for id_g, key in keys.items()}
+
+    def apply(self,Graph,verbose = False, dtype=np.float64, order='F', as_frame=True, dump=False):
+        '''
+        Features of the genes of Graph (see filter_genes), in one preallocated
+        array of the given dtype and memory order ('F' keeps each feature
+        contiguous and is wrapped by pandas without a copy, 'C' keeps each
+        gene contiguous). Returns a DataFrame indexed by gene symbol and the
+        gene symbols, or with as_frame=False the raw array, the gene symbols
+        and the column names.
+        With dump, the array is also stored in the cache under get_cache_key,
+        e.g. for scoring genes with a saved model (see score_genes.py).
+        '''
+        return self.assemble(Graph, self.compute_all(Graph, verbose=verbose), dtype=dtype, order=order,
+                             as_frame=as_frame, dump=dump)
+
+    def update(self, Graph, diff, new_graph=None, verbose=False, dtype=np.float64, order='F', as_frame=True,
+               dump=False):
+        '''
+        Features of the genes of Graph with the EdgeDiff diff applied
+        (new_graph, if already built with CSRGraph.apply_diff), as apply
+        returns them, updated from the cached results on Graph (see
+        update_all) instead of computed from scratch.
+        '''
+        if new_graph is None:
+            new_graph = as_csr(Graph).apply_diff(diff)
+        return self.assemble(new_graph, self.update_all(Graph, diff, new_graph, verbose=verbose), dtype=dtype,
+                             order=order, as_frame=as_frame, dump=dump)
+
+    def update_all(self, Graph, diff, new_graph, verbose=False):
+        '''
+        Results of all the generators needed on new_graph, the graph Graph
+        with the EdgeDiff diff applied, by generator id: each generator goes
+        through apply_update, which carries its cached result on Graph over
+        to new_graph when diff cannot change it, and otherwise updates it
+        (affected nodes only, or warm start) or computes it again. Wrappers
+        are computed from the results of their dependencies.
+        '''
+        fingerprint = graph_fingerprint(new_graph)
+        memo = dict()
+        keys = dict()
+        computed_by = dict()
+        for level in self.get_levels():
+            pending = dict()
+            for g in level:
+                key = keys[id(g)] = cache_key(g.describe(), fingerprint)
+                computed_by.setdefault(key, g)
+                if key in memo or key in pending:
+                    continue
+                if g.dependencies():
+                    memo[key] = g.transform(*[memo[keys[id(d)]] for d in g.dependencies()])
+                else:
+                    pending[key] = g
+            generators = list(pending.values())
+            outputs = parallel_map(_update_generator, list(range(len(generators))), n_jobs=self.n_jobs,
+                                   shared=dict(Graph=Graph, new_graph=new_graph, diff=diff, generators=generators))
+            for (key, g), (result, state, elapsed) in zip(pending.items(), outputs):
+                vars(g).update(state)
+                if g.default_dump:
+                    g.dump_to_cache(new_graph, result)
+                memo[key] = result
+                if verbose:
+                    print("{}: {:.2f}s{}".format(g.get_name(), elapsed, "" if g.changed_by(diff) else " (carried over)"))
+        for level in self.get_levels():
+            for g in level:
+                _copy_state(g, computed_by[keys[id(g)]])
+        return {id_g: memo[key] for id_g, key in keys.items()}
+
+    def assemble(self, Graph, results, dtype=np.float64, order='F', as_frame=True, dump=False):
+        '''
+        Feature matrix of the genes of Graph from the results of the
+        generators by id (see apply).
+        '''
         n = Graph.number_of_nodes()
-        node_names = [Graph.nodes[i]['name'] for i in range(n)]
-        features = pd.DataFrame(data=np.zeros((n, self.nfeat)), index=node_names, columns=self.generator_names)
+        rows, node_names = select_genes(get_node_names(Graph))
+        features = np.empty((len(rows), self.nfeat), dtype=dtype, order=order)
         current = 0
         for g in self.generators:
-            g_res = g.apply(Graph)
-            if verbose:
-                print(g.get_name())
-            features.iloc[:,current:(current+g.nfeat)] = np.reshape(g_res, (n, g.nfeat))
+            features[:,current:(current+g.nfeat)] = np.reshape(results[id(g)], (n, g.nfeat))[rows]
             current += g.nfeat
-        features = filter_genes(features)
-        node_names = list(features.index)
-        
+        if dump:
+            self.cache.put(self.get_cache_key(Graph, dtype), features, "pipeline", self.describe(dtype),
+                           graph_fingerprint(Graph))
+        if not as_frame:
+            return features, node_names, self.generator_names
+        features = pd.DataFrame(data=features, index=node_names, columns=self.generator_names, copy=False)
+
         return features, node_names
 
-    
-def filter_genes(features, mapping_file="validation_datasets/entrez_to_ENSP_to_symbols.csv"):    
-    
-    mapping = pd.read_csv(mapping_file)
-    string_to_symbol = {}
-    for i in range(len(mapping)):
-        string_to_symbol[str(mapping.iloc[i,2])] = str(mapping.iloc[i,3])
-    indices = [gene for gene in features.index.values if gene in list(string_to_symbol.keys())]
-    features = features.loc[indices,:]
-    features = features.rename(index=string_to_symbol)
-    
+    def sweep(self, Graph, thresholds, verbose=False, dtype=np.float64, order='F', stacked=False):
+        '''
+        Features of the genes of Graph filtered at each of thresholds (e.g.
+        STRING confidence cutoffs, see CSRGraph.filter) in one pass: each
+        generator goes through its sweep method, which for degrees, expected
+        degrees, PageRank and clustering updates the result from one threshold
+        to the next instead of starting over.
+        Returns a list with the DataFrame of each threshold and the gene
+        symbols, or with stacked a (thresholds, genes, features) array, the
+        gene symbols and the column names.
+        '''
+        G = as_csr(Graph)
+        n = G.number_of_nodes()
+        rows, node_names = select_genes(get_node_names(G))
+        results = self.sweep_all(G, thresholds, verbose=verbose)
+        if order == 'F':
+            # each threshold's matrix is Fortran-ordered
+            features = np.empty((len(thresholds), self.nfeat, len(rows)), dtype=dtype).transpose(0, 2, 1)
+        else:
+            features = np.empty((len(thresholds), len(rows), self.nfeat), dtype=dtype)
+        current = 0
+        for g in self.generators:
+            for t, result in enumerate(results[id(g)]):
+                features[t, :, current:(current+g.nfeat)] = np.reshape(result, (n, g.nfeat))[rows]
+            current += g.nfeat
+        if stacked:
+            return features, node_names, self.generator_names
+        return [pd.DataFrame(data=matrix, index=node_names, columns=self.generator_names, copy=False)
+                for matrix in features], node_names
+
+    def sweep_all(self, Graph, thresholds, verbose=False):
+        '''
+        Results of all the generators needed at each of thresholds, by
+        generator id; as in compute_all, each distinct generator runs once,
+        results go through the cache under the fingerprint of each filtered
+        graph (only the thresholds missing from the cache are swept, and
+        sweeps that are not exact are kept apart, see describe_sweep) and
+        wrappers are computed from the results of their dependencies.
+        '''
+        G = as_csr(Graph)
+        fingerprints = [G.filter(threshold).fingerprint() for threshold in thresholds]
+        memo = dict()
+        keys = dict()
+        computed_by = dict()
+        for level in self.get_levels():
+            pending = dict()
+            for g in level:
+                key = keys[id(g)] = tuple(cache_key(g.describe_sweep(), fingerprint) for fingerprint in fingerprints)
+                computed_by.setdefault(key, g)
+                if key in memo or key in pending:
+                    continue
+                if g.dependencies():
+                    memo[key] = [g.transform(*[memo[keys[id(d)]][t] for d in g.dependencies()])
+                                 for t in range(len(thresholds))]
+                    continue
+                cached = [None if g.default_recomputing else g.cache.get(k) for k in key]
+                if any(result is None for result in cached):
+                    pending[key] = (g, cached)
+                    continue
+                memo[key] = cached
+                if verbose:
+                    print("{}: {} thresholds (cache)".format(g.get_name(), len(thresholds)))
+            generators = [g for g, _ in pending.values()]
+            missing = [[t for t, result in zip(thresholds, cached) if result is None] for _, cached in pending.values()]
+            outputs = parallel_map(_sweep_generator, list(range(len(generators))), n_jobs=self.n_jobs,
+                                   shared=dict(Graph=G, generators=generators, thresholds=missing))
+            for (key, (g, cached)), (result, state, elapsed) in zip(pending.items(), outputs):
+                vars(g).update(state)
+                swept = iter(result)
+                memo[key] = [next(swept) if r is None else r for r in cached]
+                if g.default_dump:
+                    for k, fingerprint, r, c in zip(key, fingerprints, memo[key], cached):
+                        if c is None:
+                            g.cache.put(k, r, g.get_name(), g.describe_sweep(), fingerprint, prefix=g.prefix)
+                if verbose:
+                    print("{}: {:.2f}s for {} thresholds".format(g.get_name(), elapsed, len(result)))
+        for level in self.get_levels():
+            for g in level:
+                _copy_state(g, computed_by[keys[id(g)]])
+        return {id_g: memo[key] for id_g, key in keys.items()}
+
+
+def select_genes(node_names, mapping_file=MAPPING_FILE, cache_file=INDEX_CACHE):
+    '''
+    Positions of the STRING ids of node_names that have a gene symbol, and
+    those symbols (see load_gene_index for cache_file).
+    '''
+    return load_gene_index(mapping_file, cache_file=cache_file).select(node_names, "string", "symbol")
+
+
+def filter_genes(features, mapping_file=MAPPING_FILE, cache_file=INDEX_CACHE):
+    '''
+    Keep the rows of features indexed by a STRING id that has a gene symbol,
+    and index them by symbol.
+    '''
+    rows, symbols = select_genes(list(features.index.values), mapping_file, cache_file)
+    features = features.iloc[rows,:]
+    features.index = symbols
+
     return features
 
 
+def _copy_state(g, source):
+    '''
+    Give g the attributes set on source, the generator computed in its place
+    (same cache key), by its computation: the statistics fitted by
+    NormalizeWrapper, n_iter, error_bound...
+    '''
+    if g is not source:
+        vars(g).update({key: value for key, value in vars(source).items()
+                        if key not in ('cache', 'default_recomputing', 'default_dump') + g.execution_params})
+
+
+def _compute_generator(index):
+    shared = get_shared()
+    g = shared['generators'][index]
+    start = time.time()
+    result = g.compute(shared['Graph'])
+    state = {key: value for key, value in vars(g).items() if key != 'cache'}
+    return result, state, time.time() - start
+
+
+def _update_generator(index):
+    shared = get_shared()
+    g = shared['generators'][index]
+    start = time.time()
+    # dumped by the parent, as in compute_all
+    result = g.apply_update(shared['Graph'], shared['diff'], new_graph=shared['new_graph'], dump=False)
+    state = {key: value for key, value in vars(g).items() if key != 'cache'}
+    return result, state, time.time() - start
+
+
+def _sweep_generator(index):
+    shared = get_shared()
+    g = shared['generators'][index]
+    start = time.time()
+    result = g.sweep(shared['Graph'], shared['thresholds'][index])
+    state = {key: value for key, value in vars(g).items() if key != 'cache'}
+    return result, state, time.time() - start
+
 
     
     
\ No newline at end of file
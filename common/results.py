@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from common.parallel import get_shared, parallel_map
+
+RESULTS_DIR = "output/results/"
+
+
+class ResultsStore(object):
+    '''
+    Numbers and curves of a run, kept apart from their plots: each record is
+    an .npz file of arrays (ROC/PR curves, histograms) and a small .json file
+    of its kind, title, metrics and plot file, so that the plots can be
+    rendered later (see render), or not at all. Adding a record only writes
+    its own files, so that processes can add records to the same store; the
+    index of all the records is built from the .json files when read.
+    '''
+
+    def __init__(self, directory=RESULTS_DIR):
+        self.directory = directory
+
+    def entry_path(self, name):
+        return os.path.join(self.directory, "{}.json".format(name))
+
+    def read_entry(self, name):
+        with open(self.entry_path(name), 'r') as f:
+            return json.load(f)
+
+    def read_index(self):
+        index = dict()
+        if not os.path.isdir(self.directory):
+            return index
+        for file_name in os.listdir(self.directory):
+            name, extension = os.path.splitext(file_name)
+            if extension == ".json":
+                try:
+                    index[name] = self.read_entry(name)
+                except (IOError, OSError, ValueError):
+                    pass
+        return index
+
+    def add(self, name, kind, arrays, **info):
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = "{}.npz".format(name)
+        np.savez(os.path.join(self.directory, file_name), **arrays)
+        # the entry is written last, and renamed into place, so that it only lists complete records
+        tmp = "{}.{}.tmp".format(self.entry_path(name), os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(dict(info, kind=kind, file=file_name), f, indent=2, sort_keys=True)
+        os.replace(tmp, self.entry_path(name))
+
+    def load(self, name):
+        entry = self.read_entry(name)
+        with np.load(os.path.join(self.directory, entry['file'])) as arrays:
+            return entry, dict(arrays)
+
+    def names(self, kind=None):
+        return [name for name, entry in sorted(self.read_index().items()) if kind is None or entry['kind'] == kind]
+
+
+def pyplot():
+    '''
+    matplotlib.pyplot, imported on first use (with the non-interactive Agg
+    backend unless pyplot was already set up, e.g. in a notebook).
+    '''
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_metrics(arrays, title, output_file):
+    plt = pyplot()
+    plt.figure()
+    plt.subplot(121)
+    plt.plot(arrays['fpr'], arrays['tpr'])
+    plt.plot(np.linspace(0,1,10),np.linspace(0,1,10))
+    plt.xlabel("fpr")
+    plt.ylabel("tpr")
+    plt.title("ROC curve %s"%title)
+    plt.subplot(122)
+    plt.plot(arrays['recall'], arrays['precision'])
+    plt.xlabel("recall")
+    plt.ylabel("precision")
+    plt.title("PR curve %s"%title)
+    plt.savefig(output_file)
+    plt.close()
+
+
+def plot_distribution(arrays, title, output_file):
+    plt = pyplot()
+    bins = arrays['bins']
+    plt.hist(bins[:-1], bins, weights=arrays['unmarked'], alpha=0.5, label='unmarked')
+    plt.hist(bins[:-1], bins, weights=arrays['marked'], alpha=0.5, label='marked')
+    plt.title(title)
+    plt.legend()
+    plt.savefig(output_file)
+    plt.close()
+
+
+PLOTTERS = dict(metrics=plot_metrics, distribution=plot_distribution)
+
+
+def render(store, names=None, n_jobs=1):
+    '''
+    Render the plots of the records of store (all of them by default) to
+    their plot files, on n_jobs processes.
+    '''
+    if names is None:
+        names = store.names()
+    parallel_map(_render, list(names), n_jobs=n_jobs, shared=dict(store=store), desc="Plots")
+
+
+def _render(name):
+    entry, arrays = get_shared()['store'].load(name)
+    PLOTTERS[entry['kind']](arrays, entry['title'], entry['plot_file'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render the plots of a results store")
+    parser.add_argument("directory", nargs="?", default=RESULTS_DIR)
+    parser.add_argument("--kind", choices=sorted(PLOTTERS), default=None)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    args = parser.parse_args()
+    store = ResultsStore(args.directory)
+    render(store, store.names(args.kind), n_jobs=args.n_jobs)
@@ -0,0 +1,123 @@
+import numpy as np
+from scipy.stats import hypergeom, norm
+
+
+def rank_columns(X):
+    '''
+    Average ranks (from 1, ties sharing their mean rank) of the values of
+    each column of X among the non-nan values of that column, nan for nan.
+    Returns the ranks and the tie term sum(t^3 - t) over the groups of t tied
+    values of each column.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    n, m = X.shape
+    order = np.argsort(X, axis=0, kind='mergesort')
+    S = np.take_along_axis(X, order, axis=0)
+    # runs of equal values in each sorted column (nan, sorted last, are never equal)
+    new_run = np.ones((n, m), dtype=bool)
+    new_run[1:] = S[1:] != S[:-1]
+    new_run = new_run.T.ravel()
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, n * m))
+    run = np.cumsum(new_run) - 1
+    average = (starts % n) + (lengths + 1) / 2.0
+    ranks = np.empty((n, m))
+    np.put_along_axis(ranks, order, average[run].reshape(m, n).T, axis=0)
+    nan = np.isnan(X)
+    ranks[nan] = np.nan
+    valid_run = ~np.isnan(S.T.ravel()[starts])
+    ties = np.bincount(starts[valid_run] // n, weights=(lengths[valid_run] ** 3.0 - lengths[valid_run]),
+                       minlength=m)
+    return ranks, ties
+
+
+def mannwhitney(X, groups):
+    '''
+    Two-sided Mann-Whitney U tests of every column of X between the rows in
+    and out of every column of the boolean matrix groups (rows x groups),
+    ignoring nan values. Same statistic and p-value as
+    scipy.stats.mannwhitneyu(outside, inside) with the asymptotic method, tie
+    correction and continuity correction.
+    Returns U and the p-values, both of shape (columns of X, groups).
+    '''
+    ranks, ties = rank_columns(X)
+    valid = ~np.isnan(ranks)
+    groups = np.asarray(groups, dtype=np.float64)
+    n_in = valid.T.astype(np.float64) @ groups
+    n = valid.sum(axis=0).astype(np.float64)[:, None]
+    n_out = n - n_in
+    rank_out = n * (n + 1) / 2.0 - np.nan_to_num(ranks).T @ groups
+    U = rank_out - n_out * (n_out + 1) / 2.0
+    mu = n_in * n_out / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(n_in * n_out / 12.0 * ((n + 1) - ties[:, None] / (n * (n - 1))))
+        z = (np.maximum(U, n_in * n_out - U) - mu - 0.5) / sigma
+    pvalues = np.clip(2 * norm.sf(z), 0, 1)
+    return U, pvalues
+
+
+def top_ranks(X, seed=0):
+    '''
+    Position of each value of X in its column sorted in decreasing order
+    (nan last). Ties are broken in a random order drawn with seed, so that
+    the rows sharing a value across a top-N cutoff are not picked by their
+    position in X.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    tiebreak = np.random.RandomState(seed).permutation(X.shape[0])[:, None].repeat(X.shape[1], axis=1)
+    order = np.lexsort((tiebreak, np.where(np.isnan(X), np.inf, -X)), axis=0)
+    positions = np.empty(X.shape, dtype=np.int64)
+    np.put_along_axis(positions, order, np.arange(X.shape[0])[:, None].repeat(X.shape[1], axis=1), axis=0)
+    return positions
+
+
+def hypergeometric(X, groups, tops=(100,), seed=0):
+    '''
+    Hypergeometric tests of the enrichment in each group (column of the
+    boolean matrix groups) of the top rows of every column of X, for each
+    number of top rows in tops, nan values left out.
+    As the former compare_feature_distribution_hypergeom, the p-value is
+    P(X > k) for k members of the group among the top rows. seed is for
+    breaking ties (see top_ranks).
+    Returns the p-values, of shape (len(tops), columns of X, groups).
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    valid = ~np.isnan(X)
+    groups = np.asarray(groups, dtype=np.float64)
+    positions = top_ranks(X, seed)
+    M = valid.sum(axis=0)[:, None]
+    n = valid.T.astype(np.float64) @ groups
+    pvalues = np.empty((len(tops),) + n.shape)
+    for i, N in enumerate(tops):
+        k = ((positions < N) & valid).T.astype(np.float64) @ groups
+        pvalues[i] = hypergeom.sf(k, M, n, np.minimum(N, M))
+    return pvalues
+
+
+def benjamini_hochberg(pvalues):
+    '''
+    Benjamini-Hochberg adjusted p-values (false discovery rate) of all the
+    non-nan p-values of the array, as one family.
+    '''
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(pvalues.shape, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    order = np.argsort(p)
+    scaled = p[order] * len(p) / np.arange(1, len(p) + 1)
+    values = np.empty(len(p))
+    values[order] = np.minimum(1, np.minimum.accumulate(scaled[::-1])[::-1])
+    adjusted[valid] = values
+    return adjusted
+
+
+def bonferroni(pvalues):
+    '''
+    Bonferroni adjusted p-values of all the non-nan p-values of the array,
+    as one family.
+    '''
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    return np.minimum(1, pvalues * np.count_nonzero(~np.isnan(pvalues)))
+
+
+CORRECTIONS = dict(fdr_bh=benjamini_hochberg, bonferroni=bonferroni)
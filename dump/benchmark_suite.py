@@ -0,0 +1,380 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+
+import common.feature_generators as feature_generators
+from common import gene_ids
+from common.cache import FeatureCache
+from common.feature_generators import (BetweennessCentrality, ClosenessCentrality, ClusteringCoefficient, Degree,
+                                       ExpectedDegree, ExternalFeature, FeatureSelector, HITS, Log10Wrapper,
+                                       MultiRangeConductance, NeighbouringConductance, Node2Vec, NormalizeWrapper,
+                                       PageRank)
+from common.gene_ids import MAPPING_FILE, load_gene_index
+from common.graph import CSRGraph
+from common.pipeline import Pipeline, filter_genes
+from read_graph import read_graph
+
+# Benchmarks every feature generator and pipeline stage on synthetic
+# STRING-like graphs (power-law degrees, confidence weights) built with fixed
+# seeds, and records wall time, peak RSS and throughput in a JSON file.
+# Each case runs in a forked process, so that its peak RSS is its own; with a
+# baseline (a results file of an earlier run), slower or bigger cases are
+# flagged and the exit status is 1. Run from the repository root:
+#   python -m dump.benchmark_suite --sizes 1000 5000 --save-baseline
+#   python -m dump.benchmark_suite --sizes 1000 5000
+
+SIZES = [1000, 5000, 20000, 50000]
+RESULTS_FILE = "output/benchmarks/latest.json"
+BASELINE_FILE = "output/benchmarks/baseline.json"
+SOURCES = ["mendelian", "cancer", "drugbank"]
+
+
+def synthetic_graph(n_nodes, mean_degree=20, exponent=2.5, seed=0):
+    '''
+    Undirected STRING-like CSRGraph: a Chung-Lu random graph whose expected
+    degrees follow a power law of the given exponent, with STRING-like
+    confidences (150 to 999, mostly low) as weights. The nodes are named with
+    the STRING ids of the gene mapping file (then made-up ids), so that genes,
+    labels and correlations are computed on real genes.
+    '''
+    rng = np.random.RandomState(seed)
+    expected = (1.0 - rng.random_sample(n_nodes)) ** (-1.0 / (exponent - 1.0))
+    expected = np.minimum(expected, np.sqrt(expected.sum() * mean_degree))
+    n_edges = int(n_nodes * mean_degree / 2)
+    src = rng.choice(n_nodes, n_edges, p=expected / expected.sum())
+    dst = rng.choice(n_nodes, n_edges, p=expected / expected.sum())
+    weights = 150 + np.floor(850 * rng.beta(1.0, 3.0, n_edges))
+    loops = src == dst
+    ids = pd.read_csv(MAPPING_FILE, usecols=[2]).iloc[:, 0].drop_duplicates().tolist()
+    node_names = (ids + ["9606.SYNTH{:08d}".format(i) for i in range(max(0, n_nodes - len(ids)))])[:n_nodes]
+    return CSRGraph.from_edges(src[~loops], dst[~loops], weights[~loops], node_names, directed=False)
+
+
+def write_pajek(G, file_name):
+    '''
+    Write the undirected CSRGraph G as a Pajek file for read_graph, each edge
+    once.
+    '''
+    rows = np.repeat(np.arange(G.number_of_nodes()), G.out_degree())
+    once = rows <= G.indices
+    with open(file_name, 'w') as f:
+        f.write("*Vertices {}\n".format(G.number_of_nodes()))
+        f.writelines("{} {}\n".format(i, name) for i, name in enumerate(G.node_names))
+        f.write("*Edges\n")
+        np.savetxt(f, np.column_stack([rows[once], G.indices[once], G.weights[once]]), fmt="%d %d %d")
+
+
+def write_embedding(G, file_name, dimensions=32, seed=0):
+    '''
+    Random node2vec-like .emb file for the nodes of G.
+    '''
+    rng = np.random.RandomState(seed)
+    n = G.number_of_nodes()
+    with open(file_name, 'w') as f:
+        f.write("{} {}\n".format(n, dimensions))
+        np.savetxt(f, np.column_stack([np.arange(n), rng.randn(n, dimensions)]),
+                   fmt=["%d"] + ["%.6f"] * dimensions)
+
+
+def with_cache(g, cache):
+    '''
+    Point g and the generators it depends on to cache.
+    '''
+    g.cache = cache
+    for d in g.dependencies():
+        with_cache(d, cache)
+    return g
+
+
+def empty_cache(context):
+    '''
+    New empty FeatureCache in the benchmark directory, for timing a cold
+    computation once the case has run before.
+    '''
+    return FeatureCache(tempfile.mkdtemp(dir=context['directory']))
+
+
+def feature_frame(context):
+    pipeline = Pipeline(Degree(), ExpectedDegree(), ClusteringCoefficient(), PageRank(),
+                        FeatureSelector(HITS())(columns=1), cache=context['cache'])
+    for g in pipeline.generators:
+        with_cache(g, context['cache'])
+    features, node_names = pipeline.apply(context['graph'])
+    return features
+
+
+# generator cases: name, constructor, largest graph (in nodes) they are run on
+GENERATORS = [
+    ("Degree", lambda: Degree(), None),
+    ("ExpectedDegree", lambda: ExpectedDegree(), None),
+    ("PageRank", lambda: PageRank(), None),
+    ("HITS", lambda: HITS(), None),
+    ("ClusteringCoefficient", lambda: ClusteringCoefficient(), None),
+    ("WeightedClusteringCoefficient", lambda: ClusteringCoefficient(weighted=True), None),
+    ("BetweennessCentrality_k100", lambda: BetweennessCentrality(k=100), None),
+    ("ClosenessCentrality_k100", lambda: ClosenessCentrality(k=100), None),
+    ("NeighbouringConductance2", lambda: NeighbouringConductance(range=2), 20000),
+    ("MultiRangeConductance2-3", lambda: MultiRangeConductance(ranges=(2, 3)), 5000),
+    ("Node2Vec_2x40", lambda: Node2Vec(num_walks=2, walk_length=40), 20000),
+    ("Log10Wrapper(Degree)", lambda: Log10Wrapper(Degree())(), None),
+    ("NormalizeWrapper(ExpectedDegree)", lambda: NormalizeWrapper(ExpectedDegree())(), None),
+    ("FeatureSelector(HITS)", lambda: FeatureSelector(HITS())(columns=1), None),
+]
+
+
+def generator_case(constructor):
+    def setup(context):
+        g = constructor()
+
+        def compute():
+            # wrappers apply their dependencies, which must not find the results of the previous run
+            with_cache(g, empty_cache(context))
+            return g.compute(context['graph']) is not None and context['graph'].number_of_edges()
+        return compute
+    return setup
+
+
+def external_feature_case(context):
+    g = ExternalFeature(source_file="benchmark.emb")
+
+    def parse():
+        # an empty cache for each run, so that every run parses the file instead of loading the matrix
+        # parsed by the first one (see load_embedding)
+        g.cache = empty_cache(context)
+        return g.compute(context['graph']) is not None and context['graph'].number_of_edges()
+    return parse
+
+
+def read_graph_case(context):
+    return lambda: read_graph(context['pajek_file'], directed=False, as_csr=True).number_of_edges()
+
+
+def pipeline_case(warm):
+    def setup(context):
+        generators = [Log10Wrapper(Degree())(), Log10Wrapper(ExpectedDegree())(), ClusteringCoefficient(),
+                      PageRank(), FeatureSelector(HITS())(columns=1)]
+        pipeline = Pipeline(*generators)
+
+        def apply(cache):
+            pipeline.cache = cache
+            for g in pipeline.generators:
+                with_cache(g, cache)
+            return len(pipeline.apply(context['graph'])[1]) and context['graph'].number_of_edges()
+        if warm:
+            apply(context['cache'])
+            return lambda: apply(context['cache'])
+        # every run starts from an empty cache, or the runs after the first would time cache hits
+        return lambda: apply(empty_cache(context))
+    return setup
+
+
+def filter_genes_case(context):
+    G = context['graph']
+    features = pd.DataFrame(np.random.RandomState(0).rand(G.number_of_nodes(), 10), index=G.node_names)
+
+    def select():
+        # the gene index is built again from the mapping files, without being stored
+        gene_ids._loaded.clear()
+        return len(filter_genes(features, cache_file=None)) and G.number_of_nodes()
+    return select
+
+
+def train_model_case(context):
+    # prediction and validation need gseapy (for the reference gene lists)
+    from prediction import get_labels, train_model
+    features = feature_frame(context)
+    labels = get_labels(features.index)
+    return lambda: train_model(features, labels, "mendelian", search="halving", n_jobs=1, random_state=0) and len(features)
+
+
+def compute_correlations_case(context):
+    from validation import compute_correlations
+    features = feature_frame(context)
+    pvalues_file = os.path.join(context['directory'], "pvalues")
+    return lambda: compute_correlations(features, SOURCES, plot=False, pvalues_file=pvalues_file) is not None \
+        and len(features)
+
+
+# all the cases: name, setup (returns the timed function, which returns the
+# number of items processed), throughput unit, largest graph
+CASES = ([("read_graph", read_graph_case, "edges/s", None)]
+         + [(name, generator_case(constructor), "edges/s", max_nodes) for name, constructor, max_nodes in GENERATORS]
+         + [("ExternalFeature", external_feature_case, "edges/s", None)]
+         + [("Pipeline.apply", pipeline_case(warm=False), "edges/s", None),
+            ("Pipeline.apply (cached)", pipeline_case(warm=True), "edges/s", None),
+            ("filter_genes", filter_genes_case, "nodes/s", None),
+            ("train_model", train_model_case, "genes/s", None),
+            ("compute_correlations", compute_correlations_case, "genes/s", None)])
+
+
+def current_rss():
+    # resident set size in MB (Linux), or the peak so far elsewhere
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.0 ** 20
+    except (IOError, OSError):
+        return peak_rss()
+
+
+def peak_rss():
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2.0 ** 20 if sys.platform == 'darwin' else peak / 2.0 ** 10
+
+
+def _measure(setup, context, repeat, queue):
+    try:
+        context['cache'] = empty_cache(context)
+        feature_generators.EXTERNAL_FEATURE_PATH = context['directory'] + os.sep
+        # the gene index the cases use is kept (in this process) from a file of the benchmark directory, so that
+        # nothing is written to the repository's data/cache
+        load_gene_index(cache_file=os.path.join(context['directory'], "gene_ids.pkl"))
+        function = setup(context)
+        start_rss = current_rss()
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            count = function()
+            times.append(time.time() - start)
+        queue.put(dict(seconds=min(times), items=int(count), start_rss_mb=start_rss, peak_rss_mb=peak_rss()))
+    except Exception:
+        queue.put(dict(error=traceback.format_exc()))
+
+
+def run_case(setup, context, repeat):
+    '''
+    Time setup's function (best of repeat runs) in a forked process, with its
+    peak RSS.
+    '''
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(setup, context, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run(sizes, cases, mean_degree=20, seed=0, repeat=1):
+    results = []
+    for n_nodes in sizes:
+        directory = tempfile.mkdtemp(prefix="benchmark_")
+        try:
+            G = synthetic_graph(n_nodes, mean_degree=mean_degree, seed=seed)
+            pajek_file = os.path.join(directory, "benchmark.paj")
+            write_pajek(G, pajek_file)
+            write_embedding(G, os.path.join(directory, "benchmark.emb"), seed=seed)
+            context = dict(graph=G, pajek_file=pajek_file, directory=directory)
+            print("\n######### {} nodes, {} edges #########".format(n_nodes, G.number_of_edges()))
+            for name, setup, unit, max_nodes in cases:
+                record = dict(case=name, nodes=n_nodes, edges=G.number_of_edges(), unit=unit)
+                if max_nodes is not None and n_nodes > max_nodes:
+                    record['skipped'] = "more than {} nodes".format(max_nodes)
+                else:
+                    record.update(run_case(setup, context, repeat))
+                    if 'error' not in record:
+                        record['rss_increase_mb'] = record['peak_rss_mb'] - record['start_rss_mb']
+                        record['throughput'] = record['items'] / max(record['seconds'], 1e-9)
+                results.append(record)
+                print(describe(record))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def describe(record):
+    if 'skipped' in record:
+        return "{:<34} skipped ({})".format(record['case'], record['skipped'])
+    if 'error' in record:
+        return "{:<34} failed: {}".format(record['case'], record['error'].strip().splitlines()[-1])
+    return "{:<34} {:>9.3f}s {:>12.0f} {:<8} peak {:>7.1f} MB (+{:.1f} MB)".format(
+        record['case'], record['seconds'], record['throughput'], record['unit'], record['peak_rss_mb'],
+        record['rss_increase_mb'])
+
+
+def environment(mean_degree, seed, repeat):
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(date=time.strftime("%Y-%m-%d %H:%M:%S"), commit=commit, python=platform.python_version(),
+                numpy=np.__version__, scipy=scipy.__version__, pandas=pd.__version__, sklearn=sklearn.__version__,
+                platform=platform.platform(), cpu_count=os.cpu_count(), mean_degree=mean_degree, seed=seed,
+                repeat=repeat)
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.05, min_mb=5.0):
+    '''
+    Regressions of results against the results of baseline: cases more than
+    tolerance slower, or using more than tolerance more memory, than in the
+    baseline (times under min_seconds and memory increases under min_mb are
+    too noisy to tell).
+    '''
+    reference = {(r['case'], r['nodes']): r for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for record in results:
+        before = reference.get((record['case'], record['nodes']))
+        if before is None or 'seconds' not in record:
+            continue
+        if record['seconds'] > max(before['seconds'], min_seconds) * (1 + tolerance):
+            regressions.append((record, "time", before['seconds'], record['seconds']))
+        if record['rss_increase_mb'] > max(before['rss_increase_mb'], min_mb) * (1 + tolerance):
+            regressions.append((record, "memory", before['rss_increase_mb'], record['rss_increase_mb']))
+    return regressions
+
+
+def write_results(file_name, report):
+    if os.path.dirname(file_name) and not os.path.exists(os.path.dirname(file_name)):
+        os.makedirs(os.path.dirname(file_name))
+    with open(file_name, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the feature generators and pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of nodes of the graphs")
+    parser.add_argument("--cases", nargs="+", default=None, help="names of the cases to run (default: all)")
+    parser.add_argument("--mean-degree", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each case, the fastest is kept")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare with, when the file exists")
+    parser.add_argument("--save-baseline", action="store_true", help="also save the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown (or memory growth) flagged")
+    args = parser.parse_args()
+
+    cases = CASES if args.cases is None else [case for case in CASES if case[0] in args.cases]
+    if args.cases is not None and len(cases) != len(args.cases):
+        parser.error("unknown cases, choose among: {}".format(", ".join(case[0] for case in CASES)))
+    results = run(args.sizes, cases, mean_degree=args.mean_degree, seed=args.seed, repeat=args.repeat)
+    report = dict(environment=environment(args.mean_degree, args.seed, args.repeat), results=results)
+    write_results(args.output, report)
+    print("\nResults written to {}".format(args.output))
+    if args.save_baseline:
+        write_results(args.baseline, report)
+        print("Baseline written to {}".format(args.baseline))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        print("\n######### Against {} ({}) #########".format(args.baseline, baseline['environment'].get('commit')))
+        for record, kind, before, after in regressions:
+            unit = "s" if kind == "time" else " MB"
+            print("REGRESSION {} ({} nodes): {} {:.3f}{} -> {:.3f}{}".format(
+                record['case'], record['nodes'], kind, before, unit, after, unit))
+        print("{} regressions".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,47 @@
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+
+from read_graph import read_graph_csr
+
+# Compares the bulk CSR loader against the former per-edge networkx build
+# (wall time and peak Python heap as seen by tracemalloc).
+
+
+def read_graph_per_edge(file_name, directed=True, threshold=None):
+    G = nx.DiGraph() if directed else nx.Graph()
+    with open(file_name, 'r') as f:
+        n_nodes = int(f.readline().strip().lstrip("*Vertices "))
+        for _ in range(n_nodes):
+            node_id, node_name = f.readline().strip().split()
+            G.add_node(int(node_id), name=node_name)
+        f.readline()
+        for line in f:
+            start_node, end_node, wght = line.strip().split()
+            if threshold is None or float(wght) > threshold:
+                G.add_edge(int(start_node), int(end_node), weight=float(wght))
+    return G
+
+
+def measure(loader, *args, **kwargs):
+    tracemalloc.start()
+    start = time.time()
+    G = loader(*args, **kwargs)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return G, elapsed, peak / 2.0 ** 20
+
+
+if __name__ == '__main__':
+    file_name = sys.argv[1] if len(sys.argv) > 1 else "data/9606.protein.links.v10.5.paj"
+    for directed in [False, True]:
+        G_csr, t_csr, m_csr = measure(read_graph_csr, file_name, directed=directed)
+        G_nx, t_nx, m_nx = measure(read_graph_per_edge, file_name, directed=directed)
+        assert G_csr.number_of_edges() == G_nx.number_of_edges()
+        print("{}: {} nodes, {} edges".format("directed" if directed else "undirected",
+                                             G_csr.number_of_nodes(), G_csr.number_of_edges()))
+        print("\tper-edge networkx: {:.1f}s, peak {:.0f} MB".format(t_nx, m_nx))
+        print("\tbulk CSR:          {:.1f}s, peak {:.0f} MB".format(t_csr, m_csr))
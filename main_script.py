@@ -1,9 +1,10 @@
 # This script contains everything the whole sequence of things to do
 # to get our results.
 
-import networkx as nx
+import argparse
 
 from read_graph import read_graph
+from common.graph import graph_fingerprint
 from common.pipeline import Pipeline
 from common.feature_generators import ExpectedDegree
 from common.feature_generators import ClusteringCoefficient
@@ -14,16 +15,25 @@ from common.feature_generators import HITS
 from common.feature_generators import PageRank
 from common.feature_generators import Log10Wrapper
 from common.feature_generators import NormalizeWrapper
-from common.feature_generators import NeighbouringConductance
+from common.feature_generators import MultiRangeConductance
 from common.feature_generators import FeatureSelector
 from common.feature_generators import ExternalFeature
+from common.feature_generators import Node2Vec
+from common.results import ResultsStore, render
 from validation import compute_correlations
-from prediction import get_labels, train_model, get_and_save_metrics
+from prediction import get_labels, train_models, get_and_save_metrics
 
 
-# Loading PPI graph
+parser = argparse.ArgumentParser()
+parser.add_argument("--no-plots", action="store_true",
+                    help="only save the numbers and curves (plots can be rendered later with python -m common.results)")
+parser.add_argument("--n-jobs", type=int, default=1, help="processes for rendering the plots")
+args = parser.parse_args()
+store = ResultsStore()
+
+# Loading PPI graph (the generators all work on the CSR graph, no networkx graph is built)
 print("\n######### Loading Graph #########")
-Graph = read_graph(directed=False)
+Graph = read_graph(directed=False, as_csr=True)
 print("Loaded graph:\n\t{} nodes\n\t{} edges".format(
     Graph.number_of_nodes(),
     Graph.number_of_edges()
@@ -43,13 +53,11 @@ pipeline = Pipeline(Log10Wrapper(Degree(default_dump=True, default_recomputing=F
                     BetweennessCentrality(),
                     FeatureSelector(HITS())(columns=1),
                     PageRank(),
-                    NeighbouringConductance(range=2),
-                    NeighbouringConductance(range=3),
-                    NeighbouringConductance(range=4),
-                    ExternalFeature(source_file="ppi_32dimq05.emb", name="PPINode2vec"),
+                    MultiRangeConductance(ranges=[2, 3, 4]),
+                    Node2Vec(dimensions=32, q=0.5),
                     ExternalFeature(source_file="ppi_32dim05.emb", name="PPINode2vecsecond"))
 
-features, node_names = pipeline.apply(Graph, verbose=True)
+features, node_names = pipeline.apply(Graph, verbose=True, dump=True)
 
 #########################
 # Class prediction
@@ -59,10 +67,12 @@ print("\n######### Class Prediction #########")
 
 sources = ["mendelian", "cancer", "drugbank"]
 
+labels = get_labels(node_names)
+models = train_models(features, labels, sources, model_dir="output/models", fingerprint=graph_fingerprint(Graph),
+                      features_key=pipeline.get_cache_key(Graph))
 for source in sources:
-    labels = get_labels(node_names)
-    y_test, y_pred, y_score ,model_info= train_model(features, labels, source)
-    get_and_save_metrics(y_test, y_pred, y_score, source,model_info)
+    y_test, y_pred, y_score ,model_info= models[source]
+    get_and_save_metrics(y_test, y_pred, y_score, source,model_info, plot=False, store=store)
 
 #########################
 # Features Correlation
@@ -70,7 +80,11 @@ for source in sources:
 
 print("\n######### Features Correlation #########")
 
-pvalues = compute_correlations(features, sources)
+pvalues = compute_correlations(features, sources, plot=False, store=store)
+
+if not args.no_plots:
+    print("\n######### Plots #########")
+    render(store, n_jobs=args.n_jobs)
 
 # Perform gene set enrichment analysis (GSEA) on a variety of gene sets directories
 gene_sets_directories = [
@@ -1,12 +1,12 @@
 import numpy as np
 import pandas as pd
-import matplotlib
-#%matplotlib inline
-import matplotlib.pyplot as plt
 import json
+import os
+import joblib
 
-from time import strftime
-from validation_import import get_ref_genes
+from time import strftime, time
+from common.results import plot_metrics
+from validation_import import get_all_ref_genes
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegressionCV
 from sklearn.metrics import accuracy_score
@@ -19,47 +19,154 @@ from sklearn.metrics import precision_recall_curve
 from sklearn.metrics import confusion_matrix
 
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv
 from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.model_selection import StratifiedKFold
 from sklearn.svm import SVC
 
 
-def get_labels(node_names):
-    
-    labels = []
-    for source in ['cancer', 'drugbank', 'mendelian']:
-        ref_genes = get_ref_genes(source=source)
-        labels.append(np.array([node in ref_genes for node in node_names]).astype(int))
-    labels = np.asarray(labels).T
-    labels = pd.DataFrame(data=labels, index=node_names, columns=['cancer', 'drugbank', 'mendelian'])
+def get_labels(node_names, sources=("cancer", "drugbank", "mendelian"), molecule_types=("target",),
+               subsets=("all",), extra_sources=None):
+    """
+    0/1 label matrix of node_names, with one column per reference gene list:
+    the sources (and drugbank molecule types and subsets, see
+    get_all_ref_genes), then extra_sources, a dict of name -> genes.
+    """
+    ref_genes = get_all_ref_genes(sources=sources, molecule_types=molecule_types, subsets=subsets)
+    if extra_sources is not None:
+        ref_genes.update(extra_sources)
+    index = pd.Index(node_names)
+    labels = np.empty((len(index), len(ref_genes)), dtype=int)
+    for j, genes in enumerate(ref_genes.values()):
+        labels[:, j] = index.isin(list(genes))
+    labels = pd.DataFrame(data=labels, index=node_names, columns=list(ref_genes))
     
     return labels
 
 
-def train_model(features, labels, source="mendelian"): 
-
-    X_train, X_test, labels_train, labels_test = train_test_split(features, labels, test_size=0.33)
-    y_train = labels_train[source]
-    y_test = labels_test[source]
-    # model = LogisticRegressionCV(Cs=20, penalty='l2')
-    #
-    model = GridSearchCV(n_jobs = 4,cv = 5, refit = True,estimator=RandomForestClassifier(verbose=0,class_weight ="balanced"),param_grid=
-                {"max_depth":[2,4,6],"min_samples_split":[2,4],"max_features":["auto","log2"],"n_estimators" :[20,50,100]})
-
-    X_test = X_test.fillna(0)
-    X_train = X_train.fillna(0)
-    # model = GridSearchCV(n_jobs = 4,cv = 5, refit = True,estimator=SVC(class_weight="balanced",probability=True),param_grid={"C":[1.0,0.5,2.0],"kernel":["rbf","sigmoid"]})
-
-
-    model.fit(X_train, y_train)
-    y_score = model.predict_proba(X_test)[:,1]
-    y_pred = model.predict(X_test)
-
-    model_info = dict(model_info =str(model),best_model_info = str(model.best_estimator_),features = list(features.columns))
-
-    return y_test, y_pred, y_score,model_info
+PARAM_GRID = {"max_depth":[2,4,6],"min_samples_split":[2,4],"max_features":["sqrt","log2"],"n_estimators" :[20,50,100]}
+
+
+def split_and_folds(labels, test_size=0.33, cv=5, random_state=None):
+    """
+    Train/test split and cross-validation folds shared by all the targets,
+    stratified on the combination of labels of each gene (combinations too
+    rare to be stratified on are pooled).
+    Returns the train and test positions and the folds, as (train, test)
+    positions within the training set.
+    """
+    combination = pd.Series(["".join(map(str, row)) for row in np.asarray(labels)])
+    counts = combination.map(combination.value_counts())
+    combination[counts < max(cv, 2)] = "rare"
+    if (combination == "rare").sum() < max(cv, 2):
+        combination[combination == "rare"] = combination.value_counts().index[0]
+    train, test = train_test_split(np.arange(len(combination)), test_size=test_size, random_state=random_state,
+                                   stratify=combination)
+    folds = list(StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state).split(
+        train, combination.values[train]))
+    return train, test, folds
+
+
+def train_models(features, labels, sources=("mendelian", "cancer", "drugbank"), test_size=0.33, cv=5,
+                 n_jobs=-1, search="grid", random_state=None, model_dir=None, fingerprint=None,
+                 features_key=None):
+    """
+    Fit a random forest per source (column of labels) on one shared split
+    and set of folds, selecting the hyperparameters of PARAM_GRID by AUC with
+    an exhaustive search (search="grid") or successive halving over the
+    number of trees (search="halving"). The sources are fitted together, in
+    one joblib job of n_jobs processes (-1 for all cores) split between the
+    sources and their searches.
+    With model_dir, the best model of each source is saved there (see
+    save_model) with the graph fingerprint and the cache key of features.
+    Returns a dict of source -> (y_test, y_pred, y_score, model_info).
+    """
+    if search not in ("grid", "halving"):
+        raise ValueError("Unknown search {}".format(search))
+    X = np.nan_to_num(np.asarray(features, dtype=np.float32))
+    train, test, folds = split_and_folds(labels.loc[:, list(sources)], test_size, cv, random_state)
+    processes = max(1, joblib.cpu_count() + 1 + n_jobs if n_jobs < 0 else n_jobs)
+    outer_jobs = min(len(sources), processes)
+    fitted = joblib.Parallel(n_jobs=outer_jobs)(
+        joblib.delayed(_fit_source)(X, np.asarray(labels[source]), train, test, folds, search,
+                                    max(1, processes // outer_jobs), random_state)
+        for source in sources)
+    results = dict()
+    for source, (model, y_pred, y_score) in zip(sources, fitted):
+        y_test = pd.Series(np.asarray(labels[source])[test], index=labels.index[test], name=source)
+        model_info = dict(model_info =str(model),best_model_info = str(model.best_estimator_),
+                          features = list(features.columns))
+        results[source] = (y_test, y_pred, y_score, model_info)
+        if model_dir is not None:
+            save_model(os.path.join(model_dir, "%s.joblib"%source), model.best_estimator_, source, features,
+                       fingerprint=fingerprint, features_key=features_key, model_info=model_info)
+    return results
+
+
+def _fit_source(X, y, train, test, folds, search, n_jobs, random_state):
+    """
+    Hyperparameter search of train_models for one source. Returns the fitted
+    search and its predictions and scores on the test set.
+    """
+    estimator = RandomForestClassifier(verbose=0, class_weight="balanced", random_state=random_state)
+    if search == "grid":
+        model = GridSearchCV(n_jobs=n_jobs, cv=folds, refit=True, estimator=estimator, param_grid=PARAM_GRID,
+                             scoring="roc_auc")
+    else:
+        # the number of trees is the budget: all candidates get 11 trees, the best third 33, then 99
+        param_grid = {key: value for key, value in PARAM_GRID.items() if key != "n_estimators"}
+        model = HalvingGridSearchCV(n_jobs=n_jobs, cv=folds, refit=True, estimator=estimator,
+                                    param_grid=param_grid, scoring="roc_auc", resource="n_estimators",
+                                    min_resources=11, max_resources=max(PARAM_GRID["n_estimators"]),
+                                    random_state=random_state)
+    model.fit(X[train], y[train])
+    return model, model.predict(X[test]), model.predict_proba(X[test])[:,1]
+
+
+def save_model(path, model, source, features, fingerprint=None, features_key=None, model_info=None):
+    """
+    Save a fitted model with what is needed to score genes with it later: the
+    feature columns it was trained on, the genes (rows) of features, the
+    fingerprint of the graph and the cache key of the feature matrix.
+    """
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    joblib.dump(dict(model=model, source=source, features=list(features.columns), genes=list(features.index),
+                     graph=fingerprint, features_key=features_key, model_info=model_info, created=time()), path)
+
+
+def load_model(path):
+    return joblib.load(path)
+
+
+def score_genes(saved_model, features):
+    """
+    Score of every gene (row of features) with a model loaded by load_model,
+    highest first. The columns the model was trained on are taken by name.
+    """
+    missing = [column for column in saved_model["features"] if column not in features.columns]
+    if missing:
+        raise ValueError("Features missing for the %s model: %s"%(saved_model["source"], ", ".join(missing)))
+    X = np.nan_to_num(np.asarray(features.loc[:, saved_model["features"]], dtype=np.float32))
+    scores = pd.Series(saved_model["model"].predict_proba(X)[:,1], index=features.index, name=saved_model["source"])
+    return scores.sort_values(ascending=False)
+
+
+def train_model(features, labels, source="mendelian", **kwargs):
+    """
+    train_models for a single source.
+    """
+    return train_models(features, labels, sources=[source], **kwargs)[source]
 
     
-def get_and_save_metrics(y_test, y_pred, y_score, source="mendelian",model_info = None):
+def get_and_save_metrics(y_test, y_pred, y_score, source="mendelian",model_info = None, plot=True, store=None):
+    """
+    Print and save the test metrics of a model. The ROC and PR curves go to
+    store (a ResultsStore) when given, and are plotted to
+    output/metrics_<source> unless plot is False (they can then be rendered
+    from the store with common.results.render).
+    """
 
     accuracy = accuracy_score(y_test, y_pred, normalize=True, sample_weight=None)
     avg_precision = average_precision_score(y_test, y_score)
@@ -91,20 +198,13 @@ def get_and_save_metrics(y_test, y_pred, y_score, source="mendelian",model_info
         json.dump(dico_exportation,fp=fi, indent=2)
 
     fpr, tpr, thresholds = roc_curve(y_test, y_score)
-    precision, recall, thresholds = precision_recall_curve(y_test, y_score)
-    plt.figure()
-    plt.subplot(121)
-    plt.plot(fpr, tpr)
-    plt.plot(np.linspace(0,1,10),np.linspace(0,1,10))
-    plt.xlabel("fpr")
-    plt.ylabel("tpr")
-    plt.title("ROC curve %s"%source)
-    plt.subplot(122)
-    plt.plot(recall, precision)
-    plt.xlabel("recall")
-    plt.ylabel("precision")
-    plt.title("PR curve %s"%source)
-    plt.savefig("output/metrics_%s"%source)
+    precision, recall_curve, thresholds = precision_recall_curve(y_test, y_score)
+    curves = dict(fpr=fpr, tpr=tpr, precision=precision, recall=recall_curve)
+    if store is not None:
+        store.add("metrics_%s"%source, "metrics", curves, title=source, plot_file="output/metrics_%s"%source,
+                  metrics=dict(accuracy=accuracy, average_precision=avg_precision, f1=f1, recall=recall, auc=auc))
+    if plot:
+        plot_metrics(curves, source, "output/metrics_%s"%source)
     
     
     
\ No newline at end of file
@@ -1,30 +1,91 @@
-from tqdm import tqdm
-import networkx as nx
+import itertools
+import os
 
+import numpy as np
+import pandas as pd
 
-def read_graph(file_name = "data/9606.protein.links.v10.5.paj",directed = True, threshold = None):
-    if directed:
-        G = nx.DiGraph()
-    else:
-        G = nx.Graph()
-    nodes_names=dict()
+from common.graph import CSRGraph, bundle_path
 
+
+def read_graph(file_name = "data/9606.protein.links.v10.5.paj",directed = True, threshold = None, as_csr = False):
+    '''
+    Load the Pajek graph. Returns a networkx graph, or the CSRGraph it is built
+    from if as_csr is True.
+    file_name may also be a binary bundle (see Binaryconverter.py); a bundle
+    converted from file_name is used instead of the text file when present.
+    '''
+    G = load_graph_bundle(file_name, directed=directed, threshold=threshold)
+    if G is None:
+        G = read_graph_csr(file_name, directed=directed, threshold=threshold)
+    if as_csr:
+        return G
+    return G.to_networkx()
+
+
+def read_graph_csr(file_name = "data/9606.protein.links.v10.5.paj", directed = True, threshold = None,
+                   chunksize = 1000000):
+    '''
+    Parse the Pajek file in chunks straight into a CSRGraph, keeping only the
+    edges whose weight is above threshold.
+    '''
     with open(file_name,'r') as f:
         header1 = f.readline().strip().lstrip("*Vertices ")
         n_nodes = int(header1)
-        for _ in tqdm(range(n_nodes), desc="reading nodes"):
-            line = f.readline()
-            node_id,node_name = line.strip().split()
-            node_id =int(node_id)
-            G.add_node(node_id, name=node_name)
-            nodes_names[node_id]=node_name
+        node_names = np.empty(n_nodes, dtype=object)
+        for line in itertools.islice(f, n_nodes):
+            node_id, node_name = line.split()
+            node_names[int(node_id)] = node_name
+        node_names = node_names.astype(str)
 
         header2 = f.readline()
         print("reading edges...")
-        for line in f:
-            start_node, end_node,wght = line.strip().split()
-            if threshold is None or float(wght) > threshold:
-                G.add_edge(int(start_node),int(end_node),weight = float(wght))
-        f.close()  # with open(...) does it already
+        src, dst, wght = [np.empty(0, np.int32)], [np.empty(0, np.int32)], [np.empty(0, np.float32)]
+        chunks = pd.read_csv(f, sep=' ', header=None, names=['start', 'end', 'weight'],
+                             dtype={'start': np.int32, 'end': np.int32, 'weight': np.float32},
+                             engine='c', chunksize=chunksize)
+        for chunk in chunks:
+            if threshold is not None:
+                chunk = chunk[chunk['weight'].values > threshold]
+            src.append(chunk['start'].values)
+            dst.append(chunk['end'].values)
+            wght.append(chunk['weight'].values)
+
+    return CSRGraph.from_edges(np.concatenate(src), np.concatenate(dst), np.concatenate(wght), node_names,
+                               directed=directed, threshold=threshold)
+
+
+def load_graph_bundle(file_name, directed=True, threshold=None):
+    '''
+    Memory-map the binary bundle for file_name, or return None if there is no
+    usable one: the bundle converted with threshold, or else the full one,
+    filtered. Bundles older than file_name are ignored.
+    '''
+    if os.path.isdir(file_name):
+        return check_bundle(CSRGraph.load(file_name), file_name, directed, threshold)
+    for bundle_threshold in ([threshold, None] if threshold is not None else [None]):
+        path = bundle_path(file_name, directed=directed, threshold=bundle_threshold)
+        if not os.path.isdir(path):
+            continue
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(file_name) and os.path.getmtime(meta_file) < os.path.getmtime(file_name):
+            print("{} is older than {}, ignored".format(path, file_name))
+            continue
+        G = CSRGraph.load(path)
+        if G.threshold is not None and (threshold is None or threshold < G.threshold):
+            # a bundle missing edges (written before thresholded bundles had their own path)
+            continue
+        return check_bundle(G, path, directed, threshold)
+    return None
+
 
+def check_bundle(G, path, directed=True, threshold=None):
+    '''
+    G, the graph of the bundle at path, filtered to threshold.
+    '''
+    if G.directed != directed:
+        raise ValueError("{} holds a {}directed graph".format(path, "" if G.directed else "un"))
+    if G.threshold is not None and (threshold is None or threshold < G.threshold):
+        raise ValueError("{} was converted with threshold {}".format(path, G.threshold))
+    if threshold is not None and threshold != G.threshold:
+        G = G.filter(threshold)
     return G
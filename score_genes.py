@@ -0,0 +1,36 @@
+import argparse
+import os
+
+import pandas as pd
+
+from common.cache import CACHE_DIR, FeatureCache
+from prediction import load_model, score_genes
+
+# Scores every gene with the models saved by main_script.py (output/models/),
+# from the feature matrix it left in the feature cache: no graph loading,
+# feature computation or grid search involved.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("models", nargs="+", help="saved models, e.g. output/models/mendelian.joblib")
+parser.add_argument("--cache-directory", default=CACHE_DIR)
+parser.add_argument("--output-directory", default="output")
+parser.add_argument("--top", type=int, default=20, help="number of genes to print")
+args = parser.parse_args()
+
+cache = FeatureCache(args.cache_directory)
+for path in args.models:
+    saved_model = load_model(path)
+    matrix = None if saved_model["features_key"] is None else cache.get(saved_model["features_key"])
+    if matrix is None:
+        raise SystemExit("The features of {} are not in {}: run the pipeline with dump=True first".format(
+            path, args.cache_directory))
+    features = pd.DataFrame(matrix, index=saved_model["genes"], columns=saved_model["features"], copy=False)
+    scores = score_genes(saved_model, features)
+    if saved_model["graph"] is not None:
+        print("{} model, graph of {} nodes/{} edges (threshold {})".format(
+            saved_model["source"], saved_model["graph"]["n_nodes"], saved_model["graph"]["n_edges"],
+            saved_model["graph"]["threshold"]))
+    output_file = os.path.join(args.output_directory, "scores_{}.csv".format(saved_model["source"]))
+    scores.to_csv(output_file, header=True)
+    print("Scores of {} genes written to {}".format(len(scores), output_file))
+    print(scores.head(args.top).to_string())
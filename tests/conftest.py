@@ -0,0 +1,51 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.graph import CSRGraph, EdgeDiff
+
+
+@pytest.fixture
+def random_graph():
+    '''
+    Builder of a random graph with STRING-like weights (150 to 999), as a
+    CSRGraph and as the networkx graph it is converted from.
+    '''
+    def build(n=60, p=0.1, directed=False, seed=0):
+        Graph = nx.gnp_random_graph(n, p, seed=seed, directed=directed)
+        rng = np.random.RandomState(seed)
+        for u, v in Graph.edges():
+            Graph[u][v]['weight'] = float(rng.randint(150, 1000))
+        for i in Graph.nodes():
+            Graph.nodes[i]['name'] = "9606.ENSP{:011d}".format(i)
+        return CSRGraph.from_networkx(Graph), Graph
+    return build
+
+
+@pytest.fixture
+def random_diff():
+    '''
+    Builder of an EdgeDiff adding, removing and reweighting n_changes edges
+    each of the networkx graph Graph, and of Graph with the same changes.
+    '''
+    def build(Graph, n_changes=6, seed=0, added=True, removed=True):
+        rng = np.random.RandomState(seed)
+        edges = list(Graph.edges())
+        picked = [edges[i] for i in rng.choice(len(edges), 2 * n_changes, replace=False)]
+        gone, reweighted = (picked[:n_changes] if removed else []), picked[n_changes:]
+        new = []
+        while added and len(new) < n_changes:
+            u, v = rng.randint(0, Graph.number_of_nodes(), 2)
+            if u != v and not Graph.has_edge(u, v) and (u, v) not in new and (v, u) not in new:
+                new.append((u, v))
+        weights = rng.randint(150, 1000, 2 * n_changes).astype(float)
+        H = Graph.copy()
+        H.remove_edges_from(gone)
+        H.add_weighted_edges_from([(u, v, w) for (u, v), w in zip(new, weights)])
+        H.add_weighted_edges_from([(u, v, w) for (u, v), w in zip(reweighted, weights[n_changes:])])
+        def ends(edges):
+            return np.array([u for u, v in edges], dtype=np.int64), np.array([v for u, v in edges], dtype=np.int64)
+        diff = EdgeDiff(added=ends(new) + (weights[:len(new)],), removed=ends(gone),
+                        reweighted=ends(reweighted) + (weights[n_changes:],))
+        return diff, H
+    return build
@@ -0,0 +1,98 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from common.cache import FeatureCache, cache_key
+from common.feature_generators import BetweennessCentrality, ClusteringCoefficient, MultiRangeConductance, \
+    NeighbouringConductance
+
+
+def fingerprint(n_nodes=10):
+    return dict(n_nodes=n_nodes, n_edges=20, threshold=None, directed=False, checksum="0" * 40)
+
+
+@pytest.mark.parametrize("storage", ["npy", "npz", "pickle"])
+def test_cache_round_trip(tmp_path, storage):
+    cache = FeatureCache(str(tmp_path), storage=storage)
+    result = np.random.RandomState(0).rand(10, 3)
+    key = cache_key(dict(generator="Test"), fingerprint())
+    assert cache.get(key) is None
+    cache.put(key, result, "test", dict(generator="Test"), fingerprint())
+    np.testing.assert_array_equal(cache.get(key), result)
+    assert isinstance(cache.get(key), np.memmap) == (storage == "npy")
+    assert cache.read_manifest()[key]['format'] == storage
+    assert cache.verify() == []
+
+
+def test_cache_keeps_other_results_as_pickle(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    result = dict(a=[1, 2], b="c")
+    cache.put("key", result, "test", dict(generator="Test"), fingerprint())
+    assert cache.get("key") == result
+    assert cache.read_manifest()["key"]['format'] == "pickle"
+
+
+def test_cache_key_depends_on_parameters_and_graph():
+    description = BetweennessCentrality(k=10).describe()
+    key = cache_key(description, fingerprint())
+    assert cache_key(BetweennessCentrality(k=10, n_jobs=4).describe(), fingerprint()) == key
+    assert cache_key(BetweennessCentrality(k=20).describe(), fingerprint()) != key
+    assert cache_key(description, fingerprint(11)) != key
+
+
+def test_generator_results_go_through_the_cache(tmp_path, random_graph):
+    G, Graph = random_graph()
+    g = ClusteringCoefficient()
+    g.cache = FeatureCache(str(tmp_path))
+    result = g.apply(G)
+    np.testing.assert_array_equal(g.load_from_cache(G), result)
+    # the same generator on another graph, or with other parameters, misses
+    assert g.load_from_cache(G.filter(500)) is None
+    other = ClusteringCoefficient(weighted=True)
+    other.cache = g.cache
+    assert other.load_from_cache(G) is None
+
+
+def test_cache_convert_prune_and_evict(tmp_path):
+    cache = FeatureCache(str(tmp_path), storage='pickle')
+    results = [np.arange(100.0) * i for i in range(3)]
+    for i, result in enumerate(results):
+        cache.put("key{}".format(i), result, "test{}".format(i), dict(generator="Test"), fingerprint())
+    assert cache.convert('npy') == 3
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(cache.get("key{}".format(i)), result)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(["manifest.json", "manifest.json.lock"]
+                                                       + [entry['file'] for _, entry in cache.entries()])
+    # a stray file, a corrupted entry, then the least recently used entries are removed
+    open(str(tmp_path / "_featurecache_stray.npy"), 'w').close()
+    with open(cache.entry_path(cache.read_manifest()["key1"]), 'ab') as f:
+        f.write(b"0")
+    assert cache.prune() == 2
+    assert sorted(key for key, _ in cache.entries()) == ["key0", "key2"]
+    cache.get("key0")
+    cache.evict(cache.read_manifest()["key0"]['size'])
+    assert [key for key, _ in cache.entries()] == ["key0"]
+
+
+def test_migrate_legacy_pickles(tmp_path, random_graph):
+    G, Graph = random_graph()
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    columns = []
+    for r in (2, 3):
+        g = NeighbouringConductance(range=r)
+        columns.append(g.compute(G))
+        with open(str(legacy / "_featurecache_{}.pkl".format(g.get_name())), 'wb') as f:
+            pickle.dump(columns[-1], f)
+    cache = FeatureCache(str(tmp_path / "cache"))
+    generators = [NeighbouringConductance(range=2), NeighbouringConductance(range=3),
+                  MultiRangeConductance(ranges=[2, 3]), NeighbouringConductance(range=4)]
+    imported = cache.migrate_legacy(G, generators, str(legacy), remove=True)
+    assert imported == [g.get_name() for g in generators[:3]]
+    assert os.listdir(str(legacy)) == []
+    multi = MultiRangeConductance(ranges=[2, 3])
+    multi.cache = cache
+    np.testing.assert_array_equal(multi.load_from_cache(G), np.column_stack(columns))
+    np.testing.assert_array_equal(multi.load_from_cache(G), multi.compute(G))
@@ -0,0 +1,71 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.centrality import betweenness_centrality, closeness_centrality, hits, pagerank, sampling_error_bound
+
+
+def as_array(scores, n):
+    return np.array([scores[i] for i in range(n)])
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_pagerank_matches_networkx(random_graph, directed):
+    G, Graph = random_graph(n=80, p=0.06, directed=directed)
+    scores, n_iter = pagerank(G.adjacency(), tol=1.0e-10)
+    expected = as_array(nx.pagerank(Graph, tol=1.0e-10), G.number_of_nodes())
+    np.testing.assert_allclose(scores, expected, atol=1.0e-8)
+    assert n_iter > 1
+
+
+def test_pagerank_personalization_and_warm_start(random_graph):
+    G, Graph = random_graph(n=80, p=0.06, directed=True)
+    personalization = np.random.RandomState(1).rand(G.number_of_nodes())
+    scores, n_iter = pagerank(G.adjacency(), personalization=personalization, tol=1.0e-10)
+    expected = nx.pagerank(Graph, personalization=dict(enumerate(personalization)), tol=1.0e-10)
+    np.testing.assert_allclose(scores, as_array(expected, G.number_of_nodes()), atol=1.0e-8)
+    # starting from the solution converges at once
+    warm, warm_iter = pagerank(G.adjacency(), personalization=personalization, nstart=scores, tol=1.0e-10)
+    np.testing.assert_allclose(warm, scores, atol=1.0e-8)
+    assert warm_iter < n_iter
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("method", ["svd", "power"])
+def test_hits_matches_networkx(random_graph, directed, method):
+    G, Graph = random_graph(n=80, p=0.08, directed=directed, seed=2)
+    hubs, authorities, _ = hits(G.adjacency(), method=method, max_iter=1000, tol=1.0e-12)
+    expected_hubs, expected_authorities = nx.hits(Graph, tol=1.0e-12)
+    n = G.number_of_nodes()
+    np.testing.assert_allclose(hubs, as_array(expected_hubs, n), atol=1.0e-6)
+    np.testing.assert_allclose(authorities, as_array(expected_authorities, n), atol=1.0e-6)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_betweenness_matches_networkx(random_graph, directed):
+    G, Graph = random_graph(n=60, p=0.08, directed=directed)
+    expected = as_array(nx.betweenness_centrality(Graph), G.number_of_nodes())
+    np.testing.assert_allclose(betweenness_centrality(G), expected, atol=1.0e-12)
+    np.testing.assert_allclose(betweenness_centrality(G, n_jobs=2), expected, atol=1.0e-12)
+    # pivots covering every node give the exact scores
+    np.testing.assert_allclose(betweenness_centrality(G, k=G.number_of_nodes(), seed=0), expected, atol=1.0e-12)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_closeness_matches_networkx(random_graph, directed):
+    G, Graph = random_graph(n=60, p=0.05, directed=directed)
+    expected = as_array(nx.closeness_centrality(Graph), G.number_of_nodes())
+    closeness, diameter = closeness_centrality(G)
+    np.testing.assert_allclose(closeness, expected, atol=1.0e-12)
+    np.testing.assert_allclose(closeness_centrality(G, n_jobs=2)[0], expected, atol=1.0e-12)
+    np.testing.assert_allclose(closeness_centrality(G, k=G.number_of_nodes(), seed=0)[0], expected, atol=1.0e-12)
+    lengths = dict(nx.all_pairs_shortest_path_length(Graph))
+    assert diameter == max(max(d.values()) for d in lengths.values())
+
+
+def test_sampled_betweenness_within_bound(random_graph):
+    G, Graph = random_graph(n=150, p=0.05, seed=3)
+    k = 50
+    expected = as_array(nx.betweenness_centrality(Graph), G.number_of_nodes())
+    estimate = betweenness_centrality(G, k=k, seed=0)
+    assert np.abs(estimate - expected).max() < sampling_error_bound(G.number_of_nodes(), k)
@@ -0,0 +1,41 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.clustering import clustering, clustering_sweep
+from common.graph import CSRGraph
+
+
+def as_array(scores, n):
+    return np.array([scores[i] for i in range(n)])
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("weighted", [False, True])
+def test_clustering_matches_networkx(random_graph, directed, weighted):
+    G, Graph = random_graph(n=70, p=0.12, directed=directed)
+    expected = as_array(nx.clustering(Graph, weight='weight' if weighted else None), G.number_of_nodes())
+    np.testing.assert_allclose(clustering(G, weighted=weighted), expected, atol=1.0e-12)
+    # split in small chunks over two processes, or for some nodes only
+    np.testing.assert_allclose(clustering(G, weighted=weighted, n_jobs=2, chunk_size=8), expected, atol=1.0e-12)
+    nodes = np.arange(0, G.number_of_nodes(), 3)
+    np.testing.assert_allclose(clustering(G, weighted=weighted, nodes=nodes), expected[nodes], atol=1.0e-12)
+
+
+def test_clustering_ignores_self_loops(random_graph):
+    G, Graph = random_graph(n=40, p=0.2)
+    Graph.add_edge(0, 0, weight=500.0)
+    Graph.add_edge(5, 5, weight=900.0)
+    expected = as_array(nx.clustering(Graph), Graph.number_of_nodes())
+    np.testing.assert_allclose(clustering(CSRGraph.from_networkx(Graph)), expected, atol=1.0e-12)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_clustering_sweep_matches_filtered_graphs(random_graph, weighted):
+    G, Graph = random_graph(n=70, p=0.15)
+    thresholds = [800, 300, 550, 150]
+    results = clustering_sweep(G, thresholds, weighted=weighted)
+    for threshold in thresholds:
+        # the weighted triangles are float32 products, summed in another order
+        np.testing.assert_allclose(results[threshold], clustering(G.filter(threshold), weighted=weighted),
+                                   rtol=1.0e-6, atol=1.0e-12)
@@ -0,0 +1,36 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.conductance import neighbouring_conductance
+
+
+def ball_conductance(Graph, node, r):
+    '''
+    networkx conductance of the ball of the nodes within r - 1 hops of node.
+    '''
+    ball = nx.single_source_shortest_path_length(Graph, node, cutoff=r - 1)
+    try:
+        return nx.conductance(Graph, list(ball))
+    except ZeroDivisionError:
+        return np.nan
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("p", [0.04, 0.1])
+def test_conductance_matches_networkx(random_graph, directed, p):
+    # in the denser graph, the larger balls cover most of the graph and are counted from the outside
+    G, Graph = random_graph(n=80, p=p, directed=directed)
+    ranges = [1, 2, 3, 4]
+    result = neighbouring_conductance(G, ranges)
+    expected = np.array([[ball_conductance(Graph, x, r) for r in ranges] for x in range(G.number_of_nodes())])
+    np.testing.assert_allclose(result, expected, atol=1.0e-12)
+    np.testing.assert_allclose(neighbouring_conductance(G, ranges, n_jobs=2), expected, atol=1.0e-12)
+    nodes = np.array([3, 17, 42])
+    np.testing.assert_allclose(neighbouring_conductance(G, [3, 2], nodes=nodes), expected[nodes][:, [2, 1]],
+                               atol=1.0e-12)
+
+
+def test_conductance_of_isolated_nodes_is_nan(random_graph):
+    G, Graph = random_graph(n=30, p=0.0)
+    assert np.isnan(neighbouring_conductance(G, [1, 2])).all()
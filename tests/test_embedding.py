@@ -0,0 +1,139 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.cache import FeatureCache
+from common.embedding import alias_tables, load_embedding, node2vec_walks, read_embedding, skipgram
+from common.graph import CSRGraph
+
+
+def alias_distribution(indptr, prob, alias):
+    '''
+    Probability of drawing each entry of its row from the alias tables.
+    '''
+    drawn = np.zeros(len(prob))
+    for start, end in zip(indptr[:-1], indptr[1:]):
+        for k in range(start, end):
+            drawn[k] += prob[k] / (end - start)
+            drawn[alias[k]] += (1.0 - prob[k]) / (end - start)
+    return drawn
+
+
+def test_alias_tables_are_exact():
+    rng = np.random.RandomState(0)
+    degrees = np.concatenate([rng.randint(0, 12, 200), [0, 1, 50]])
+    indptr = np.concatenate([[0], np.cumsum(degrees)])
+    weights = rng.randint(150, 1000, indptr[-1]).astype(float)
+    # rows with one very heavy entry, with equal weights, and with weights of zero
+    weights[indptr[-2]] = 1.0e6
+    weights[indptr[5]:indptr[6]] = 300.0
+    weights[indptr[7]:indptr[8]] = 0.0
+    prob, alias = alias_tables(indptr, weights)
+    rows = np.repeat(np.arange(len(degrees)), degrees)
+    assert ((prob >= 0) & (prob <= 1)).all()
+    assert (rows[alias] == rows).all()
+    totals = np.bincount(rows, weights=weights, minlength=len(degrees))[rows]
+    expected = np.where(totals > 0, weights / np.where(totals > 0, totals, 1), 1.0 / degrees[rows])
+    np.testing.assert_allclose(alias_distribution(indptr, prob, alias), expected, atol=1.0e-12)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_node2vec_walks_follow_edges(random_graph, directed):
+    G, Graph = random_graph(n=60, p=0.05, directed=directed)
+    walks = node2vec_walks(G, walk_length=12, num_walks=3, p=0.5, q=2.0, weighted=True, seed=1)
+    n = G.number_of_nodes()
+    assert walks.shape == (3 * n, 12)
+    for r in range(3):
+        assert sorted(walks[r * n:(r + 1) * n, 0]) == list(range(n))
+    for walk in walks:
+        length = np.count_nonzero(walk >= 0)
+        assert (walk[length:] == -1).all()
+        assert all(Graph.has_edge(u, v) for u, v in zip(walk[:length - 1], walk[1:length]))
+        # walks only stop on a node without out-edges
+        assert length == 12 or Graph.out_degree(walk[length - 1]) == 0 if directed else length in (1, 12)
+    np.testing.assert_array_equal(node2vec_walks(G, walk_length=12, num_walks=3, p=0.5, q=2.0, weighted=True,
+                                                 seed=1, n_jobs=2), walks)
+    assert not np.array_equal(node2vec_walks(G, walk_length=12, num_walks=3, p=0.5, q=2.0, weighted=True, seed=2),
+                              walks)
+
+
+def test_node2vec_transition_probabilities():
+    # from 0 to 1, then back to 0 (1 / p), to 2, a neighbour of 0 (1), or to 3 (1 / q), in 200 copies of the
+    # graph so that each round draws many walks
+    copies = 200
+    Graph = nx.Graph()
+    for c in range(copies):
+        Graph.add_weighted_edges_from([(4 * c + u, 4 * c + v, w) for u, v, w in
+                                       [(0, 1, 200.0), (0, 2, 600.0), (1, 2, 300.0), (1, 3, 900.0)]])
+    nx.set_node_attributes(Graph, {i: str(i) for i in Graph}, 'name')
+    G = CSRGraph.from_networkx(Graph)
+    p, q = 0.5, 4.0
+    walks = node2vec_walks(G, walk_length=3, num_walks=200, p=p, q=q, weighted=True, seed=0) % 4
+    first = walks[walks[:, 0] == 0, 1]
+    np.testing.assert_allclose(np.bincount(first, minlength=4) / len(first), [0, 0.25, 0.75, 0], atol=0.01)
+    second = walks[(walks[:, 0] == 0) & (walks[:, 1] == 1), 2]
+    expected = np.array([200.0 / p, 0, 300.0, 900.0 / q])
+    np.testing.assert_allclose(np.bincount(second, minlength=4) / len(second), expected / expected.sum(), atol=0.02)
+
+
+def test_skipgram_separates_communities():
+    Graph = nx.planted_partition_graph(2, 40, 0.3, 0.01, seed=0)
+    nx.set_node_attributes(Graph, {i: str(i) for i in Graph}, 'name')
+    G = CSRGraph.from_networkx(Graph)
+    walks = node2vec_walks(G, walk_length=20, num_walks=10, seed=0)
+    vectors = skipgram(walks, G.number_of_nodes(), dimensions=16, window=5, epochs=5, seed=0)
+    np.testing.assert_array_equal(skipgram(walks, G.number_of_nodes(), dimensions=16, window=5, epochs=5, seed=0),
+                                  vectors)
+    unit = vectors / np.linalg.norm(vectors, axis=1)[:, None]
+    similarity = unit @ unit.T
+    community = np.arange(G.number_of_nodes()) // 40
+    same = community[:, None] == community[None, :]
+    np.fill_diagonal(same, False)
+    different = community[:, None] != community[None, :]
+    assert similarity[same].mean() > similarity[different].mean() + 0.3
+    # each node is closer to its own community on average
+    assert ((similarity * same).sum(axis=1) / same.sum(axis=1) > (similarity * different).mean(axis=1) * 2).all()
+
+
+def write_embedding(path, header, rows):
+    path.write_text(header + "\n" + "".join(" ".join(str(x) for x in row) + "\n" for row in rows))
+    return str(path)
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 2, 3, 6])
+def test_read_embedding_fills_left_out_nodes_with_zeros(tmp_path, chunksize):
+    # 6 of 8 nodes, as node2vec writes them (header: the vectors written), in chunks ending on the last line or not
+    rows = [[7, 0.5, -1.0], [0, 1.0, 2.0], [3, 1.5e-3, 4.0], [1, -2.0, 0.0], [5, 3.0, 3.0], [2, 0.25, 1.0]]
+    path = write_embedding(tmp_path / "short.emb", "6 2", rows)
+    expected = np.zeros((8, 2))
+    for row in rows:
+        expected[row[0]] = row[1:]
+    np.testing.assert_array_equal(read_embedding(path, nodes=8, chunksize=chunksize), expected)
+    # by default, the nodes of the header
+    full = write_embedding(tmp_path / "full.emb", "8 2", rows)
+    np.testing.assert_array_equal(read_embedding(full, chunksize=chunksize), expected)
+    cache = FeatureCache(str(tmp_path / "cache"))
+    np.testing.assert_array_equal(load_embedding(path, nodes=8, cache=cache, chunksize=chunksize), expected)
+    np.testing.assert_array_equal(load_embedding(path, nodes=9, cache=cache), np.vstack([expected, np.zeros((1, 2))]))
+
+
+@pytest.mark.parametrize("header, rows, nodes, chunksize", [
+    ("3", [[0, 1.0]], None, None),
+    ("3 two", [[0, 1.0, 2.0]], None, None),
+    ("3 2 1", [[0, 1.0, 2.0]], None, None),
+    ("", [], None, None),
+    # more vectors than the header states, or than the nodes
+    ("2 1", [[0, 1.0], [1, 1.0], [2, 1.0]], 5, 2),
+    ("4 1", [[0, 1.0]], 3, None),
+    # width
+    ("2 2", [[0, 1.0, 2.0], [1, 1.0]], None, None),
+    # out of range, non-integer and repeated ids, the repeat in the next chunk
+    ("2 1", [[0, 1.0], [4, 1.0]], 4, None),
+    ("2 1", [[0, 1.0], [-1, 1.0]], None, None),
+    ("2 1", [[0, 1.0], [1.5, 1.0]], None, None),
+    ("3 1", [[0, 1.0], [1, 1.0], [0, 1.0]], None, 2),
+])
+def test_read_embedding_rejects_malformed_files(tmp_path, header, rows, nodes, chunksize):
+    path = write_embedding(tmp_path / "bad.emb", header, rows)
+    with pytest.raises(ValueError):
+        read_embedding(path, nodes=nodes, chunksize=chunksize)
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from common.graph import BUNDLE_ARRAYS, CSRGraph, bundle_path
+from read_graph import read_graph, read_graph_csr
+
+
+def write_pajek(Graph, file_name):
+    with open(file_name, 'w') as f:
+        f.write("*Vertices {}\n".format(Graph.number_of_nodes()))
+        for i in range(Graph.number_of_nodes()):
+            f.write("{} {}\n".format(i, Graph.nodes[i]['name']))
+        f.write("*arcs\n" if Graph.is_directed() else "*edges\n")
+        for u, v, w in Graph.edges(data='weight'):
+            f.write("{} {} {:g}\n".format(u, v, w))
+
+
+def assert_same_graph(G, H):
+    for name in BUNDLE_ARRAYS:
+        if getattr(G, name) is None:
+            assert getattr(H, name) is None
+        else:
+            np.testing.assert_array_equal(getattr(G, name), getattr(H, name))
+    assert G.directed == H.directed
+    assert G.threshold == H.threshold
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_bundle_round_trip(tmp_path, random_graph, directed):
+    G, Graph = random_graph(directed=directed)
+    G.save(str(tmp_path / "bundle"))
+    H = CSRGraph.load(str(tmp_path / "bundle"))
+    assert_same_graph(G, H)
+    assert H.fingerprint() == G.fingerprint()
+    assert sorted(H.to_networkx().edges(data='weight')) == sorted(Graph.edges(data='weight'))
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_networkx_round_trip(random_graph, directed):
+    G, Graph = random_graph(directed=directed)
+    assert_same_graph(CSRGraph.from_networkx(G.to_networkx()), G)
+    assert G.number_of_edges() == Graph.number_of_edges()
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_read_graph_from_text_and_bundle(tmp_path, random_graph, directed):
+    G, Graph = random_graph(directed=directed)
+    file_name = str(tmp_path / "graph.paj")
+    write_pajek(Graph, file_name)
+    text = read_graph_csr(file_name, directed=directed)
+    assert sorted(text.to_networkx().edges(data='weight')) == sorted(Graph.edges(data='weight'))
+
+    text.save(bundle_path(file_name, directed=directed))
+    assert_same_graph(read_graph(file_name, directed=directed, as_csr=True), text)
+    assert_same_graph(read_graph(file_name, directed=directed, threshold=500, as_csr=True),
+                      read_graph_csr(file_name, directed=directed, threshold=500))
+
+
+def test_thresholded_bundle_is_not_the_full_graph(tmp_path, random_graph):
+    G, Graph = random_graph()
+    file_name = str(tmp_path / "graph.paj")
+    write_pajek(Graph, file_name)
+    read_graph_csr(file_name, directed=False, threshold=600).save(bundle_path(file_name, directed=False, threshold=600))
+    assert read_graph(file_name, directed=False, as_csr=True).number_of_edges() == Graph.number_of_edges()
+    assert_same_graph(read_graph(file_name, directed=False, threshold=600, as_csr=True),
+                      read_graph_csr(file_name, directed=False, threshold=600))
+    with pytest.raises(ValueError):
+        read_graph(bundle_path(file_name, directed=False, threshold=600), directed=False, as_csr=True)
+
+
+def test_stale_bundle_is_ignored(tmp_path, random_graph):
+    G, Graph = random_graph()
+    file_name = str(tmp_path / "graph.paj")
+    write_pajek(Graph, file_name)
+    path = bundle_path(file_name, directed=False)
+    # a bundle of another graph, older than the text file
+    other = G.filter(600)
+    other.threshold = None
+    other.save(path)
+    assert read_graph(file_name, directed=False, as_csr=True).number_of_edges() == other.number_of_edges()
+    stamp = os.path.getmtime(file_name) - 10
+    os.utime(os.path.join(path, 'meta.json'), (stamp, stamp))
+    assert read_graph(file_name, directed=False, as_csr=True).number_of_edges() == Graph.number_of_edges()
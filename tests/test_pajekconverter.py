@@ -0,0 +1,48 @@
+import pytest
+
+from common.graph import CSRGraph, bundle_path
+from Pajekconverter import convert
+from read_graph import read_graph_csr
+
+# STRING-like links: both directions of A-B (in two chunks of 2 rows, and
+# repeated), C-D in one direction only, a self-loop, E-F with another weight
+# in the reverse row
+LINKS = """protein1 protein2 combined_score
+9606.A 9606.B 900
+9606.C 9606.D 400
+9606.E 9606.E 700
+9606.B 9606.A 900
+9606.F 9606.E 300
+9606.E 9606.F 350
+9606.A 9606.B 900
+"""
+
+
+def named_edges(G, directed):
+    edges = G.to_networkx().edges(data='weight')
+    if directed:
+        return sorted((G.node_names[u], G.node_names[v], w) for u, v, w in edges)
+    return sorted(tuple(sorted((G.node_names[u], G.node_names[v]))) + (w,) for u, v, w in edges)
+
+
+@pytest.mark.parametrize("chunksize", [2, 100])
+def test_undirected_conversion_keeps_every_link_once(tmp_path, chunksize):
+    links = tmp_path / "links.txt"
+    links.write_text(LINKS)
+    output = str(tmp_path / "links.paj")
+    convert([str(links)], output, undirected=True, binary=True, chunksize=chunksize)
+    expected = [("9606.A", "9606.B", 900.0), ("9606.C", "9606.D", 400.0), ("9606.E", "9606.E", 700.0),
+                ("9606.E", "9606.F", 300.0)]
+    assert named_edges(read_graph_csr(output, directed=False), False) == expected
+    assert named_edges(CSRGraph.load(bundle_path(output, directed=False)), False) == expected
+
+
+def test_directed_conversion_keeps_every_row(tmp_path):
+    links = tmp_path / "links.txt"
+    # without the repeated row, which the bundle would hold twice (its rows are assumed distinct)
+    links.write_text(LINKS.rsplit("9606.A 9606.B", 1)[0])
+    output = str(tmp_path / "links.paj")
+    convert([str(links)], output, binary=True, chunksize=2)
+    G = read_graph_csr(output, directed=True)
+    assert len(G.indices) == 6
+    assert named_edges(CSRGraph.load(bundle_path(output, directed=True)), True) == named_edges(G, True)
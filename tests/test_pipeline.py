@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.cache import FeatureCache
+from common.feature_generators import ClusteringCoefficient, Degree, ExpectedDegree, FeatureSelector, HITS, \
+    Log10Wrapper, MultiRangeConductance, NeighbouringConductance, NormalizeWrapper, PageRank
+from common.gene_ids import MAPPING_FILE, load_gene_index
+from common.graph import CSRGraph
+from common.pipeline import Pipeline
+
+
+@pytest.fixture(scope="module", autouse=True)
+def gene_index(tmp_path_factory):
+    # kept in memory for the whole run once loaded from a temporary file, so that nothing is written to data/cache
+    load_gene_index(cache_file=str(tmp_path_factory.mktemp("genes") / "gene_ids.pkl"))
+
+
+@pytest.fixture
+def gene_graph(random_graph):
+    '''
+    Builder of a random graph on STRING ids of the gene mapping file, every
+    fifth node having an id without gene symbol.
+    '''
+    ids = pd.read_csv(MAPPING_FILE).iloc[:, 2].drop_duplicates().tolist()
+
+    def build(**kwargs):
+        _, Graph = random_graph(**kwargs)
+        for i in Graph.nodes():
+            Graph.nodes[i]['name'] = ids[i] if i % 5 else "9606.UNMAPPED{}".format(i)
+        return CSRGraph.from_networkx(Graph), Graph
+    return build
+
+
+def generators():
+    '''
+    Generators of all kinds: wrappers, one dependency shared by two wrappers,
+    and generators listed twice (same cache key, other instance).
+    '''
+    degree = Degree()
+    return [degree, Log10Wrapper(degree)(), NormalizeWrapper(degree)(), ExpectedDegree(directed=True),
+            ClusteringCoefficient(), PageRank(tol=1.0e-10), NormalizeWrapper(PageRank(tol=1.0e-10))(),
+            FeatureSelector(HITS())(columns=1), NeighbouringConductance(range=2),
+            MultiRangeConductance(ranges=[2, 3]), ClusteringCoefficient(), ClusteringCoefficient(weighted=True)]
+
+
+def with_cache(g, cache):
+    g.cache = cache
+    for d in g.dependencies():
+        with_cache(d, cache)
+    return g
+
+
+def make_pipeline(directory, n_jobs=1):
+    cache = FeatureCache(str(directory))
+    return Pipeline(*[with_cache(g, cache) for g in generators()], n_jobs=n_jobs, cache=cache)
+
+
+def old_apply(pipeline, G):
+    '''
+    Features as the former Pipeline.apply built them: every generator
+    applied in turn, its columns written into a frame of all the nodes, and
+    the rows of the genes kept by the former filter_genes.
+    '''
+    n = G.number_of_nodes()
+    features = pd.DataFrame(data=np.zeros((n, pipeline.nfeat)), index=G.node_names,
+                            columns=pipeline.get_generator_names())
+    current = 0
+    for g in pipeline.generators:
+        features.iloc[:, current:(current + g.nfeat)] = np.reshape(g.apply(G), (n, g.nfeat))
+        current += g.nfeat
+    mapping = pd.read_csv(MAPPING_FILE)
+    string_to_symbol = {str(string): str(symbol) for string, symbol in zip(mapping.iloc[:, 2], mapping.iloc[:, 3])}
+    features = features.loc[[gene for gene in features.index.values if gene in string_to_symbol], :]
+    return features.rename(index=string_to_symbol)
+
+
+def test_levels_follow_dependencies(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    levels = pipeline.get_levels()
+    level_of = {id(g): depth for depth, level in enumerate(levels) for g in level}
+    assert sum(len(level) for level in levels) == len(level_of) == len(pipeline.generators) + 2
+    for depth, level in enumerate(levels):
+        for g in level:
+            assert all(level_of[id(d)] < depth for d in g.dependencies())
+            assert depth == 0 or any(level_of[id(d)] == depth - 1 for d in g.dependencies())
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_apply_matches_former_pipeline(tmp_path, gene_graph, n_jobs):
+    G, Graph = gene_graph(n=80, p=0.08)
+    features, node_names = make_pipeline(tmp_path / "pipeline", n_jobs=n_jobs).apply(G)
+    expected = old_apply(make_pipeline(tmp_path / "former"), G)
+    assert len(features) == len(G.node_names) - len(G.node_names) // 5
+    pd.testing.assert_frame_equal(features, expected, check_exact=False, rtol=1.0e-12)
+    assert node_names == list(expected.index)
+
+
+def test_apply_on_a_process_pool_matches_serial(tmp_path, gene_graph):
+    G, Graph = gene_graph(n=80, p=0.08)
+    serial = make_pipeline(tmp_path / "serial").apply(G)[0]
+    pd.testing.assert_frame_equal(make_pipeline(tmp_path / "pool", n_jobs=3).apply(G)[0], serial, check_exact=True)
+
+
+def test_compute_all_materializes_each_generator_once(tmp_path, gene_graph, monkeypatch):
+    G, Graph = gene_graph(n=80, p=0.08)
+    pipeline = make_pipeline(tmp_path)
+    computed = []
+    compute = ClusteringCoefficient.compute
+    monkeypatch.setattr(ClusteringCoefficient, "compute", lambda g, Graph: computed.append(g) or compute(g, Graph))
+    results = pipeline.compute_all(G)
+    generators = pipeline.generators
+    # two unweighted instances, one weighted
+    assert len(computed) == 2
+    assert results[id(generators[4])] is results[id(generators[10])]
+    # the PageRank inside NormalizeWrapper is the one listed: both get the number of iterations of the run
+    inner = generators[6].dependencies()[0]
+    assert results[id(inner)] is results[id(generators[5])]
+    assert generators[5].n_iter == inner.n_iter > 1
+    # the second run comes from the cache
+    del computed[:]
+    second = make_pipeline(tmp_path)
+    again = second.compute_all(G)
+    assert computed == []
+    for g, h in zip(generators, second.generators):
+        np.testing.assert_array_equal(np.asarray(again[id(h)]), np.asarray(results[id(g)]), err_msg=g.get_name())
+
+
+def test_duplicates_get_the_state_of_the_generator_computed(tmp_path, gene_graph):
+    G, Graph = gene_graph(n=80, p=0.08)
+    degree = Degree()
+    first, second = NormalizeWrapper(degree)(), NormalizeWrapper(degree)()
+    pipeline = Pipeline(*[with_cache(g, FeatureCache(str(tmp_path))) for g in (first, second)])
+    pipeline.compute_all(G)
+    np.testing.assert_array_equal(second.mean, first.mean)
+    np.testing.assert_array_equal(second.sd, first.sd)
+
+
+@pytest.mark.parametrize("dtype, order", [(np.float64, 'F'), (np.float32, 'C')])
+def test_assemble_as_array(tmp_path, gene_graph, dtype, order):
+    G, Graph = gene_graph(n=80, p=0.08)
+    pipeline = make_pipeline(tmp_path)
+    frame, node_names = pipeline.apply(G, dtype=dtype, order=order)
+    features, array_names, columns = pipeline.apply(G, dtype=dtype, order=order, as_frame=False)
+    assert features.dtype == dtype and frame.values.dtype == dtype
+    assert features.shape == frame.shape == (len(node_names), pipeline.nfeat)
+    assert features.flags['F_CONTIGUOUS' if order == 'F' else 'C_CONTIGUOUS']
+    np.testing.assert_array_equal(features, frame.values)
+    assert array_names == node_names == list(frame.index)
+    assert columns == list(frame.columns) == pipeline.get_generator_names()
+    # the columns of each generator, in the order of the generators
+    expected = []
+    for g in pipeline.generators:
+        expected.extend(g.get_feature_names())
+    assert columns == expected
+
+
+def test_update_all_matches_compute_all(tmp_path, gene_graph, random_diff):
+    G, Graph = gene_graph(n=80, p=0.08)
+    diff, H = random_diff(Graph, n_changes=4)
+    new_graph = G.apply_diff(diff)
+    pipeline = make_pipeline(tmp_path / "update")
+    pipeline.compute_all(G)
+    updated = pipeline.update_all(G, diff, new_graph)
+    fresh = make_pipeline(tmp_path / "fresh")
+    expected = fresh.compute_all(new_graph)
+    for g, h in zip(pipeline.generators, fresh.generators):
+        # PageRank and HITS are warm-started from the scores on G
+        np.testing.assert_allclose(np.reshape(updated[id(g)], (-1, g.nfeat)), np.reshape(expected[id(h)], (-1, h.nfeat)),
+                                   rtol=1.0e-6, atol=1.0e-8, err_msg=g.get_name())
+    frame, _ = pipeline.update(G, diff, new_graph=new_graph)
+    pd.testing.assert_frame_equal(frame, fresh.apply(new_graph)[0], check_exact=False, rtol=1.0e-6, atol=1.0e-8)
+
+
+def test_sweep_all_matches_apply_at_each_threshold(tmp_path, gene_graph, monkeypatch):
+    G, Graph = gene_graph(n=80, p=0.12)
+    thresholds = [700, 300, 500]
+    pipeline = make_pipeline(tmp_path / "sweep")
+    puts = []
+    put = FeatureCache.put
+    monkeypatch.setattr(FeatureCache, "put", lambda cache, key, *args, **kwargs: puts.append(key) or
+                        put(cache, key, *args, **kwargs))
+    swept = pipeline.sweep_all(G, thresholds)
+    # each result is stored once
+    assert len(puts) == len(set(puts))
+    for t, threshold in enumerate(thresholds):
+        fresh = make_pipeline(tmp_path / "apply{}".format(threshold))
+        expected = fresh.compute_all(G.filter(threshold))
+        # applied with the cache of the sweep, inexact sweeps are not taken for results of compute
+        shared = make_pipeline(tmp_path / "sweep")
+        applied = shared.compute_all(G.filter(threshold))
+        for g, h, k in zip(pipeline.generators, fresh.generators, shared.generators):
+            result, reference = np.reshape(swept[id(g)][t], (-1, g.nfeat)), np.reshape(expected[id(h)], (-1, h.nfeat))
+            np.testing.assert_array_equal(np.reshape(applied[id(k)], (-1, k.nfeat)), reference, err_msg=g.get_name())
+            if g.describe_sweep() != g.describe():
+                # warm-started, or weighted triangles summed in another order
+                assert any(isinstance(d, PageRank) for d in [g] + g.dependencies()) or getattr(g, 'weighted', False)
+                np.testing.assert_allclose(result, reference, rtol=1.0e-6, atol=1.0e-8, err_msg=g.get_name())
+            else:
+                np.testing.assert_array_equal(result, reference, err_msg=g.get_name())
+    # a second sweep reads everything from the cache
+    del puts[:]
+    second = make_pipeline(tmp_path / "sweep")
+    again = second.sweep_all(G, thresholds)
+    assert puts == []
+    for g, h in zip(pipeline.generators, second.generators):
+        for result, cached in zip(swept[id(g)], again[id(h)]):
+            np.testing.assert_array_equal(np.asarray(cached), np.asarray(result), err_msg=g.get_name())
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from common.parallel import get_shared, parallel_map
+from common.results import ResultsStore, render
+
+
+def histograms(seed):
+    rng = np.random.RandomState(seed)
+    return dict(bins=np.linspace(0, 1, 6), marked=rng.rand(5), unmarked=rng.rand(5))
+
+
+def _add(i):
+    store = get_shared()['store']
+    store.add("record{}".format(i), "distribution" if i % 2 else "metrics", histograms(i), title=str(i),
+              plot_file=os.path.join(store.directory, "plot{}.png".format(i)))
+
+
+def test_records_added_by_concurrent_processes_are_all_kept(tmp_path):
+    store = ResultsStore(str(tmp_path / "results"))
+    parallel_map(_add, list(range(24)), n_jobs=4, shared=dict(store=store))
+    assert sorted(store.names()) == sorted("record{}".format(i) for i in range(24))
+    assert store.names("distribution") == sorted("record{}".format(i) for i in range(1, 24, 2))
+    for i in (0, 7):
+        entry, arrays = store.load("record{}".format(i))
+        assert entry['title'] == str(i) and entry['kind'] == ("distribution" if i % 2 else "metrics")
+        for key, value in histograms(i).items():
+            np.testing.assert_array_equal(arrays[key], value)
+    assert not [name for name in os.listdir(store.directory) if name.endswith(".tmp")]
+
+
+def test_adding_a_record_again_replaces_it(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    store.add("record", "metrics", dict(fpr=np.zeros(2)), title="first", plot_file="first.png")
+    store.add("record", "distribution", histograms(0), title="second", plot_file=str(tmp_path / "second.png"))
+    assert store.names() == ["record"]
+    assert store.load("record")[0]['title'] == "second"
+    render(store)
+    assert os.path.exists(str(tmp_path / "second.png"))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from common.statistics import benjamini_hochberg, bonferroni, hypergeometric, mannwhitney, rank_columns
+
+
+@pytest.fixture
+def data():
+    '''
+    Features with ties and nan (as degrees and unreachable balls), and
+    random groups of rows.
+    '''
+    rng = np.random.RandomState(0)
+    X = np.column_stack([rng.rand(200), rng.randint(0, 8, 200), rng.randint(0, 3, 200).astype(float)])
+    X[rng.rand(*X.shape) < 0.1] = np.nan
+    groups = rng.rand(200, 4) < [0.05, 0.1, 0.3, 0.5]
+    return X, groups
+
+
+def test_rank_columns_matches_scipy(data):
+    X, groups = data
+    ranks, ties = rank_columns(X)
+    for j in range(X.shape[1]):
+        valid = ~np.isnan(X[:, j])
+        np.testing.assert_allclose(ranks[valid, j], stats.rankdata(X[valid, j]))
+        assert np.isnan(ranks[~valid, j]).all()
+        _, counts = np.unique(X[valid, j], return_counts=True)
+        assert ties[j] == (counts ** 3 - counts).sum()
+
+
+def test_mannwhitney_matches_scipy(data):
+    X, groups = data
+    U, pvalues = mannwhitney(X, groups)
+    for j in range(X.shape[1]):
+        for k in range(groups.shape[1]):
+            valid = ~np.isnan(X[:, j])
+            expected = stats.mannwhitneyu(X[valid & ~groups[:, k], j], X[valid & groups[:, k], j],
+                                          method='asymptotic', use_continuity=True)
+            assert U[j, k] == pytest.approx(expected.statistic)
+            assert pvalues[j, k] == pytest.approx(expected.pvalue, rel=1.0e-9)
+
+
+def test_hypergeometric_matches_scipy(data):
+    X, groups = data
+    tops = (10, 50)
+    pvalues = hypergeometric(X[:, :1], groups, tops=tops)
+    # the first column has no ties, so the top rows are those of the largest values
+    valid = ~np.isnan(X[:, 0])
+    order = np.argsort(-X[valid, 0])
+    members = groups[valid]
+    for i, N in enumerate(tops):
+        for k in range(groups.shape[1]):
+            expected = stats.hypergeom.sf(members[order[:N], k].sum(), valid.sum(), members[:, k].sum(), N)
+            assert pvalues[i, 0, k] == pytest.approx(expected, rel=1.0e-9)
+
+
+def test_corrections():
+    pvalues = np.random.RandomState(1).rand(5, 7) ** 3
+    pvalues[0, 2] = np.nan
+    valid = ~np.isnan(pvalues)
+    adjusted = benjamini_hochberg(pvalues)
+    np.testing.assert_allclose(adjusted[valid], stats.false_discovery_control(pvalues[valid], method='bh'))
+    assert np.isnan(adjusted[0, 2])
+    np.testing.assert_allclose(bonferroni(pvalues)[valid], np.minimum(1, pvalues[valid] * valid.sum()))
@@ -0,0 +1,98 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from common.cache import FeatureCache
+from common.clustering import clustering, update_clustering
+from common.conductance import ball_statistics, neighbouring_conductance, update_conductance
+from common.feature_generators import ClusteringCoefficient, Degree, ExpectedDegree, MultiRangeConductance, \
+    NeighbouringConductance, PageRank
+from common.graph import CSRGraph, graph_fingerprint
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_apply_diff_matches_networkx(random_graph, random_diff, directed):
+    G, Graph = random_graph(directed=directed)
+    diff, H = random_diff(Graph)
+    new_graph = G.apply_diff(diff)
+    assert sorted(new_graph.to_networkx().edges(data='weight')) == sorted(H.edges(data='weight'))
+    np.testing.assert_array_equal(new_graph.indptr, CSRGraph.from_networkx(H).indptr)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_update_conductance_matches_recompute(random_graph, random_diff, directed):
+    G, Graph = random_graph(n=80, p=0.05, directed=directed)
+    ranges = [1, 2, 3]
+    diff, H = random_diff(Graph, n_changes=3)
+    new_graph = G.apply_diff(diff)
+    expected = neighbouring_conductance(new_graph, ranges)
+    result = neighbouring_conductance(G, ranges)
+    updated, statistics = update_conductance(G, new_graph, diff, result, ranges, statistics=ball_statistics(G, ranges))
+    np.testing.assert_allclose(updated, expected, atol=1.0e-12)
+    for a, b in zip(statistics, ball_statistics(new_graph, ranges)):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_allclose(update_conductance(G, new_graph, diff, result, ranges)[0], expected, atol=1.0e-12)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("weighted", [False, True])
+def test_update_clustering_matches_recompute(random_graph, random_diff, directed, weighted):
+    G, Graph = random_graph(n=70, p=0.12, directed=directed)
+    diff, H = random_diff(Graph)
+    new_graph = G.apply_diff(diff)
+    updated = update_clustering(G, new_graph, diff, clustering(G, weighted=weighted), weighted=weighted)
+    expected = nx.clustering(H, weight='weight' if weighted else None)
+    np.testing.assert_allclose(updated, [expected[i] for i in range(G.number_of_nodes())], atol=1.0e-12)
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("make", [lambda: Degree(), lambda: Degree(directed=True),
+                                  lambda: ExpectedDegree(directed=True), lambda: ClusteringCoefficient(weighted=True),
+                                  lambda: NeighbouringConductance(range=3), lambda: MultiRangeConductance(ranges=[2, 3]),
+                                  lambda: PageRank(tol=1.0e-10)])
+def test_apply_update_matches_compute(tmp_path, random_graph, random_diff, directed, make):
+    G, Graph = random_graph(n=70, p=0.06, directed=directed)
+    diff, H = random_diff(Graph, n_changes=4)
+    new_graph = G.apply_diff(diff)
+    g = make()
+    g.cache = FeatureCache(str(tmp_path))
+    g.apply(G, recompute=True, dump=True)
+    # a fresh generator, starting from what the first one cached
+    fresh = make()
+    fresh.cache = g.cache
+    updated = fresh.apply_update(G, diff, new_graph=new_graph, dump=True)
+    expected = make().compute(new_graph)
+    np.testing.assert_allclose(np.reshape(updated, np.shape(expected)), expected, atol=1.0e-8)
+    np.testing.assert_allclose(np.reshape(fresh.load_from_cache(new_graph), np.shape(expected)), expected, atol=1.0e-8)
+
+
+def test_reweighting_carries_unweighted_results_over(tmp_path, random_graph, random_diff):
+    G, Graph = random_graph()
+    diff, H = random_diff(Graph, added=False, removed=False)
+    g = NeighbouringConductance(range=2)
+    g.cache = FeatureCache(str(tmp_path))
+    result = g.apply(G, recompute=True, dump=True)
+    assert not g.changed_by(diff)
+    assert ClusteringCoefficient(weighted=True).changed_by(diff)
+    np.testing.assert_array_equal(g.apply_update(G, diff, dump=True), result)
+    np.testing.assert_array_equal(g.load_from_cache(G.apply_diff(diff)), result)
+
+
+def test_reweighting_carries_the_balls_over(tmp_path, random_graph, random_diff):
+    G, Graph = random_graph()
+    diff, H = random_diff(Graph, added=False, removed=False)
+    new_graph = G.apply_diff(diff)
+    g = MultiRangeConductance(ranges=[2, 3])
+    g.cache = FeatureCache(str(tmp_path))
+    g.apply(G, recompute=True, dump=True)
+    # from the balls kept by g, and from those cached for a fresh generator
+    for h in (g, MultiRangeConductance(ranges=[2, 3])):
+        h.cache = g.cache
+        h.apply_update(G, diff, new_graph=new_graph, dump=True)
+        assert h.balls[0] == graph_fingerprint(new_graph)
+        h.update(G, new_graph, diff, h.load_from_cache(G))
+        assert h.balls[0] == graph_fingerprint(new_graph)
+    fresh = MultiRangeConductance(ranges=[2, 3])
+    fresh.cache = g.cache
+    for a, b in zip(fresh.load_balls(new_graph), ball_statistics(new_graph, [2, 3])):
+        np.testing.assert_array_equal(a, b)
@@ -1,11 +1,13 @@
+import os
 import numpy as np
 import pandas as pd
 import gseapy as gp
 import math
-import matplotlib.pyplot as plt
 import scipy.stats as ss
 
 from scipy.stats import hypergeom
+from common.results import plot_distribution
+from common.statistics import CORRECTIONS, hypergeometric, mannwhitney
 from validation_import import get_ref_genes
 
 
@@ -14,25 +16,25 @@ def get_genes_scores(features, feature_name, ref_genes):
     feature = features.loc[:,feature_name].copy()
     feature = feature.loc[np.logical_not(feature.isnull())]
     indices = np.argsort(feature.values)[::-1]
-    sample_genes = list(feature[indices].index)
-    sample_scores = list(feature[indices].values)
-    ref_scores = feature[ref_genes].values
-    non_ref_scores = feature[list(set(features.index) - set(ref_genes))].values
+    sample_genes = list(feature.iloc[indices].index)
+    sample_scores = list(feature.iloc[indices].values)
+    is_ref = feature.index.isin(list(ref_genes))
+    ref_scores = feature[is_ref].values
+    non_ref_scores = feature[~is_ref].values
     ref_scores = list(ref_scores[np.isnan(ref_scores) == False])
     non_ref_scores = list(non_ref_scores[~np.isnan(non_ref_scores)])
     return sample_genes, sample_scores, non_ref_scores, ref_scores
 
-def compare_feature_distribution_mannwhitney(features, feature_name, ref_genes, output_file=None, title="Feature distribution"):
-
+def compare_feature_distribution_mannwhitney(features, feature_name, ref_genes, output_file=None, title="Feature distribution",
+                                             plot=True, store=None, name=None):
+    """
+    Mann-Whitney p-value of the feature between reference and other genes.
+    The histograms of both groups go to store (a ResultsStore) under name
+    when given, and are plotted to output_file unless plot is False.
+    """
     sample_genes, sample_scores, non_ref_scores, ref_scores = get_genes_scores(features, feature_name, ref_genes)
-
-    bins = np.linspace(np.min(non_ref_scores), np.max(sample_scores), 100)
-    plt.hist(non_ref_scores, bins, alpha=0.5, label='unmarked', normed=True)
-    plt.hist(ref_scores, bins, alpha=0.5, label='marked', normed=True)
-    plt.title(title)
-    plt.legend()
-    plt.savefig(output_file)
-    plt.close()
+    _feature_histograms(np.asarray(features.loc[:, feature_name], dtype=np.float64),
+                        features.index.isin(list(ref_genes)), output_file, title, plot, store, name=name)
     pvalue = ss.mannwhitneyu(non_ref_scores, ref_scores).pvalue
     return pvalue
 
@@ -52,28 +54,68 @@ def compare_feature_distribution_hypergeom(features, feature_name, ref_genes, N=
     return pvalue
 
 
-def compute_correlations(features, sources):
-
+def compute_correlations(features, sources, plot=True, store=None, tops=(100,), correction="fdr_bh",
+                         pvalues_file="output/pvalues"):
+    """
+    Mann-Whitney and top-N hypergeometric p-values of every feature for every
+    source, all computed at once from a single ranking of the feature columns
+    (see common.statistics). The hypergeometric rows are named
+    <source>_hypergeom for the top 100 genes and <source>_hypergeom_top<N>
+    for the other values of tops. With correction ("fdr_bh" or
+    "bonferroni"), each test (and top N) is also corrected over all features
+    and sources, in rows suffixed with _adjusted.
+    Feature histograms are stored and plotted as in
+    compare_feature_distribution_mannwhitney, and the p-values pickled to
+    pvalues_file.
+    """
     print ("Computing correlations/pvalues for all features for different sources\n")
     feature_names = list(features.columns)
-    pvalues = pd.DataFrame(data=np.zeros((6,len(feature_names))), index=["cancer_Mann–Whitney", "drugbank_Mann–Whitney",
-                                                                         "mendelian_Mann–Whitney", "cancer_hypergeom",
-                                                                         "drugbank_hypergeom", "mendelian_hypergeom"],
+    X = np.asarray(features, dtype=np.float64)
+    groups = np.column_stack([features.index.isin(list(get_ref_genes(source=source))) for source in sources])
+    _, pvalues_MW = mannwhitney(X, groups)
+    pvalues_hypergeom = hypergeometric(X, groups, tops)
+
+    tests = [("Mann–Whitney", pvalues_MW)]
+    for N, pvalues_N in zip(tops, pvalues_hypergeom):
+        tests.append(("hypergeom" if N == 100 else "hypergeom_top%d"%N, pvalues_N))
+    if correction is not None:
+        tests += [(test + "_adjusted", CORRECTIONS[correction](pvalues_test)) for test, pvalues_test in tests]
+    pvalues = pd.DataFrame(data=np.vstack([pvalues_test.T for _, pvalues_test in tests]),
+                           index=["%s_%s"%(source, test) for test, _ in tests for source in sources],
                            columns = feature_names)
-    for source in sources:
+
+    # the top N reported with the Mann-Whitney p-value
+    top = list(tops).index(100) if 100 in tops else 0
+    for i, source in enumerate(sources):
         print("Source = %s"%source)
-        ref_genes = get_ref_genes(source=source)
-        for feature_name in feature_names:
-            pvalue_MW = compare_feature_distribution_mannwhitney(features, feature_name, ref_genes, 'output/' + feature_name +
-                                                                 '_distribution_comparison_{}.png'.format(source),
-                                                                 title="{},{}".format(feature_name, source))
-            pvalue_hypergeom = compare_feature_distribution_hypergeom(features, feature_name, ref_genes)
-            pvalues.loc["%s_Mann–Whitney"%source:,feature_name] = pvalue_MW
-            pvalues.loc["%s_hypergeom"%source:,feature_name] = pvalue_hypergeom
-            print ("pvalue Mann-Whitney = %.2g \t pvalue hypergeometric = %.2g \t(%s)"%(pvalue_MW, pvalue_hypergeom,
-                                                                                        feature_name))
+        for j, feature_name in enumerate(feature_names):
+            if plot or store is not None:
+                _feature_histograms(X[:, j], groups[:, i], 'output/' + feature_name +
+                                    '_distribution_comparison_{}.png'.format(source),
+                                    "{},{}".format(feature_name, source), plot, store)
+            print ("pvalue Mann-Whitney = %.2g \t pvalue hypergeometric (top %d) = %.2g \t(%s)"%(
+                pvalues_MW[j, i], tops[top], pvalues_hypergeom[top, j, i], feature_name))
         print("############\n")
-    print ("Saving pvalues to output/pvalues")
-    pvalues.to_pickle("output/pvalues")
+    print ("Saving pvalues to %s"%pvalues_file)
+    pvalues.to_pickle(pvalues_file)
 
     return pvalues
+
+
+def _feature_histograms(values, is_ref, output_file, title, plot, store, name=None):
+    """
+    Histograms of values for the reference genes (is_ref) and the other
+    genes, nan left out, stored under name (by default the name of
+    output_file) and plotted to output_file.
+    """
+    valid = ~np.isnan(values)
+    non_ref_scores = values[valid & ~is_ref]
+    ref_scores = values[valid & is_ref]
+    bins = np.linspace(np.min(non_ref_scores), np.max(values[valid]), 100)
+    histograms = dict(bins=bins, unmarked=np.histogram(non_ref_scores, bins, density=True)[0],
+                      marked=np.histogram(ref_scores, bins, density=True)[0])
+    if store is not None:
+        store.add(name or os.path.splitext(os.path.basename(output_file))[0], "distribution", histograms,
+                  title=title, plot_file=output_file)
+    if plot:
+        plot_distribution(histograms, title, output_file)
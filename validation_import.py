@@ -1,8 +1,17 @@
+import os
 import numpy as np
 import pandas as pd
 import gseapy as gp
 import math
 
+REF_CACHE = "data/cache/ref_genes.pkl"
+SOURCES = ("cancer", "mendelian", "drugbank")
+DRUGBANK_MOLECULE_TYPES = ("carrier", "enzyme", "target", "transporter")
+DRUGBANK_SUBSETS = ("all", "approved")
+
+_ref_genes = dict()
+_ref_caches = dict()
+
 
 def get_cancer(filename="validation_datasets/cancer_gene_census.csv"):
     """
@@ -12,13 +21,8 @@ def get_cancer(filename="validation_datasets/cancer_gene_census.csv"):
     cancer_gene_census = pd.read_csv(filename)
     gene_symbols = cancer_gene_census.loc[:,"Gene Symbol"].values.tolist()
     gene_names = cancer_gene_census.loc[:,"Name"].values.tolist()
-    gene_string = []
-    list_of_synonyms = cancer_gene_census.loc[:,"Synonyms"]
-    for synonyms in list_of_synonyms:
-        if str(synonyms) != 'nan':        
-            for synonym in synonyms.split(','):
-                if synonym[:3] == "ENS":
-                    gene_string.append(synonym)
+    synonyms = cancer_gene_census.loc[:,"Synonyms"].dropna().str.split(',').explode()
+    gene_string = synonyms[synonyms.str.startswith("ENS")].tolist()
     data = {"gene_symbols":gene_symbols, "gene_names":gene_names, "gene_string":gene_string}
     
     return data
@@ -29,17 +33,12 @@ def get_mendelian(filename="validation_datasets/mim2gene.txt"):
     Extract a gene list from Online Mendelian Inheritance in Man (OMIM) (omim.org)
 
     """
-    gene_entrez = []
-    gene_symbols = []
-    gene_string = []
-    with open(filename) as f:
-        for line in f:
-            if len(line.split('\t'))>1:
-                if line.split('\t')[1] == "gene":
-                    if len(line.split('\t'))>2:
-                        gene_entrez.append(line.split('\t')[2])
-                        gene_symbols.append(line.split('\t')[3])
-                        gene_string.append(line.split('\t')[4])
+    mim2gene = pd.read_csv(filename, sep='\t', comment='#', header=None, dtype=str, keep_default_na=False,
+                           names=["mim", "type", "entrez", "symbol", "ensembl"])
+    genes = mim2gene[mim2gene["type"] == "gene"]
+    gene_entrez = genes["entrez"].tolist()
+    gene_symbols = genes["symbol"].tolist()
+    gene_string = genes["ensembl"].tolist()
     data = {"gene_symbols":gene_symbols, "gene_entrez":gene_entrez, "gene_string":gene_string}
     
     return data
@@ -54,7 +53,7 @@ def get_drugbank(molecule_type="target", subset="all"):
         -subset: "all" or "approved"
         
     """
-    data = pd.read_csv("validation_datasets/drugbank_%s_%s_polypeptide_ids.csv/all.csv"%(subset, molecule_type))
+    data = pd.read_csv(ref_genes_file("drugbank", molecule_type, subset))
     data = data[data["Species"]=="Human"]
     gene_symbols = data["Gene Name"].values.tolist()
     protein_names = data["Name"].values.tolist()
@@ -64,16 +63,86 @@ def get_drugbank(molecule_type="target", subset="all"):
     return data
 
 
-def get_ref_genes(source="cancer", molecule_type="target", subset="all"):
-    
+def ref_genes_file(source="cancer", molecule_type="target", subset="all"):
     if source=="cancer":
-        gene_ref = get_cancer()["gene_symbols"]
+        return "validation_datasets/cancer_gene_census.csv"
     if source=="mendelian":
-        gene_ref = get_mendelian()["gene_symbols"]
+        return "validation_datasets/mim2gene.txt"
     if source=="drugbank":
-        gene_ref = get_drugbank(molecule_type=molecule_type, subset=subset)["gene_symbols"]
-    
-    return gene_ref
-        
+        return "validation_datasets/drugbank_%s_%s_polypeptide_ids.csv/all.csv"%(subset, molecule_type)
+    raise ValueError("Unknown reference source {}".format(source))
+
+
+def load_ref_genes(source="cancer", molecule_type="target", subset="all", cache_file=None):
+    """
+    Gene symbols of a reference source, as a frozenset. Each source is parsed
+    once per process; with cache_file (e.g. REF_CACHE) the parsed sets are
+    also kept on disk until the source file changes.
+    """
+    key = source if source != "drugbank" else "drugbank_%s_%s"%(subset, molecule_type)
+    filename = ref_genes_file(source, molecule_type, subset)
+    stamp = (os.path.getsize(filename), os.path.getmtime(filename))
+    if key in _ref_genes and _ref_genes[key][0] == stamp:
+        return _ref_genes[key][1]
+    cached = _read_ref_cache(cache_file)
+    if key in cached and cached[key][0] == stamp:
+        genes = cached[key][1]
+    else:
+        if source=="cancer":
+            gene_ref = get_cancer()["gene_symbols"]
+        elif source=="mendelian":
+            gene_ref = get_mendelian()["gene_symbols"]
+        else:
+            gene_ref = get_drugbank(molecule_type=molecule_type, subset=subset)["gene_symbols"]
+        genes = frozenset(gene for gene in gene_ref if isinstance(gene, str) and gene)
+        if cache_file is not None:
+            cached[key] = (stamp, genes)
+            if not os.path.exists(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            pd.to_pickle(cached, cache_file)
+    _ref_genes[key] = (stamp, genes)
+    return genes
 
 
+def _read_ref_cache(cache_file):
+    if cache_file is None or not os.path.exists(cache_file):
+        return dict()
+    mtime = os.path.getmtime(cache_file)
+    if _ref_caches.get(cache_file, (None,))[0] != mtime:
+        try:
+            _ref_caches[cache_file] = (mtime, pd.read_pickle(cache_file))
+        except Exception as e:
+            print("Reference gene cache %s is unreadable, rebuilding it: %r"%(cache_file, e))
+            return dict()
+    return _ref_caches[cache_file][1]
+
+
+def get_ref_genes(source="cancer", molecule_type="target", subset="all", as_array=False, cache_file=None):
+    """
+    Gene symbols of a reference source, as a frozenset or, with as_array, a
+    sorted array.
+    """
+    genes = load_ref_genes(source, molecule_type, subset, cache_file)
+    if as_array:
+        return np.array(sorted(genes), dtype=object)
+    return genes
+
+
+def get_all_ref_genes(sources=SOURCES, molecule_types=("target",), subsets=("all",), as_array=False,
+                      cache_file=None):
+    """
+    Gene symbols of several reference sources at once, by name: the source
+    name for cancer, mendelian and the default drugbank targets, and
+    drugbank_<subset>_<molecule_type> for the other drugbank lists.
+    """
+    ref_genes = dict()
+    for source in sources:
+        if source != "drugbank":
+            ref_genes[source] = get_ref_genes(source, as_array=as_array, cache_file=cache_file)
+            continue
+        for subset in subsets:
+            for molecule_type in molecule_types:
+                name = "drugbank" if (molecule_type, subset) == ("target", "all") else "drugbank_%s_%s"%(subset, molecule_type)
+                ref_genes[name] = get_ref_genes(source, molecule_type, subset, as_array=as_array,
+                                                cache_file=cache_file)
+    return ref_genes